@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+Benchmark every phase of the RepoMap pipeline on a synthetic repository.
+
+Measures file discovery, cold and warm tag extraction, graph construction,
+PageRank, tree rendering and token fitting separately, reporting wall time,
+throughput, peak and retained traced memory per phase and the approximate
+RepoMap cache sizes as JSON so runs can be compared across versions.
+
+Examples:
+  python benchmarks/bench_pipeline.py --files 2000 --languages python:0.7,javascript:0.3
+  python benchmarks/bench_pipeline.py --files 500 --output before.json
+  python benchmarks/bench_pipeline.py --files 500 --compare before.json
+  python benchmarks/bench_pipeline.py --files 3000 --min-skeleton-speedup 3
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from synthetic_repo import SyntheticRepoSpec, generate_repo, language_counts, parse_language_mix
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+            capture_output=True, text=True, timeout=10,
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+class PhaseTimer:
+    """Runs pipeline phases and records time, throughput and peak memory."""
+
+    def __init__(self, trace_memory: bool = True):
+        self.trace_memory = trace_memory
+        self.phases: Dict[str, Dict[str, Any]] = {}
+
+    def run(self, name: str, func: Callable[[], Any], items: Optional[int] = None) -> Any:
+        if self.trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        cpu_start = time.process_time()
+        result = func()
+        seconds = time.perf_counter() - start
+        cpu_seconds = time.process_time() - cpu_start
+        phase = {"seconds": round(seconds, 6), "cpu_seconds": round(cpu_seconds, 6)}
+        if self.trace_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            phase["peak_bytes"] = peak
+            # Tracing starts with the phase, so this is what the phase still holds
+            phase["retained_bytes"] = current
+        if items is None and hasattr(result, "__len__"):
+            items = len(result)
+        if items is not None:
+            phase["items"] = items
+            phase["items_per_second"] = round(items / seconds, 1) if seconds > 0 else None
+        self.phases[name] = phase
+        print(f"  {name:<16} {seconds:9.3f}s  items={items}", file=sys.stderr)
+        return result
+
+
+def run_benchmark(args) -> Dict[str, Any]:
+    from discovery import find_src_files
+    from repomap_class import RepoMap
+    from utils import count_tokens
+
+    if args.approx_tokens:
+        token_counter = lambda text: len(text) // 4
+    else:
+        token_counter = lambda text: count_tokens(text, "gpt-4")
+    handlers = {'info': lambda msg: None, 'warning': lambda msg: None, 'error': lambda msg: None}
+
+    spec = SyntheticRepoSpec(
+        num_files=args.files,
+        languages=parse_language_mix(args.languages),
+        defs_per_file=args.defs_per_file,
+        refs_per_def=args.refs_per_def,
+        zipf_exponent=args.zipf,
+        seed=args.seed,
+    )
+
+    repo_dir = args.repo_dir or tempfile.mkdtemp(prefix="repomap-bench-")
+    timer = PhaseTimer(trace_memory=not args.no_trace_memory)
+    try:
+        print(f"Benchmarking in {repo_dir}", file=sys.stderr)
+        paths = timer.run("generate", lambda: generate_repo(repo_dir, spec))
+
+        files = timer.run("find_src_files", lambda: find_src_files(repo_dir))
+
+        def get_all_tags(repo_map):
+            return {f: repo_map.get_tags(f, repo_map.get_rel_fname(f)) for f in files}
+
+        rng = random.Random(args.seed)
+        chat_files = rng.sample(files, min(args.chat_files, len(files)))
+
+        # Time-to-first-ranking of a cold checkout with skeleton indexing; the
+        # tags it parses are dropped again so that get_tags_cold stays cold
+        skeleton_map = RepoMap(root=repo_dir, token_counter_func=token_counter,
+                               output_handler_funcs=dict(handlers), skeleton_index=True)
+        timer.run(
+            "skeleton_ranked_tags_cold",
+            lambda: skeleton_map.get_ranked_tags(chat_files, files, max_map_tokens=args.map_tokens),
+            items=len(files),
+        )
+        skeleton_map.TAGS_CACHE.clear()
+
+        cold_map = RepoMap(root=repo_dir, token_counter_func=token_counter, output_handler_funcs=dict(handlers))
+        timer.run("get_tags_cold", lambda: get_all_tags(cold_map), items=len(files))
+
+        repo_map = RepoMap(root=repo_dir, token_counter_func=token_counter, output_handler_funcs=dict(handlers))
+        all_tags = timer.run("get_tags_warm", lambda: get_all_tags(repo_map), items=len(files))
+
+        defines = defaultdict(set)
+        references = defaultdict(set)
+        num_tags = 0
+        for fname, tags in all_tags.items():
+            rel_fname = repo_map.get_rel_fname(fname)
+            for tag in tags:
+                num_tags += 1
+                if tag.kind == "def":
+                    defines[tag.name].add(rel_fname)
+                elif tag.kind == "ref":
+                    references[tag.name].add(rel_fname)
+        rel_fnames = [repo_map.get_rel_fname(f) for f in files]
+
+        G = timer.run(
+            "graph",
+            lambda: repo_map.build_reference_graph(rel_fnames, defines, references),
+            items=num_tags,
+        )
+
+        personalization = {repo_map.get_rel_fname(f): 100.0 for f in chat_files}
+        timer.run("pagerank", lambda: repo_map.rank_files(G, personalization), items=G.number_of_edges())
+
+        ranked_tags, _ = timer.run(
+            "get_ranked_tags",
+            lambda: repo_map.get_ranked_tags(chat_files, files),
+            items=len(files),
+        )
+        chat_rel_fnames = set(personalization)
+
+        render_tags = ranked_tags[:args.render_tags]
+        timer.run("to_tree", lambda: repo_map.to_tree(render_tags, chat_rel_fnames), items=len(render_tags))
+
+        # Token fitting renders repeatedly; start from cold tree contexts
+        repo_map.tree_context_cache.clear()
+        timer.run(
+            "token_fitting",
+            lambda: repo_map.fit_tags_to_budget(ranked_tags, chat_rel_fnames, args.map_tokens),
+            items=len(ranked_tags),
+        )
+
+        return {
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "params": {
+                "files": args.files,
+                "languages": spec.languages,
+                "defs_per_file": spec.defs_per_file,
+                "refs_per_def": spec.refs_per_def,
+                "zipf_exponent": spec.zipf_exponent,
+                "seed": spec.seed,
+                "chat_files": len(chat_files),
+                "map_tokens": args.map_tokens,
+                "render_tags": args.render_tags,
+                "approx_tokens": args.approx_tokens,
+                "trace_memory": timer.trace_memory,
+            },
+            "repo": {
+                "files": len(files),
+                "files_per_extension": language_counts(paths),
+                "tags": num_tags,
+                "graph_nodes": G.number_of_nodes(),
+                "graph_edges": G.number_of_edges(),
+                "ranked_tags": len(ranked_tags),
+            },
+            "phases": timer.phases,
+            "skeleton_speedup": skeleton_speedup(timer.phases),
+            "cache_sizes": repo_map.cache_sizes(),
+            "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        }
+    finally:
+        if not args.repo_dir and not args.keep:
+            shutil.rmtree(repo_dir, ignore_errors=True)
+
+
+def skeleton_speedup(phases: Dict[str, Dict[str, Any]]) -> Optional[float]:
+    """How many times faster a cold skeleton ranking is than cold full tag extraction."""
+    skeleton = phases["skeleton_ranked_tags_cold"]["seconds"]
+    if skeleton <= 0:
+        return None
+    return round(phases["get_tags_cold"]["seconds"] / skeleton, 2)
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any]):
+    """Print per-phase time ratios of the current run against a baseline run."""
+    print(f"\nPhase timings vs baseline {baseline.get('revision')} ({baseline.get('timestamp')}):", file=sys.stderr)
+    for name, phase in current["phases"].items():
+        before = baseline.get("phases", {}).get(name)
+        if not before or not before.get("seconds"):
+            continue
+        ratio = phase["seconds"] / before["seconds"]
+        print(f"  {name:<16} {before['seconds']:9.3f}s -> {phase['seconds']:9.3f}s  x{ratio:.2f}", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark RepoMap pipeline phases on a synthetic repository.",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=__doc__.split("Examples:")[1],
+    )
+    parser.add_argument("--files", type=int, default=1000, help="Number of files to generate (default: 1000)")
+    parser.add_argument("--languages", default="python", help="Language mix, e.g. python:0.6,javascript:0.4 (default: python)")
+    parser.add_argument("--defs-per-file", type=int, default=8, help="Definitions per file (default: 8)")
+    parser.add_argument("--refs-per-def", type=int, default=3, help="References per definition (default: 3)")
+    parser.add_argument("--zipf", type=float, default=1.1, help="Power-law exponent of reference targets (default: 1.1)")
+    parser.add_argument("--chat-files", type=int, default=3, help="Number of random chat files for personalization (default: 3)")
+    parser.add_argument("--map-tokens", type=int, default=2048, help="Token budget for the fitting phase (default: 2048)")
+    parser.add_argument("--render-tags", type=int, default=500, help="Ranked tags rendered in the to_tree phase (default: 500)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed (default: 0)")
+    parser.add_argument("--approx-tokens", action="store_true", help="Count tokens as len(text) // 4 instead of using tiktoken")
+    parser.add_argument("--no-trace-memory", action="store_true", help="Skip tracemalloc (faster, but no per-phase peak memory)")
+    parser.add_argument("--repo-dir", help="Generate into (and keep) this directory instead of a temporary one")
+    parser.add_argument("--keep", action="store_true", help="Keep the temporary repository")
+    parser.add_argument("--output", help="Write JSON results to this file instead of stdout")
+    parser.add_argument("--compare", help="Baseline JSON results to compare phase timings against")
+    parser.add_argument("--min-skeleton-speedup", type=float,
+                        help="Exit with status 1 unless a cold skeleton ranking is at least this many times "
+                             "faster than cold full tag extraction")
+    args = parser.parse_args()
+
+    results = run_benchmark(args)
+
+    if args.compare:
+        with open(args.compare, "r") as f:
+            compare(results, json.load(f))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}", file=sys.stderr)
+    else:
+        print(json.dumps(results, indent=2))
+
+    speedup = results["skeleton_speedup"]
+    if args.min_skeleton_speedup is not None and (speedup is None or speedup < args.min_skeleton_speedup):
+        print(f"Skeleton indexing too slow: x{speedup} < x{args.min_skeleton_speedup} over full parsing",
+              file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
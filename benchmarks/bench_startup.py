@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Measure cold import time of the RepoMap entry points and guard a budget.
+
+Every sample runs in a fresh interpreter, so the numbers are what an MCP
+client pays when it spawns the server. The run fails (exit status 1) when
+the median import time of a module exceeds its budget, or when a heavy
+dependency that must be loaded lazily is imported at startup.
+
+Examples:
+  python benchmarks/bench_startup.py
+  python benchmarks/bench_startup.py --runs 10 --budget repomap_class=150
+  python benchmarks/bench_startup.py --output startup.json
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+from typing import Any, Dict, List
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+# Default import-time budgets in milliseconds. The server budget is dominated
+# by fastmcp itself, which has to be loaded to register the tools.
+DEFAULT_BUDGETS_MS = {
+    "utils": 100,
+    "repomap_class": 250,
+    "repomap_server": 3000,
+}
+
+# Dependencies that must not be imported until first use
+LAZY_MODULES = ("networkx", "diskcache", "grep_ast", "tree_sitter", "tiktoken", "numpy", "scipy")
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+print(json.dumps({{"seconds": seconds, "loaded": [m for m in {lazy!r} if m in sys.modules]}}))
+"""
+
+
+def measure_import(module: str, runs: int) -> Dict[str, Any]:
+    """Import module in `runs` fresh interpreters and summarize the timings."""
+    samples: List[float] = []
+    loaded: List[str] = []
+    for _ in range(runs):
+        proc = subprocess.run(
+            [sys.executable, "-c", _PROBE.format(module=module, lazy=LAZY_MODULES)],
+            cwd=REPO_ROOT, capture_output=True, text=True, timeout=120,
+        )
+        if proc.returncode != 0:
+            raise RuntimeError(f"Importing {module} failed:\n{proc.stderr}")
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        samples.append(result["seconds"] * 1000)
+        loaded = result["loaded"]
+    return {
+        "median_ms": round(statistics.median(samples), 1),
+        "min_ms": round(min(samples), 1),
+        "max_ms": round(max(samples), 1),
+        "runs": runs,
+        "eagerly_loaded": loaded,
+    }
+
+
+def parse_budgets(overrides: List[str]) -> Dict[str, float]:
+    """Apply module=milliseconds overrides to the default budgets."""
+    budgets = dict(DEFAULT_BUDGETS_MS)
+    for override in overrides:
+        module, _, value = override.partition("=")
+        if not value:
+            raise ValueError(f"Budget must look like module=milliseconds, got '{override}'")
+        budgets[module.strip()] = float(value)
+    return budgets
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure cold import time of RepoMap modules against a budget.",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=__doc__.split("Examples:")[1],
+    )
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters per module (default: 5)")
+    parser.add_argument("--budget", action="append", default=[], metavar="MODULE=MS",
+                        help="Override or add an import-time budget; may be repeated")
+    parser.add_argument("--output", help="Write JSON results to this file instead of stdout")
+    args = parser.parse_args()
+
+    budgets = parse_budgets(args.budget)
+    results = {}
+    failures = []
+    for module, budget_ms in budgets.items():
+        result = measure_import(module, args.runs)
+        result["budget_ms"] = budget_ms
+        results[module] = result
+        status = "ok"
+        if result["median_ms"] > budget_ms:
+            status = "OVER BUDGET"
+            failures.append(f"{module}: {result['median_ms']} ms > {budget_ms} ms")
+        if result["eagerly_loaded"]:
+            status = "EAGER IMPORTS"
+            failures.append(f"{module}: imports {', '.join(result['eagerly_loaded'])} at startup")
+        print(f"  {module:<16} {result['median_ms']:8.1f} ms  (budget {budget_ms:.0f} ms)  {status}", file=sys.stderr)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}", file=sys.stderr)
+    else:
+        print(json.dumps(results, indent=2))
+
+    if failures:
+        print("Startup budget exceeded:\n  " + "\n  ".join(failures), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""
+Synthetic repository generator for RepoMap benchmarks.
+
+Generates source trees of configurable size and language mix. Every file
+defines a few symbols and references symbols chosen from a Zipf (power-law)
+distribution over all definitions, so a few "core" symbols are referenced
+from everywhere and most are referenced rarely, as in real code bases.
+"""
+
+import os
+import random
+from dataclasses import dataclass, field
+from itertools import accumulate
+from typing import Dict, List
+
+EXTENSIONS = {
+    "python": ".py",
+    "javascript": ".js",
+    "typescript": ".ts",
+    "go": ".go",
+    "java": ".java",
+    "rust": ".rs",
+    "ruby": ".rb",
+    "c": ".c",
+}
+
+
+def _python(module: str, defs: List[str], refs: List[List[str]]) -> str:
+    parts = [f'"""Generated module {module}."""\n']
+    for name, called in zip(defs, refs):
+        body = " + ".join(f"{ref}(value)" for ref in called) or "value"
+        parts.append(f"\ndef {name}(value):\n    return {body}\n")
+    parts.append(f"\n\nclass {module.title().replace('_', '')}:\n    def run(self, value):\n        return {defs[0]}(value)\n")
+    return "".join(parts)
+
+
+def _javascript(module: str, defs: List[str], refs: List[List[str]]) -> str:
+    parts = [f"// Generated module {module}\n"]
+    for name, called in zip(defs, refs):
+        body = " + ".join(f"{ref}(value)" for ref in called) or "value"
+        parts.append(f"\nfunction {name}(value) {{\n  return {body};\n}}\n")
+    parts.append(f"\nmodule.exports = {{ {', '.join(defs)} }};\n")
+    return "".join(parts)
+
+
+def _typescript(module: str, defs: List[str], refs: List[List[str]]) -> str:
+    parts = [f"// Generated module {module}\n"]
+    for name, called in zip(defs, refs):
+        body = " + ".join(f"{ref}(value)" for ref in called) or "value"
+        parts.append(f"\nexport function {name}(value: number): number {{\n  return {body};\n}}\n")
+    return "".join(parts)
+
+
+def _go(module: str, defs: List[str], refs: List[List[str]]) -> str:
+    parts = [f"// Generated module {module}\npackage main\n"]
+    for name, called in zip(defs, refs):
+        body = " + ".join(f"{ref}(value)" for ref in called) or "value"
+        parts.append(f"\nfunc {name}(value int) int {{\n\treturn {body}\n}}\n")
+    return "".join(parts)
+
+
+def _java(module: str, defs: List[str], refs: List[List[str]]) -> str:
+    cls = module.title().replace("_", "")
+    parts = [f"// Generated module {module}\npublic class {cls} {{\n"]
+    for name, called in zip(defs, refs):
+        body = " + ".join(f"{ref}(value)" for ref in called) or "value"
+        parts.append(f"\n    public static int {name}(int value) {{\n        return {body};\n    }}\n")
+    parts.append("}\n")
+    return "".join(parts)
+
+
+def _rust(module: str, defs: List[str], refs: List[List[str]]) -> str:
+    parts = [f"// Generated module {module}\n"]
+    for name, called in zip(defs, refs):
+        body = " + ".join(f"{ref}(value)" for ref in called) or "value"
+        parts.append(f"\npub fn {name}(value: i64) -> i64 {{\n    {body}\n}}\n")
+    return "".join(parts)
+
+
+def _ruby(module: str, defs: List[str], refs: List[List[str]]) -> str:
+    parts = [f"# Generated module {module}\nmodule {module.title().replace('_', '')}\n"]
+    for name, called in zip(defs, refs):
+        body = " + ".join(f"{ref}(value)" for ref in called) or "value"
+        parts.append(f"  def self.{name}(value)\n    {body}\n  end\n\n")
+    parts.append("end\n")
+    return "".join(parts)
+
+
+def _c(module: str, defs: List[str], refs: List[List[str]]) -> str:
+    parts = [f"/* Generated module {module} */\n"]
+    for name, called in zip(defs, refs):
+        body = " + ".join(f"{ref}(value)" for ref in called) or "value"
+        parts.append(f"\nint {name}(int value) {{\n    return {body};\n}}\n")
+    return "".join(parts)
+
+
+RENDERERS = {
+    "python": _python,
+    "javascript": _javascript,
+    "typescript": _typescript,
+    "go": _go,
+    "java": _java,
+    "rust": _rust,
+    "ruby": _ruby,
+    "c": _c,
+}
+
+
+@dataclass
+class SyntheticRepoSpec:
+    num_files: int = 1000
+    languages: Dict[str, float] = field(default_factory=lambda: {"python": 1.0})
+    defs_per_file: int = 8
+    refs_per_def: int = 3
+    files_per_dir: int = 50
+    zipf_exponent: float = 1.1
+    seed: int = 0
+
+
+def parse_language_mix(spec: str) -> Dict[str, float]:
+    """Parse 'python:0.6,javascript:0.4' (weights need not sum to 1)."""
+    mix = {}
+    for part in spec.split(","):
+        if not part.strip():
+            continue
+        name, _, weight = part.partition(":")
+        name = name.strip()
+        if name not in RENDERERS:
+            raise ValueError(f"Unsupported language '{name}', choose from {sorted(RENDERERS)}")
+        mix[name] = float(weight) if weight else 1.0
+    return mix
+
+
+def generate_repo(directory: str, spec: SyntheticRepoSpec) -> List[str]:
+    """Write a synthetic repository into directory and return the file paths."""
+    rng = random.Random(spec.seed)
+    languages = list(spec.languages)
+    lang_weights = [spec.languages[lang] for lang in languages]
+
+    # Assign a language and definitions to every file up front, so references
+    # can point at symbols defined anywhere in the tree
+    files = []
+    all_defs = []
+    for i in range(spec.num_files):
+        lang = rng.choices(languages, lang_weights)[0]
+        defs = [f"sym_{i}_{j}" for j in range(spec.defs_per_file)]
+        all_defs.extend(defs)
+        files.append((i, lang, defs))
+
+    # Zipf weights over a shuffled symbol order, so hubs are spread across files
+    ranked_symbols = all_defs[:]
+    rng.shuffle(ranked_symbols)
+    cum_weights = list(accumulate(1.0 / (rank + 1) ** spec.zipf_exponent for rank in range(len(ranked_symbols))))
+
+    paths = []
+    for i, lang, defs in files:
+        refs = [
+            rng.choices(ranked_symbols, cum_weights=cum_weights, k=spec.refs_per_def)
+            for _ in defs
+        ]
+        subdir = os.path.join(directory, f"pkg_{i // spec.files_per_dir:04d}")
+        os.makedirs(subdir, exist_ok=True)
+        module = f"mod_{i:06d}"
+        path = os.path.join(subdir, module + EXTENSIONS[lang])
+        with open(path, "w") as f:
+            f.write(RENDERERS[lang](module, defs, refs))
+        paths.append(path)
+    return paths
+
+
+def language_counts(paths: List[str]) -> Dict[str, int]:
+    """Count generated files per extension."""
+    counts: Dict[str, int] = {}
+    for path in paths:
+        ext = os.path.splitext(path)[1]
+        counts[ext] = counts.get(ext, 0) + 1
+    return counts
@@ -0,0 +1,219 @@
+"""
+Source file discovery for RepoMap.
+"""
+
+import os
+import fnmatch
+import logging
+from typing import Dict, List, Optional, Tuple
+
+log = logging.getLogger()
+
+# Files larger than this are never mapped
+MAX_FILE_BYTES = 10 * 1024 * 1024
+# Bytes read from the start of every file to sniff binary, minified and generated content
+SNIFF_BYTES = 4096
+# Lines longer than this are not source code a map can show
+MAX_LINE_LENGTH = 1000
+# Average line length in the sniffed prefix above which a file counts as minified
+MINIFIED_AVERAGE_LINE_LENGTH = 250
+# Markers of generated code, searched in comment lines at the top of a file
+GENERATED_MARKERS = (b"@generated", b"DO NOT EDIT", b"Code generated by", b"<auto-generated", b"autogenerated by")
+GENERATED_HEADER_BYTES = 1024
+COMMENT_PREFIXES = (b"#", b"//", b"/*", b"*", b"--", b"<!--", b";", b"%")
+MINIFIED_SUFFIXES = ('.min.js', '.min.css', '.bundle.js')
+
+# Verdicts of the prefix sniff by (path, size, mtime_ns), shared by every
+# discovery in the process so unchanged files are read only once
+_SNIFF_VERDICTS: Dict[Tuple[str, int, int], Optional[str]] = {}
+MAX_SNIFF_VERDICTS = 1_000_000
+
+
+def skip_reason(file_path: str, st: Optional[os.stat_result] = None) -> Optional[str]:
+    """Why a source file should not be mapped, or None if it should.
+
+    Uses the file size and a SNIFF_BYTES prefix only, so that huge,
+    binary, minified and generated files are recognized without reading
+    them in full. The prefix is only read again when the file's size or
+    mtime changed; pass st if the file was already stat-ed.
+    """
+    if st is None:
+        try:
+            st = os.stat(file_path)
+        except OSError as e:
+            return f"Could not stat file: {e}"
+    size = st.st_size
+    if size > MAX_FILE_BYTES:
+        return f"File too large ({size / 2**20:.1f} MiB > {MAX_FILE_BYTES / 2**20:.0f} MiB)"
+    if file_path.lower().endswith(MINIFIED_SUFFIXES):
+        return "Minified file"
+    if size == 0:
+        return None
+
+    key = (file_path, size, st.st_mtime_ns)
+    try:
+        return _SNIFF_VERDICTS[key]
+    except KeyError:
+        pass
+    try:
+        with open(file_path, 'rb') as f:
+            prefix = f.read(SNIFF_BYTES)
+    except OSError as e:
+        # Not remembered: the file may become readable
+        return f"Could not read file: {e}"
+    reason = sniff_reason(prefix, size)
+    if len(_SNIFF_VERDICTS) >= MAX_SNIFF_VERDICTS:
+        _SNIFF_VERDICTS.clear()
+    _SNIFF_VERDICTS[key] = reason
+    return reason
+
+
+def sniff_reason(prefix: bytes, size: int) -> Optional[str]:
+    """Why a file of this size starting with prefix is binary, generated or minified, if it is."""
+    if b"\0" in prefix:
+        return "Binary file"
+    for line in prefix[:GENERATED_HEADER_BYTES].splitlines():
+        if line.lstrip().startswith(COMMENT_PREFIXES) and any(marker in line for marker in GENERATED_MARKERS):
+            return "Generated file"
+    newlines = prefix.count(b"\n")
+    if len(prefix) == SNIFF_BYTES and size > SNIFF_BYTES and newlines == 0:
+        return "Minified file (no line breaks)"
+    if len(prefix) / (newlines + 1) > MINIFIED_AVERAGE_LINE_LENGTH:
+        return "Minified file (long lines)"
+    return None
+
+
+def parse_gitignore(directory: str) -> List[str]:
+    """Parse .gitignore file and return list of patterns to exclude."""
+    gitignore_path = os.path.join(directory, '.gitignore')
+    patterns = []
+    
+    if os.path.exists(gitignore_path):
+        try:
+            with open(gitignore_path, 'r') as f:
+                for line in f:
+                    line = line.strip()
+                    # Skip empty lines and comments
+                    if line and not line.startswith('#'):
+                        patterns.append(line)
+        except Exception as e:
+            log.warning(f"Error reading .gitignore file {gitignore_path}: {e}")
+    
+    return patterns
+
+def should_exclude_from_gitignore(file_path: str, gitignore_patterns: List[str], root_dir: str) -> bool:
+    """Check if a file should be excluded based on .gitignore patterns."""
+    if not gitignore_patterns:
+        return False
+    
+    # Get relative path from root directory
+    try:
+        rel_path = os.path.relpath(file_path, root_dir)
+    except ValueError:
+        return False
+    
+    for pattern in gitignore_patterns:
+        # Handle directory patterns (ending with /)
+        if pattern.endswith('/'):
+            dir_pattern = pattern.rstrip('/')
+            if fnmatch.fnmatch(rel_path, dir_pattern) or fnmatch.fnmatch(rel_path, pattern + '*'):
+                return True
+        # Handle regular file patterns
+        elif fnmatch.fnmatch(rel_path, pattern) or fnmatch.fnmatch(os.path.basename(file_path), pattern):
+            return True
+    
+    return False
+
+# Enhanced file filtering with configurable patterns and .gitignore support
+def find_src_files(
+    directory: str,
+    file_patterns: Optional[List[str]] = None,
+    skipped: Optional[Dict[str, str]] = None
+) -> List[str]:
+    """Find source files in a directory with proper filtering, including .gitignore support.
+    
+    Args:
+        directory: Directory to search
+        file_patterns: List of file extensions to include (e.g., ['.py', '.js'])
+                     If None, uses default source code extensions
+        skipped: If given, receives the path and reason of every source file
+                 left out by skip_reason (too large, binary, minified, generated)
+    """
+    if not os.path.isdir(directory):
+        if os.path.isfile(directory) and is_source_file(directory, file_patterns):
+            reason = skip_reason(directory)
+            if reason is None:
+                return [directory]
+            if skipped is not None:
+                skipped[directory] = reason
+        return []
+    
+    # Default source code extensions
+    default_extensions = {'.py', '.js', '.ts', '.java', '.c', '.cpp', '.h', '.hpp',
+                         '.go', '.rs', '.rb', '.php', '.swift', '.scala', '.kt'}
+    
+    # Use provided patterns or default to source extensions
+    if file_patterns:
+        extensions = {ext.lower() for ext in file_patterns if ext.startswith('.')}
+    else:
+        extensions = default_extensions
+    
+    # Parse .gitignore patterns
+    gitignore_patterns = parse_gitignore(directory)
+    if gitignore_patterns:
+        log.debug(f"Found {len(gitignore_patterns)} .gitignore patterns: {gitignore_patterns}")
+    
+    src_files = []
+    
+    for root, dirs, files in os.walk(directory):
+        # Skip hidden directories and common non-source directories
+        dirs[:] = [d for d in dirs if not d.startswith('.') and d not in {
+            'node_modules', '__pycache__', 'venv', 'env', '.git',
+            'dist', 'build', 'target', 'out', 'bin', 'obj',
+            'static', 'templates', 'research', 'settings', 'test_example'
+        }]
+        
+        # Also exclude directories based on .gitignore patterns
+        dirs[:] = [d for d in dirs if not should_exclude_from_gitignore(
+            os.path.join(root, d), gitignore_patterns, directory
+        )]
+        
+        for file in files:
+            if not file.startswith('.'):
+                file_path = os.path.join(root, file)
+                
+                # Check .gitignore exclusion
+                if should_exclude_from_gitignore(file_path, gitignore_patterns, directory):
+                    continue
+                
+                file_ext = os.path.splitext(file)[1].lower()
+                if file_ext in extensions:
+                    reason = skip_reason(file_path)
+                    if reason is not None:
+                        log.debug(f"Skipping {file_path}: {reason}")
+                        if skipped is not None:
+                            skipped[file_path] = reason
+                        continue
+                    src_files.append(file_path)
+    
+    # Debug logging
+    log.debug(f"find_src_files in {directory}: found {len(src_files)} source files with patterns {file_patterns}")
+    if src_files and len(src_files) > 0:
+        log.debug(f"Sample files found: {src_files[:5]}")
+    
+    return src_files
+
+def is_source_file(filepath: str, file_patterns: Optional[List[str]] = None) -> bool:
+    """Check if a file is a source code file based on extensions."""
+    # Default source code extensions
+    default_extensions = {'.py', '.js', '.ts', '.java', '.c', '.cpp', '.h', '.hpp',
+                         '.go', '.rs', '.rb', '.php', '.swift', '.scala', '.kt'}
+    
+    # Use provided patterns or default to source extensions
+    if file_patterns:
+        extensions = {ext.lower() for ext in file_patterns if ext.startswith('.')}
+    else:
+        extensions = default_extensions
+    
+    file_ext = os.path.splitext(filepath)[1].lower()
+    return file_ext in extensions
@@ -0,0 +1,90 @@
+"""
+Case-insensitive substring search of identifiers for many queries at once.
+
+All queries go into one Aho-Corasick automaton, and each distinct tag name
+is scanned once, so adding a query costs little more than building its
+trie path. Empty queries match every name, as with `query in name`.
+"""
+
+import heapq
+from collections import defaultdict
+from typing import Dict, List, Sequence
+
+from utils import Tag
+
+
+class QueryAutomaton:
+    """Aho-Corasick automaton over lowercased queries."""
+
+    def __init__(self, queries: Sequence[str]):
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        # Per state: (query index, query length) of every query ending here
+        self.out: List[List[tuple]] = [[]]
+        self.match_all = [i for i, query in enumerate(queries) if not query]
+
+        for index, query in enumerate(queries):
+            if not query:
+                continue
+            state = 0
+            for ch in query.lower():
+                nxt = self.goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[state][ch] = nxt
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append([])
+                state = nxt
+            self.out[state].append((index, len(query)))
+
+        # Breadth-first failure links; outputs inherit those of their failure state
+        queue = list(self.goto[0].values())
+        for state in queue:
+            for ch, child in self.goto[state].items():
+                fallback = self.fail[state]
+                while fallback and ch not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(ch, 0)
+                self.out[child] = self.out[child] + self.out[self.fail[child]]
+                queue.append(child)
+
+    def first_matches(self, text: str) -> Dict[int, int]:
+        """Map each query index found in text to the position of its first occurrence."""
+        found = {index: 0 for index in self.match_all}
+        goto, fail, out = self.goto, self.fail, self.out
+        state = 0
+        for pos, ch in enumerate(text.lower()):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for index, length in out[state]:
+                if index not in found:
+                    found[index] = pos - length + 1
+        return found
+
+
+def match_queries(
+    tags: Sequence[Tag],
+    queries: Sequence[str],
+    include_definitions: bool = True,
+    include_references: bool = True,
+    max_results: int = 50,
+) -> List[List[Tag]]:
+    """Tags whose name contains each query, ignoring case.
+
+    Returns one list per query: definitions first, then by where the query
+    occurs in the name, then in the order of tags; at most max_results each.
+    """
+    by_name: Dict[str, List[int]] = defaultdict(list)
+    for position, tag in enumerate(tags):
+        if (tag.kind == "def" and include_definitions) or (tag.kind == "ref" and include_references):
+            by_name[tag.name].append(position)
+
+    automaton = QueryAutomaton(queries)
+    hits: List[List[tuple]] = [[] for _ in queries]
+    for name, positions in by_name.items():
+        for index, offset in automaton.first_matches(name).items():
+            hits[index].extend((tags[p].kind != "def", offset, p) for p in positions)
+
+    return [[tags[p] for _, _, p in heapq.nsmallest(max_results, query_hits)] for query_hits in hits]
@@ -0,0 +1,133 @@
+"""
+Versioned repository maps and the deltas between them.
+
+A map is a prefix followed by one block per file, each starting with the
+file name and its rank line (see RepoMap.to_tree). Every map handed out is
+remembered under a version token derived from its content; given an older
+token, only the blocks added, changed or removed since then are returned.
+
+The delta is taken between rendered maps, so it shortens the response but
+not the request: the new map is generated in full before it is compared.
+"""
+
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+# Map versions kept per server process
+MAX_MAP_VERSIONS = 256
+
+# Start of a file block: "<rel_fname>:" followed by its rank line
+_BLOCK_START = re.compile(r"^(?P<fname>[^\n]+):\n\(Rank value: [^\n]*\)\n", re.MULTILINE)
+
+
+def split_blocks(map_text: str) -> Tuple[str, "OrderedDict[str, str]"]:
+    """Split a map into its prefix and its file blocks, in map order."""
+    starts = list(_BLOCK_START.finditer(map_text))
+    if not starts:
+        return map_text, OrderedDict()
+    blocks = OrderedDict()
+    for match, following in zip(starts, starts[1:] + [None]):
+        end = following.start() if following is not None else len(map_text)
+        blocks[match.group("fname")] = map_text[match.start():end].rstrip("\n")
+    return map_text[:starts[0].start()], blocks
+
+
+def diff_blocks(old: Dict[str, str], new: Dict[str, str]) -> Tuple[List[str], List[str], List[str]]:
+    """Files added, changed (in rank or content) and removed between two maps."""
+    added = [fname for fname in new if fname not in old]
+    changed = [fname for fname in new if fname in old and old[fname] != new[fname]]
+    removed = [fname for fname in old if fname not in new]
+    return added, changed, removed
+
+
+class MapVersionStore:
+    """LRU of the file blocks of recently returned maps, by version token."""
+
+    def __init__(self, max_versions: int = MAX_MAP_VERSIONS):
+        self.max_versions = max_versions
+        self._versions: "OrderedDict[str, Tuple[str, OrderedDict]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def token_for(project_root: str, map_text: str) -> str:
+        hasher = hashlib.sha1(project_root.encode("utf-8", errors="replace") + b"\0")
+        hasher.update(map_text.encode("utf-8", errors="replace"))
+        return hasher.hexdigest()[:16]
+
+    def put(self, project_root: str, map_text: str) -> str:
+        """Remember a map and return its version token."""
+        token = self.token_for(project_root, map_text)
+        _, blocks = split_blocks(map_text)
+        with self._lock:
+            self._versions[token] = (project_root, blocks)
+            self._versions.move_to_end(token)
+            while len(self._versions) > self.max_versions:
+                self._versions.popitem(last=False)
+        return token
+
+    def get(self, project_root: str, token: str) -> Optional["OrderedDict[str, str]"]:
+        """File blocks of a version of this project's map, or None if unknown or evicted."""
+        with self._lock:
+            entry = self._versions.get(token)
+            if entry is None or entry[0] != project_root:
+                return None
+            self._versions.move_to_end(token)
+            return entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._versions.clear()
+
+    def __len__(self) -> int:
+        return len(self._versions)
+
+
+MAP_VERSIONS = MapVersionStore()
+
+
+def versioned_map(
+    project_root: str,
+    map_text: str,
+    since_version: Optional[str] = None,
+    store: MapVersionStore = MAP_VERSIONS,
+) -> Dict[str, object]:
+    """Version a map and, given an earlier version, reduce it to the changed blocks.
+
+    Returns 'map' and 'map_version', plus a 'delta' entry when since_version
+    is known: the added, changed and removed files and the number of
+    unchanged ones. 'map' then holds only the added and changed blocks. An
+    unknown since_version (e.g. after a server restart) or a map without
+    file blocks (e.g. a rollup) returns the full map with 'delta_unavailable' set.
+    map_text is always the full map; only the returned text is reduced.
+    """
+    token = store.put(project_root, map_text)
+    result: Dict[str, object] = {"map": map_text, "map_version": token}
+    if not since_version:
+        return result
+
+    old_blocks = store.get(project_root, since_version)
+    if old_blocks is None:
+        result["delta_unavailable"] = f"Unknown map version {since_version}; returning the full map."
+        return result
+
+    _, new_blocks = split_blocks(map_text)
+    if not new_blocks:
+        result["delta_unavailable"] = "This map has no file blocks; returning the full map."
+        return result
+    added, changed, removed = diff_blocks(old_blocks, new_blocks)
+    modified = set(added) | set(changed)
+    parts = [block for fname, block in new_blocks.items() if fname in modified]
+    if removed:
+        parts.append("Removed from the map: " + ", ".join(removed))
+    result["map"] = "\n\n".join(parts) if parts else f"Repository map unchanged since version {since_version}."
+    result["delta"] = {
+        "since_version": since_version,
+        "added": added,
+        "changed": changed,
+        "removed": removed,
+        "unchanged": len(new_blocks) - len(added) - len(changed),
+    }
+    return result
@@ -0,0 +1,470 @@
+"""
+Per-request and process-wide instrumentation for RepoMap.
+"""
+
+import cProfile
+import functools
+import itertools
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+
+class MemoryLimitExceeded(MemoryError):
+    """Raised when a request grows memory by more than its configured ceiling."""
+
+
+# tracemalloc is process-wide: requests tracing at the same time share one
+# session, counted here so that the first to finish does not stop it for the
+# others. _tracing_owned is whether RequestMetrics.tracing() started it.
+_tracing_lock = threading.Lock()
+_tracing_requests = 0
+_tracing_owned = False
+
+
+class RequestMetrics:
+    """Wall/CPU time per pipeline phase plus named counters for one request.
+
+    Phases may nest (rendering happens inside token fitting, for example);
+    each phase reports its own inclusive time. CPU time is measured for the
+    calling thread only, so concurrent requests do not inflate each other.
+
+    With trace_memory, each phase also reports the peak traced allocation
+    and the bytes it left allocated (tracemalloc is process-wide, so these
+    include concurrent requests, and a phase's peak is only reset for it
+    while no other request is tracing). With memory_limit_bytes, the memory the
+    request has added since it started is checked at every phase boundary and
+    at check_memory() calls, and MemoryLimitExceeded is raised once it is over
+    the limit. Growth is traced memory while tracemalloc runs, otherwise the
+    resident set size over its value when the request started: memory an
+    earlier request left resident does not count, though concurrent requests
+    still do.
+    """
+
+    def __init__(self, enabled: bool = True, trace_memory: bool = False, memory_limit_bytes: Optional[int] = None):
+        self.enabled = enabled
+        self.trace_memory = trace_memory
+        self.memory_limit_bytes = memory_limit_bytes
+        self.phases: Dict[str, Dict[str, float]] = {}
+        self.counters: Dict[str, int] = defaultdict(int)
+        self.memory: Dict[str, Any] = {}
+        self._phase_names: List[str] = []
+        self._phase_peaks: List[int] = []
+        # Whether this request is inside its tracing() block
+        self._tracing = False
+        self._resident_baseline = resident_memory_bytes() if memory_limit_bytes else None
+        self._traced_baseline = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else None
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        self._phase_names.append(name)
+        try:
+            self.check_memory()
+            if not self.enabled:
+                yield
+                return
+            tracing = self.trace_memory and tracemalloc.is_tracing()
+            if tracing:
+                current_start = self._enter_traced_phase()
+            wall_start = time.perf_counter()
+            cpu_start = time.thread_time()
+            try:
+                yield
+            finally:
+                entry = self.phases.setdefault(name, {"wall_seconds": 0.0, "cpu_seconds": 0.0, "calls": 0})
+                entry["wall_seconds"] += time.perf_counter() - wall_start
+                entry["cpu_seconds"] += time.thread_time() - cpu_start
+                entry["calls"] += 1
+                if tracing:
+                    current, peak = self._exit_traced_phase()
+                    entry["peak_bytes"] = max(entry.get("peak_bytes", 0), peak)
+                    entry["allocated_bytes"] = entry.get("allocated_bytes", 0) + current - current_start
+            self.check_memory()
+        finally:
+            self._phase_names.pop()
+
+    def _enter_traced_phase(self) -> int:
+        # tracemalloc keeps a single peak; fold it into the enclosing phases
+        # before resetting it for this one. Resetting it under another
+        # request would lose that request's peak, so then the peak since the
+        # last reset is kept, which overstates this phase's
+        with _tracing_lock:
+            current, peak = tracemalloc.get_traced_memory()
+            self._phase_peaks[:] = [max(p, peak) for p in self._phase_peaks]
+            if self._tracing and _tracing_owned and _tracing_requests == 1:
+                tracemalloc.reset_peak()
+        self._phase_peaks.append(current)
+        return current
+
+    def _exit_traced_phase(self) -> Tuple[int, int]:
+        current, peak = tracemalloc.get_traced_memory()
+        peak = max(self._phase_peaks.pop(), peak)
+        self._phase_peaks[:] = [max(p, peak) for p in self._phase_peaks]
+        return current, peak
+
+    @contextmanager
+    def tracing(self) -> Iterator[None]:
+        """Run tracemalloc for the duration of the block when trace_memory is set.
+
+        Overlapping blocks share one tracemalloc session, which stops when
+        the last of them ends; a session started elsewhere is left running.
+        """
+        global _tracing_owned, _tracing_requests
+        if not self.trace_memory:
+            yield
+            return
+        with _tracing_lock:
+            if _tracing_requests == 0 and not tracemalloc.is_tracing():
+                tracemalloc.start()
+                _tracing_owned = True
+            _tracing_requests += 1
+            self._tracing = True
+            self._traced_baseline = tracemalloc.get_traced_memory()[0]
+        try:
+            yield
+        finally:
+            with _tracing_lock:
+                _tracing_requests -= 1
+                if _tracing_requests == 0 and _tracing_owned:
+                    tracemalloc.stop()
+                    _tracing_owned = False
+                self._tracing = False
+                self._traced_baseline = None
+
+    def memory_growth(self) -> Optional[int]:
+        """Bytes this request has added since it started, or None if that cannot be measured."""
+        if self._traced_baseline is not None and tracemalloc.is_tracing():
+            return tracemalloc.get_traced_memory()[0] - self._traced_baseline
+        if self._resident_baseline is None:
+            return None
+        rss = resident_memory_bytes()
+        return None if rss is None else rss - self._resident_baseline
+
+    def check_memory(self):
+        """Raise MemoryLimitExceeded if the request has grown memory past the configured limit."""
+        if not self.memory_limit_bytes:
+            return
+        growth = self.memory_growth()
+        if growth is not None and growth > self.memory_limit_bytes:
+            phase = f" during phase '{self._phase_names[-1]}'" if self._phase_names else ""
+            raise MemoryLimitExceeded(
+                f"Memory limit exceeded{phase}: the request added {growth / 2**20:.0f} MiB, over the "
+                f"{self.memory_limit_bytes / 2**20:.0f} MiB limit. Map fewer files (scan_directories, "
+                f"file_patterns) or raise the limit."
+            )
+
+    def incr(self, name: str, amount: int = 1):
+        if self.enabled:
+            self.counters[name] += amount
+
+    def set(self, name: str, value: int):
+        if self.enabled:
+            self.counters[name] = value
+
+    def as_dict(self) -> Dict[str, Any]:
+        result = {
+            "phases": {
+                name: {
+                    "wall_seconds": round(entry["wall_seconds"], 6),
+                    "cpu_seconds": round(entry["cpu_seconds"], 6),
+                    "calls": entry["calls"],
+                    **{key: entry[key] for key in ("peak_bytes", "allocated_bytes") if key in entry},
+                }
+                for name, entry in self.phases.items()
+            },
+            "counters": dict(self.counters),
+        }
+        if self.memory:
+            result["memory"] = self.memory
+        return result
+
+    def format(self) -> str:
+        """Human-readable summary for verbose CLI output."""
+        lines = ["Request metrics:"]
+        for name, entry in self.phases.items():
+            calls = f" x{entry['calls']}" if entry["calls"] > 1 else ""
+            memory = ""
+            if "peak_bytes" in entry:
+                memory = f"  peak {entry['peak_bytes'] / 2**20:8.1f} MiB  retained {entry['allocated_bytes'] / 2**20:8.1f} MiB"
+            lines.append(
+                f"  {name:<18} wall {entry['wall_seconds'] * 1000:9.1f} ms  "
+                f"cpu {entry['cpu_seconds'] * 1000:9.1f} ms{memory}{calls}"
+            )
+        for name, value in sorted(self.counters.items()):
+            lines.append(f"  {name:<18} {value}")
+        for name, size in self.memory.get("caches", {}).items():
+            details = "  ".join(f"{key} {value}" for key, value in size.items())
+            lines.append(f"  {name:<18} {details}")
+        if self.memory.get("resident_bytes"):
+            lines.append(f"  {'resident_memory':<18} {self.memory['resident_bytes'] / 2**20:.1f} MiB")
+        return "\n".join(lines)
+
+
+# Upper bounds (seconds) of the request latency histogram buckets
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, float("inf"))
+
+# Caches whose <name>_hits / <name>_misses request counters are aggregated into hit rates
+TRACKED_CACHES = ("tags_cache", "tree_context_cache", "map_cache", "shard_rank_cache")
+
+
+def resident_memory_bytes() -> Optional[int]:
+    """Current resident set size of this process, or None where /proc is unavailable."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def peak_resident_memory_bytes() -> Optional[int]:
+    """Largest resident set size this process has had so far."""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in kilobytes on Linux and bytes on macOS
+        return peak if sys.platform == "darwin" else peak * 1024
+    except (ImportError, OSError):
+        return None
+
+
+def approximate_size(obj: Any, _seen: Optional[Set[int]] = None) -> int:
+    """Deep sys.getsizeof of obj, following containers and instance attributes."""
+    seen = _seen if _seen is not None else set()
+    stack = [obj]
+    size = 0
+    while stack:
+        item = stack.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        try:
+            size += sys.getsizeof(item)
+        except TypeError:
+            continue
+        if isinstance(item, (str, bytes, bytearray, int, float, bool, type(None))):
+            continue
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset)):
+            stack.extend(item)
+        else:
+            attrs = getattr(item, "__dict__", None)
+            if attrs is not None:
+                stack.append(attrs)
+    return size
+
+
+def approximate_mapping_size(mapping: Dict, sample: int = 32) -> int:
+    """Approximate deep size of a large mapping by extrapolating from a sample of its items."""
+    if not mapping:
+        return sys.getsizeof(mapping)
+    items = list(itertools.islice(mapping.items(), sample))
+    seen: Set[int] = set()
+    sampled = sum(approximate_size(key, seen) + approximate_size(value, seen) for key, value in items)
+    return sys.getsizeof(mapping) + sampled * len(mapping) // len(items)
+
+
+def _label_value(value: Any) -> str:
+    """Escape a Prometheus label value: backslashes, double quotes and newlines."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class ServerStats:
+    """Process-wide request statistics for the long-running MCP server."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+        self.requests: Dict[str, Dict[str, Any]] = {}
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.counters: Dict[str, int] = defaultdict(int)
+        self.projects: Set[str] = set()
+
+    def _tool_entry(self, tool: str) -> Dict[str, Any]:
+        entry = self.requests.get(tool)
+        if entry is None:
+            entry = {"count": 0, "errors": 0, "latency_sum": 0.0, "buckets": [0] * len(LATENCY_BUCKETS)}
+            self.requests[tool] = entry
+        return entry
+
+    def record(self, tool: str, seconds: float, error: bool = False):
+        with self._lock:
+            entry = self._tool_entry(tool)
+            entry["count"] += 1
+            entry["errors"] += int(error)
+            entry["latency_sum"] += seconds
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    entry["buckets"][i] += 1
+                    break
+
+    def add_counters(self, counters: Dict[str, int]):
+        with self._lock:
+            for name, value in counters.items():
+                self.counters[name] += value
+
+    def track(self, tool: str) -> Callable:
+        """Decorator recording latency, errors and in-flight count of an async tool.
+
+        A returned dict with an 'error' key counts as a failed request; request
+        metrics found in result['report']['metrics'] and in the same place of
+        each of result['results'] are aggregated.
+        """
+        def decorator(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                with self._lock:
+                    self.in_flight += 1
+                    self.max_in_flight = max(self.max_in_flight, self.in_flight)
+                    project_root = kwargs.get("project_root", args[0] if args else None)
+                    if isinstance(project_root, str) and os.path.isdir(project_root):
+                        self.projects.add(os.path.realpath(project_root))
+                start = time.perf_counter()
+                error = True
+                try:
+                    result = await func(*args, **kwargs)
+                    error = isinstance(result, dict) and "error" in result
+                    if isinstance(result, dict):
+                        # batch_repo_map returns one repo_map result per repository
+                        for entry in [result] + list(result.get("results") or []):
+                            metrics = (entry.get("report") or {}).get("metrics") if isinstance(entry, dict) else None
+                            if metrics:
+                                self.add_counters(metrics.get("counters", {}))
+                    return result
+                finally:
+                    with self._lock:
+                        self.in_flight -= 1
+                    self.record(tool, time.perf_counter() - start, error)
+            return wrapper
+        return decorator
+
+    def cache_hit_rates(self) -> Dict[str, Dict[str, Any]]:
+        rates = {}
+        for cache in TRACKED_CACHES:
+            hits = self.counters.get(f"{cache}_hits", 0)
+            misses = self.counters.get(f"{cache}_misses", 0)
+            total = hits + misses
+            rates[cache] = {"hits": hits, "misses": misses, "hit_rate": round(hits / total, 4) if total else None}
+        return rates
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            requests = {}
+            for tool, entry in self.requests.items():
+                requests[tool] = {
+                    "count": entry["count"],
+                    "errors": entry["errors"],
+                    "mean_seconds": round(entry["latency_sum"] / entry["count"], 6) if entry["count"] else None,
+                    "latency_histogram": {
+                        ("+Inf" if bound == float("inf") else str(bound)): count
+                        for bound, count in zip(LATENCY_BUCKETS, entry["buckets"])
+                    },
+                }
+            return {
+                "uptime_seconds": round(time.time() - self.started_at, 3),
+                "requests": requests,
+                "in_flight": self.in_flight,
+                "max_in_flight": self.max_in_flight,
+                "caches": self.cache_hit_rates(),
+                "projects_seen": len(self.projects),
+                "resident_memory_bytes": resident_memory_bytes(),
+                "peak_resident_memory_bytes": peak_resident_memory_bytes(),
+            }
+
+    def to_prometheus(self, gauges: Optional[Dict[str, Any]] = None) -> str:
+        """Render the statistics in the Prometheus text exposition format.
+
+        gauges maps extra metric names to a value or to {label_value: value}
+        for per-project gauges (labelled with project=...).
+        """
+        lines = []
+
+        def metric(name, kind, help_text):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        with self._lock:
+            metric("repomap_requests_total", "counter", "Tool requests by outcome.")
+            for tool, entry in sorted(self.requests.items()):
+                tool = _label_value(tool)
+                lines.append(f'repomap_requests_total{{tool="{tool}",status="ok"}} {entry["count"] - entry["errors"]}')
+                lines.append(f'repomap_requests_total{{tool="{tool}",status="error"}} {entry["errors"]}')
+
+            metric("repomap_request_duration_seconds", "histogram", "Tool request latency.")
+            for tool, entry in sorted(self.requests.items()):
+                tool = _label_value(tool)
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS, entry["buckets"]):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f'repomap_request_duration_seconds_bucket{{tool="{tool}",le="{le}"}} {cumulative}')
+                lines.append(f'repomap_request_duration_seconds_sum{{tool="{tool}"}} {entry["latency_sum"]:.6f}')
+                lines.append(f'repomap_request_duration_seconds_count{{tool="{tool}"}} {entry["count"]}')
+
+            metric("repomap_requests_in_flight", "gauge", "Requests currently being processed.")
+            lines.append(f"repomap_requests_in_flight {self.in_flight}")
+
+            metric("repomap_cache_lookups_total", "counter", "Cache lookups by cache and result.")
+            for cache in TRACKED_CACHES:
+                lines.append(f'repomap_cache_lookups_total{{cache="{cache}",result="hit"}} {self.counters.get(f"{cache}_hits", 0)}')
+                lines.append(f'repomap_cache_lookups_total{{cache="{cache}",result="miss"}} {self.counters.get(f"{cache}_misses", 0)}')
+
+        rss = resident_memory_bytes()
+        if rss is not None:
+            metric("repomap_resident_memory_bytes", "gauge", "Resident memory of the server process.")
+            lines.append(f"repomap_resident_memory_bytes {rss}")
+
+        for name, value in (gauges or {}).items():
+            metric(f"repomap_{name}", "gauge", name.replace("_", " ").capitalize() + ".")
+            if isinstance(value, dict):
+                for label, labelled_value in sorted(value.items()):
+                    label = _label_value(label)
+                    lines.append(f'repomap_{name}{{project="{label}"}} {labelled_value}')
+            else:
+                lines.append(f"repomap_{name} {value}")
+
+        return "\n".join(lines) + "\n"
+
+
+# Number of hot functions returned by a profiled request
+PROFILE_TOP_N = 25
+
+# Only one cProfile profiler may be active per process on newer Pythons,
+# so profiled requests run one at a time
+_profile_lock = threading.Lock()
+
+
+def run_profiled(func: Callable, *args, **kwargs) -> Tuple[Any, cProfile.Profile]:
+    """Call func under cProfile in the current thread; returns (result, profiler)."""
+    profiler = cProfile.Profile()
+    with _profile_lock:
+        profiler.enable()
+        try:
+            result = func(*args, **kwargs)
+        finally:
+            profiler.disable()
+    return result, profiler
+
+
+def hot_functions(profiler: cProfile.Profile, limit: int = PROFILE_TOP_N) -> List[Dict[str, Any]]:
+    """Top functions of a profile by cumulative time."""
+    stats = pstats.Stats(profiler)
+    entries = []
+    for (filename, line, name), (prim_calls, calls, total, cumulative, _) in stats.stats.items():
+        entries.append({
+            "function": f"{filename}:{line}({name})",
+            "calls": calls,
+            "primitive_calls": prim_calls,
+            "total_seconds": round(total, 6),
+            "cumulative_seconds": round(cumulative, 6),
+        })
+    entries.sort(key=lambda entry: entry["cumulative_seconds"], reverse=True)
+    return entries[:limit]
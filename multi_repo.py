@@ -0,0 +1,84 @@
+"""
+Repository maps across several project roots.
+
+Every root is ranked on its own graph. The combined map merges the ranked
+tags of all roots and fits the best of them under a single token budget.
+PageRank values of repositories of different sizes are not comparable, so
+each root's ranks are scaled to make its best tag 1.0 before merging.
+"""
+
+import heapq
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional, Set, Tuple, TYPE_CHECKING
+
+from metrics import RequestMetrics
+from utils import Tag
+
+if TYPE_CHECKING:
+    from repomap_class import RepoMap
+
+
+@dataclass
+class RootRanking:
+    """Ranked tags of one project root, with the RepoMap that renders them."""
+    label: str
+    repo_map: "RepoMap"
+    ranked_tags: List[Tuple[float, Tag]]
+    chat_rel_fnames: Set[str] = field(default_factory=set)
+
+
+def merge_ranked_tags(roots: List[RootRanking]) -> List[Tuple[float, int, Tag]]:
+    """Merge the roots' ranked tags into (scaled rank, root index, tag), best first.
+
+    Ties keep the order of the roots and of the tags within each root.
+    """
+    streams = []
+    for index, root in enumerate(roots):
+        if not root.ranked_tags:
+            continue
+        top = max(rank for rank, _ in root.ranked_tags) or 1.0
+        streams.append([(rank / top, index, tag) for rank, tag in root.ranked_tags])
+    return list(heapq.merge(*streams, key=lambda entry: -entry[0]))
+
+
+def render_combined(roots: List[RootRanking], merged: List[Tuple[float, int, Tag]]) -> str:
+    """Render a prefix of the merged tags, one section per root in order of its best tag."""
+    selected = {}
+    for rank, index, tag in merged:
+        selected.setdefault(index, []).append((rank, tag))
+    sections = []
+    for index, tags in selected.items():
+        root = roots[index]
+        tree = root.repo_map.to_tree(tags, root.chat_rel_fnames)
+        if tree:
+            sections.append(f"Repository {root.label}:\n\n{tree}")
+    return "\n\n".join(sections)
+
+
+def fit_combined_map(
+    roots: List[RootRanking],
+    max_map_tokens: int,
+    token_count: Callable[[str], int],
+    metrics: Optional[RequestMetrics] = None,
+) -> Optional[str]:
+    """Binary search for the largest prefix of the merged tags that fits the budget."""
+    metrics = metrics if metrics is not None else RequestMetrics()
+    with metrics.phase("merge"):
+        merged = merge_ranked_tags(roots)
+
+    best = None
+    left, right = 1, len(merged)
+    with metrics.phase("fitting"):
+        while left <= right:
+            mid = (left + right) // 2
+            metrics.incr("binary_search_iterations")
+            with metrics.phase("render"):
+                output = render_combined(roots, merged[:mid])
+            with metrics.phase("token_count"):
+                tokens = token_count(output)
+            if output and tokens <= max_map_tokens:
+                best = output
+                left = mid + 1
+            else:
+                right = mid - 1
+    return best
@@ -0,0 +1,85 @@
+"""
+Ranked definitions kept as arrays and ordered only as far as they are read.
+
+get_ranked_tags ranks every definition, but the token budget only admits a
+short prefix of the ranking. RankedTags holds the ranks of all definitions
+in an array and orders just its top candidates, with a partial selection
+instead of a full sort; the rest is sorted when something past them is
+accessed. Either way the order is that of a stable sort by descending rank,
+so readers of the ranking cannot tell the difference. Tags are created on
+first access, for the prefix that is actually read.
+"""
+
+from collections.abc import Sequence
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+
+from utils import Tag
+
+
+def top_order(ranks: np.ndarray, limit: Optional[int] = None) -> np.ndarray:
+    """Indices of the limit highest ranks (all of them if None), highest first.
+
+    Equal ranks keep their index order, so the result is a prefix of
+    np.argsort(-ranks, kind="stable").
+    """
+    if limit is None or limit >= len(ranks):
+        return np.argsort(-ranks, kind="stable")
+    if limit <= 0:
+        return np.empty(0, dtype=np.intp)
+    negated = -ranks
+    kth = np.partition(negated, limit - 1)[limit - 1]
+    above = np.flatnonzero(negated < kth)
+    ties = np.flatnonzero(negated == kth)[:limit - len(above)]
+    chosen = np.sort(np.concatenate([above, ties]))
+    return chosen[np.argsort(negated[chosen], kind="stable")]
+
+
+class RankedTags(Sequence):
+    """(rank, Tag) pairs in rank order, ordered and created on first access.
+
+    ranks[i] is the rank of the definition make_tag(positions[i]) builds.
+    Only the top limit entries are ordered up front (num_ordered of them);
+    reading past them sorts the remainder.
+    """
+
+    def __init__(
+        self,
+        ranks: np.ndarray,
+        positions: np.ndarray,
+        make_tag: Callable[[int], Tag],
+        limit: Optional[int] = None,
+    ):
+        self._ranks = ranks
+        self._positions = positions
+        self._make_tag = make_tag
+        self._order = top_order(ranks, limit)
+        self._items: List[Tuple[float, Tag]] = []
+
+    @property
+    def num_ordered(self) -> int:
+        """Length of the prefix that can be read without sorting the rest."""
+        return len(self._order)
+
+    def __len__(self) -> int:
+        return len(self._ranks)
+
+    def _materialize(self, end: int):
+        if end > len(self._order):
+            self._order = top_order(self._ranks)
+        for i in range(len(self._items), end):
+            index = self._order[i]
+            self._items.append((float(self._ranks[index]), self._make_tag(int(self._positions[index]))))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            indices = range(*index.indices(len(self)))
+            self._materialize(max(indices, default=-1) + 1)
+            return [self._items[i] for i in indices]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("ranked tag index out of range")
+        self._materialize(index + 1)
+        return self._items[index]
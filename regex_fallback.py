@@ -0,0 +1,227 @@
+"""
+Regex-based tag extraction used when Tree-sitter cannot parse a file.
+
+Each language has a table of (pattern, kind) entries. The table is compiled
+once into a single MULTILINE alternation anchored at the start of a line and
+run over the whole buffer, so a file costs one regex scan instead of one
+search per line and pattern. As before, at most one tag is taken per line:
+the first entry of the table that matches wins.
+
+The same definitions, together with identifiers() as approximate
+references, make up the cheap first pass of skeleton indexing.
+"""
+
+import re
+from typing import Dict, List, Optional, Pattern, Set, Tuple
+
+# Identifier shapes shared by the pattern tables
+ID = r"[A-Za-z_]\w*"
+JS_ID = r"[A-Za-z_$][\w$]*"
+LISP_NAME = r"[^\s()'\"]+"
+
+# Words that look like calls ("if (...)") but are control flow
+_NOT_CALLED = r"(?!(?:if|elif|else|while|for|foreach|switch|case|return|catch|with|sizeof|typeof|not|and|or|in|unless|until|when|do)\b)"
+
+# A call at the start of a statement, e.g. "foo(", "obj.method(", "ns::fn(", "ptr->fn("
+CALL = (rf"(?:{ID}[ \t]*(?:\.|->|::)[ \t]*)*{_NOT_CALLED}({ID})[ \t]*\(", "ref")
+
+# C-family function definition: type tokens, the name, and a parameter list
+# not followed by ';' on the same line (which would make it a declaration or call)
+C_FUNCTION = (
+    rf"(?!(?:return|else|case|goto|throw|delete|new|typedef)\b)"
+    rf"(?:[A-Za-z_][\w<>:,]*[ \t*&]+)+\**(?:{ID}::)*{_NOT_CALLED}({ID})[ \t]*\([^;\n]*$",
+    "def",
+)
+C_TYPES = (rf"(?:typedef[ \t]+)?(?:struct|class|enum(?:[ \t]+class)?|union|namespace)[ \t]+({ID})", "def")
+C_DEFINE = (rf"#[ \t]*define[ \t]+({ID})", "def")
+
+JAVA_MODIFIERS = r"(?:(?:public|private|protected|internal|static|final|abstract|sealed|partial|virtual|override|async|readonly|synchronized|native|unsafe|extern|new)[ \t]+)"
+
+PATTERNS: Dict[str, List[Tuple[str, str]]] = {
+    "python": [
+        (rf"(?:async[ \t]+)?def[ \t]+({ID})[ \t]*\(", "def"),
+        (rf"class[ \t]+({ID})[ \t]*(?:\(|:)", "def"),
+        (rf"({ID})[ \t]*=[ \t]*(?!\d)", "def"),
+        (r"(?:from[ \t]+(?=[a-zA-Z_][a-zA-Z0-9_.]*[ \t]+import)|import[ \t]+)([a-zA-Z_][a-zA-Z0-9_.]*)", "ref"),
+        CALL,
+    ],
+    "javascript": [
+        (rf"(?:export[ \t]+)?(?:default[ \t]+)?(?:async[ \t]+)?(?:function\*?|class)[ \t]+({JS_ID})", "def"),
+        (rf"(?:export[ \t]+)?(?:const|let|var)[ \t]+({JS_ID})", "def"),
+        (rf"(?:{JS_ID}[ \t]*\.[ \t]*)*{_NOT_CALLED}({JS_ID})[ \t]*\(", "ref"),
+    ],
+    "java": [
+        (rf"{JAVA_MODIFIERS}*(?:class|interface|enum|record|@interface)[ \t]+({ID})", "def"),
+        (rf"{JAVA_MODIFIERS}+(?:<[^>\n]*>[ \t]+)?[\w<>\[\].,?]+[ \t]+({ID})[ \t]*\(", "def"),
+        CALL,
+    ],
+    "c_sharp": [
+        (rf"{JAVA_MODIFIERS}*(?:class|interface|struct|enum|record|namespace)[ \t]+({ID})", "def"),
+        (rf"{JAVA_MODIFIERS}+[\w<>\[\].,?]+[ \t]+({ID})[ \t]*(?:<[^>\n]*>)?[ \t]*\(", "def"),
+        CALL,
+    ],
+    "ruby": [
+        (r"def[ \t]+(?:self\.)?([a-zA-Z_][0-9a-zA-Z_]*[?!=]?)", "def"),
+        (r"(?:class|module)[ \t]+([a-zA-Z_][0-9a-zA-Z_]*(?:::[a-zA-Z_][0-9a-zA-Z_]*)*)", "def"),
+    ],
+    "go": [
+        (rf"func[ \t]+(?:\([^)\n]*\)[ \t]*)?({ID})", "def"),
+        (rf"type[ \t]+({ID})", "def"),
+        (rf"(?:var|const)[ \t]+({ID})", "def"),
+        CALL,
+    ],
+    "rust": [
+        (rf"(?:pub(?:\([^)\n]*\))?[ \t]+)?(?:(?:async|const|unsafe|extern(?:[ \t]+\"[^\"\n]*\")?)[ \t]+)*fn[ \t]+({ID})", "def"),
+        (rf"(?:pub(?:\([^)\n]*\))?[ \t]+)?(?:struct|enum|trait|type|union|mod)[ \t]+({ID})", "def"),
+        (rf"macro_rules![ \t]*({ID})", "def"),
+        (rf"(?:pub(?:\([^)\n]*\))?[ \t]+)?(?:const|static)[ \t]+(?:mut[ \t]+)?({ID})", "def"),
+        CALL,
+    ],
+    "c": [C_DEFINE, C_TYPES, C_FUNCTION, CALL],
+    "cpp": [C_DEFINE, C_TYPES, (rf"template[ \t]*<[^>\n]*>[ \t]*(?:class|struct)[ \t]+({ID})", "def"), C_FUNCTION, CALL],
+    "d": [(rf"(?:class|struct|interface|enum|template|union|mixin template)[ \t]+({ID})", "def"), C_FUNCTION, CALL],
+    "dart": [
+        (rf"(?:abstract[ \t]+)?(?:class|mixin|enum|extension|typedef)[ \t]+({ID})", "def"),
+        C_FUNCTION,
+        CALL,
+    ],
+    "kotlin": [
+        (rf"(?:\w+[ \t]+)*fun[ \t]+(?:<[^>\n]*>[ \t]*)?(?:{ID}\.)?({ID})", "def"),
+        (rf"(?:\w+[ \t]+)*(?:class|interface|object)[ \t]+({ID})", "def"),
+        (rf"(?:\w+[ \t]+)*(?:val|var|typealias)[ \t]+({ID})", "def"),
+        CALL,
+    ],
+    "scala": [
+        (rf"(?:\w+[ \t]+)*(?:def|val|var|class|object|trait|type|enum|given)[ \t]+({ID})", "def"),
+        CALL,
+    ],
+    "swift": [
+        (rf"(?:@\w+[ \t]+)*(?:\w+[ \t]+)*(?:func|class|struct|enum|protocol|extension|typealias|actor|let|var)[ \t]+({ID})", "def"),
+        CALL,
+    ],
+    "php": [
+        (rf"(?:(?:abstract|final|public|private|protected|static)[ \t]+)*function[ \t]+&?({ID})", "def"),
+        (rf"(?:(?:abstract|final|readonly)[ \t]+)*(?:class|interface|trait|enum)[ \t]+({ID})", "def"),
+        CALL,
+    ],
+    "lua": [
+        (rf"(?:local[ \t]+)?function[ \t]+(?:[\w.:]*[.:])?({ID})", "def"),
+        (rf"local[ \t]+({ID})[ \t]*=", "def"),
+        CALL,
+    ],
+    "elixir": [
+        (r"(?:def|defp|defmacro|defmacrop|defguard|defguardp|defdelegate)[ \t]+([a-z_]\w*[?!]?)", "def"),
+        (r"(?:defmodule|defprotocol|defimpl)[ \t]+([A-Z][\w.]*)", "def"),
+    ],
+    "elm": [
+        (r"module[ \t]+([A-Z][\w.]*)", "def"),
+        (r"type[ \t]+(?:alias[ \t]+)?([A-Z]\w*)", "def"),
+        (r"([a-z]\w*)[ \t]*:", "def"),
+    ],
+    "gleam": [
+        (rf"(?:pub[ \t]+)?(?:fn|const)[ \t]+({ID})", "def"),
+        (rf"(?:pub[ \t]+)?(?:opaque[ \t]+)?type[ \t]+({ID})", "def"),
+        CALL,
+    ],
+    "ocaml": [
+        (rf"(?:let|and)[ \t]+(?:rec[ \t]+)?({ID})", "def"),
+        (rf"(?:type|module(?:[ \t]+type)?|val|external|class|exception)[ \t]+(?:nonrec[ \t]+)?({ID})", "def"),
+    ],
+    "r": [
+        (r"([A-Za-z.][\w.]*)[ \t]*(?:<-|=)[ \t]*function", "def"),
+        (r"([A-Za-z.][\w.]*)[ \t]*<-", "def"),
+        (r"([A-Za-z.][\w.]*)[ \t]*\(", "ref"),
+    ],
+    "racket": [(rf"\((?:define|define-syntax|define-values|define-struct|struct)[ \t]+\(?({LISP_NAME})", "def")],
+    "commonlisp": [
+        (rf"\((?:defun|defmacro|defgeneric|defmethod|defvar|defparameter|defconstant|defclass|defstruct)[ \t]+\(?({LISP_NAME})", "def"),
+    ],
+    "elisp": [
+        (rf"\((?:defun|defmacro|defvar|defcustom|defconst|defsubst|define-minor-mode|define-derived-mode)[ \t]+({LISP_NAME})", "def"),
+    ],
+    "solidity": [
+        (rf"(?:abstract[ \t]+)?(?:contract|interface|library|struct|enum|event|modifier|function|error)[ \t]+({ID})", "def"),
+        CALL,
+    ],
+    "hcl": [
+        (r"(?:resource|data)[ \t]+\"[^\"\n]*\"[ \t]+\"([^\"\n]+)\"", "def"),
+        (r"(?:variable|output|module|provider|locals)[ \t]+\"([^\"\n]+)\"", "def"),
+    ],
+    "ql": [
+        (rf"(?:(?:private|abstract|final|cached|deprecated)[ \t]+)*(?:class|module|newtype|predicate)[ \t]+({ID})", "def"),
+    ],
+    "pony": [
+        (rf"(?:actor|class|primitive|trait|interface|struct|type)[ \t]+(?:(?:iso|trn|ref|val|box|tag)[ \t]+)?({ID})", "def"),
+        (rf"(?:fun|be|new)[ \t]+(?:(?:iso|trn|ref|val|box|tag)[ \t]+)?({ID})", "def"),
+    ],
+    "properties": [(r"([^#!\s=:][^=:\s]*)[ \t]*[=:]", "def")],
+    "udev": [
+        (r".*?\bLABEL[ \t]*=[ \t]*\"([^\"\n]+)\"", "def"),
+        (r".*?\bGOTO[ \t]*=[ \t]*\"([^\"\n]+)\"", "ref"),
+    ],
+    "chatito": [
+        (r"%\[([^\]\n]+)\]", "def"),
+        (r"@\[([^\]\n]+)\]", "def"),
+        (r"~\[([^\]\n]+)\]", "def"),
+    ],
+}
+
+PATTERNS["typescript"] = [
+    (rf"(?:export[ \t]+)?(?:declare[ \t]+)?(?:abstract[ \t]+)?(?:interface|type|enum|namespace|module)[ \t]+({JS_ID})", "def"),
+] + PATTERNS["javascript"]
+PATTERNS["tsx"] = PATTERNS["typescript"]
+PATTERNS["csharp"] = PATTERNS["c_sharp"]
+PATTERNS["arduino"] = PATTERNS["cpp"]
+PATTERNS["cuda"] = PATTERNS["cpp"]
+PATTERNS["ocaml_interface"] = PATTERNS["ocaml"]
+
+# Compiled alternation and group -> kind table per language
+_COMPILED: Dict[str, Tuple[Pattern, List[str]]] = {}
+
+
+def _compile(lang: str) -> Optional[Tuple[Pattern, List[str]]]:
+    compiled = _COMPILED.get(lang)
+    if compiled is None:
+        table = PATTERNS.get(lang)
+        if not table:
+            return None
+        for pattern, _ in table:
+            if re.compile(pattern).groups != 1:
+                raise ValueError(f"Regex fallback pattern for {lang} must have one capture group: {pattern}")
+        # Every alternative has exactly one group, so match.lastindex names the entry that matched
+        alternation = "|".join(f"(?:{pattern})" for pattern, _ in table)
+        compiled = (re.compile(rf"^[ \t]*(?:{alternation})", re.MULTILINE), [kind for _, kind in table])
+        _COMPILED[lang] = compiled
+    return compiled
+
+
+_IDENTIFIER = re.compile(r"[A-Za-z_$][\w$]*")
+
+
+def supports(lang: str) -> bool:
+    return lang in PATTERNS
+
+
+def extract_tags(code: str, lang: str) -> List[Tuple[int, str, str]]:
+    """Return (line, name, kind) tuples found in code, with 1-based lines."""
+    compiled = _compile(lang)
+    if compiled is None:
+        return []
+    regex, kinds = compiled
+
+    tags = []
+    line = 1
+    pos = 0
+    for match in regex.finditer(code):
+        group = match.lastindex
+        if group is None:
+            continue
+        line += code.count("\n", pos, match.start())
+        pos = match.start()
+        tags.append((line, match.group(group), kinds[group - 1]))
+    return tags
+
+
+def identifiers(code: str) -> Set[str]:
+    """Every identifier-like word in code, as approximate references for skeleton indexing."""
+    return set(_IDENTIFIER.findall(code))
@@ -8,17 +8,30 @@ import json
 import hashlib
 from pathlib import Path
 from collections import namedtuple, defaultdict
-from typing import List, Dict, Set, Optional, Tuple, Callable, Any, Union
+from itertools import groupby, islice
+from typing import List, Dict, Set, Optional, Tuple, Callable, Any, Union, TYPE_CHECKING
 import shutil
 import sqlite3
+import threading
 from utils import Tag
 from dataclasses import dataclass
-import diskcache
-import networkx as nx
-from grep_ast import TreeContext
-from utils import count_tokens, read_text, Tag
+from utils import count_tokens, iter_bounded_lines, read_bytes, read_text, Tag
+from discovery import MAX_FILE_BYTES, MAX_LINE_LENGTH
 from scm import get_scm_fname
 from importance import filter_important_files
+import regex_fallback
+from tag_store import TagStore
+from tree_cache import ParsedFile, TreeCache, byte_to_point, compute_edit, requery_span
+from sharding import SHARD_RANK_CACHE, ShardResolver, rank_sharded
+from local_pagerank import PUSH_CSR_EDGE_COST, PUSH_CSR_MIN_NODES, PUSH_MIN_NODES, csr_successors, graph_successors, push_pagerank
+from metrics import RequestMetrics, approximate_mapping_size, resident_memory_bytes
+
+# networkx, diskcache and grep_ast are imported where they are first used, so
+# that importing this module (and starting the server) stays fast
+if TYPE_CHECKING:
+    import networkx as nx
+    from ranked_tags import RankedTags
+    from snapshot import Snapshot
 
 
 @dataclass
@@ -27,6 +40,7 @@ class FileReport:
     definition_matches: int         # Total definition tags
     reference_matches: int          # Total reference tags
     total_files_considered: int     # Total files provided as input
+    metrics: Optional[Dict[str, Any]] = None    # Phase timings and counters of the request
 
 
 
@@ -34,8 +48,51 @@ class FileReport:
 CACHE_VERSION = 1
 
 TAGS_CACHE_DIR = f".repomap.tags.cache.v{CACHE_VERSION}"
+TAG_STORE_FNAME = f".repomap.tags.store.v{CACHE_VERSION}.sqlite"
 SQLITE_ERRORS = (sqlite3.OperationalError, sqlite3.DatabaseError)
 
+# Files processed between memory limit checks while collecting tags
+MEMORY_CHECK_EVERY = 256
+
+# Skeleton indexing and lazy parsing parse files fully until their
+# approximate definitions could fill this many times the token budget
+SKELETON_FULL_PARSE_FACTOR = 4
+SKELETON_TOKENS_PER_DEF = 12
+
+# Files larger than this are tagged by a bounded streaming regex scan instead of Tree-sitter
+STREAM_SCAN_BYTES = 1024 * 1024
+# Lines handed to the regex patterns at a time by the streaming scan
+STREAM_SCAN_CHUNK_LINES = 2000
+# Bytes of top-level nodes queried at a time; query matches hold a Python
+# object per captured node, so this bounds their memory on big files
+QUERY_WINDOW_BYTES = 128 * 1024
+
+# Top symbols listed per directory in rollup maps
+ROLLUP_SYMBOLS_PER_DIRECTORY = 6
+
+# The budget fit only renders prefixes whose precomputed fragment cost is
+# within this fraction of the budget, after checking the bounds it implies
+FIT_ESTIMATE_SLACK = 0.25
+
+# Ranked definitions are fully ordered only past a partial selection of the
+# top ones: TOP_TAGS_FACTOR times as many as the budget holds at an estimated
+# TOKENS_PER_TAG_ESTIMATE tokens per rendered definition (see ranked_tags.py)
+TOKENS_PER_TAG_ESTIMATE = 12
+TOP_TAGS_FACTOR = 4
+
+# Compiled tags queries by SCM file path, shared by all RepoMap instances
+_QUERY_CACHE: Dict[str, Any] = {}
+
+# Skeletons by absolute file name ({"mtime", "data"}), shared by all RepoMap
+# instances so that requests do not reload them from the tags cache
+_SKELETON_CACHE: Dict[str, Dict[str, Any]] = {}
+MAX_CACHED_SKELETONS = 200000
+
+# Tag stores by database path, shared by all RepoMap instances so that each
+# project keeps one SQLite connection (TagStore serialises its queries)
+_TAG_STORES: Dict[str, TagStore] = {}
+_TAG_STORES_LOCK = threading.Lock()
+
 # Tag namedtuple for storing parsed code definitions and references
 Tag = namedtuple("Tag", "rel_fname fname line name kind".split())
 
@@ -55,9 +112,21 @@ class RepoMap:
         max_context_window: Optional[int] = None,
         map_mul_no_files: int = 8,
         refresh: str = "auto",
-        exclude_unranked: bool = False
+        exclude_unranked: bool = False,
+        use_tag_store: bool = False,
+        tree_cache: Optional[TreeCache] = None,
+        skeleton_index: bool = False,
+        lazy_parse: bool = False,
+        sharded: bool = False,
+        rollup: bool = False,
+        snapshot: Optional["Snapshot"] = None
     ):
-        """Initialize RepoMap instance."""
+        """Initialize RepoMap instance.
+
+        snapshot is a loaded index snapshot (see snapshot.py) of the same
+        root; files it holds unchanged are ranked from its arrays without
+        loading their tags.
+        """
         self.map_tokens = map_tokens
         self.max_map_tokens = map_tokens
         self.root = Path(root or os.getcwd()).resolve()
@@ -69,6 +138,12 @@ class RepoMap:
         self.map_mul_no_files = map_mul_no_files
         self.refresh = refresh
         self.exclude_unranked = exclude_unranked
+        self.use_tag_store = use_tag_store
+        self.skeleton_index = skeleton_index
+        self.lazy_parse = lazy_parse
+        self.sharded = sharded
+        self.rollup = rollup
+        self.snapshot = snapshot
         
         # Set up output handlers
         if output_handler_funcs is None:
@@ -85,23 +160,66 @@ class RepoMap:
         self.output_handlers = output_handler_funcs
         
         # Initialize caches
-        self.tree_cache = {}
+        # Last Tree-sitter tree per file for incremental reparsing; pass a
+        # shared TreeCache to keep trees across RepoMap instances
+        self.tree_cache = tree_cache if tree_cache is not None else TreeCache()
         self.tree_context_cache = {}
         self.map_cache = {}
+        self.skeleton_cache = _SKELETON_CACHE
+        # Scanned skeletons not yet written to the tags cache (see save_skeletons)
+        self._pending_skeletons: Dict[str, Dict[str, Any]] = {}
+        # Rendered definition lines per file, from the tags cache entries
+        self.fragment_cache = {}
+        # Ranking behind the last map generated, for callers that reuse it
+        self.last_ranked_tags: Optional[List[Tuple[float, Tag]]] = None
+        self.metrics = RequestMetrics()
         self.cache_path = self.root / ".repomap_cache.json"
         
         # Load persistent tags cache
         self.load_tags_cache()
+        
+        # Optional relational store for set-based ranking queries; it ranks
+        # every file in one pass, so the modes that choose which files to
+        # parse or how to rank them do without it
+        self.tag_store = None
+        if self.use_tag_store:
+            if self.skeleton_index or self.lazy_parse or self.sharded:
+                self.output_handlers['warning'](
+                    "Tag store is not used with skeleton_index, lazy_parse or sharded ranking"
+                )
+            else:
+                self.load_tag_store()
     
     def load_tags_cache(self):
         """Load the persistent tags cache."""
         cache_dir = self.root / TAGS_CACHE_DIR
         try:
+            import diskcache
             self.TAGS_CACHE = diskcache.Cache(str(cache_dir))
         except Exception as e:
             self.output_handlers['warning'](f"Failed to load tags cache: {e}")
             self.TAGS_CACHE = {}
     
+    def load_tag_store(self):
+        """Open the relational tag store used for set-based ranking queries, or reuse the project's open one."""
+        db_path = str(self.root / TAG_STORE_FNAME)
+        try:
+            with _TAG_STORES_LOCK:
+                store = _TAG_STORES.get(db_path)
+                if store is None:
+                    store = _TAG_STORES[db_path] = TagStore(db_path)
+            self.tag_store = store
+        except SQLITE_ERRORS as e:
+            self.output_handlers['warning'](f"Failed to open tag store, using tags cache only: {e}")
+            self.tag_store = None
+
+    def drop_tag_store(self):
+        """Stop using a failing tag store; the next RepoMap of the project opens a new one."""
+        with _TAG_STORES_LOCK:
+            if _TAG_STORES.get(self.tag_store.db_path) is self.tag_store:
+                del _TAG_STORES[self.tag_store.db_path]
+        self.tag_store = None
+    
     def save_tags_cache(self):
         """Save the tags cache (no-op as diskcache handles persistence)."""
         pass
@@ -117,6 +235,23 @@ class RepoMap:
             self.output_handlers['warning']("Failed to recreate tags cache, using in-memory cache")
             self.TAGS_CACHE = {}
     
+    def cache_sizes(self) -> Dict[str, Dict[str, int]]:
+        """Approximate entry counts and sizes of the RepoMap caches."""
+        sizes = {}
+        if isinstance(self.TAGS_CACHE, dict):
+            sizes["tags_cache"] = {"entries": len(self.TAGS_CACHE), "bytes": approximate_mapping_size(self.TAGS_CACHE)}
+        else:
+            try:
+                sizes["tags_cache"] = {"entries": len(self.TAGS_CACHE), "disk_bytes": self.TAGS_CACHE.volume()}
+            except Exception as e:
+                self.output_handlers['debug'](f"Could not size tags cache: {e}")
+        sizes["tree_cache"] = {"entries": len(self.tree_cache), "source_bytes": self.tree_cache.source_bytes()}
+        sizes["shard_rank_cache"] = {"entries": len(SHARD_RANK_CACHE)}
+        for name in ("tree_context_cache", "map_cache", "skeleton_cache", "fragment_cache"):
+            cache = getattr(self, name)
+            sizes[name] = {"entries": len(cache), "bytes": approximate_mapping_size(cache)}
+        return sizes
+
     def token_count(self, text: str) -> int:
         """Count tokens in text with sampling optimization for long texts."""
         if not text:
@@ -173,25 +308,89 @@ class RepoMap:
             else:
                 cached_entry = self.TAGS_CACHE.get(fname)
                 
-            if cached_entry and cached_entry.get("mtime") == file_mtime:
+            # Entries holding only a skeleton (see get_skeleton) have no tags yet
+            if cached_entry and cached_entry.get("mtime") == file_mtime and "data" in cached_entry:
                 self.output_handlers['debug'](f"Using cached tags for {rel_fname}")
+                self.metrics.incr("tags_cache_hits")
+                if "fragments" not in cached_entry:
+                    # Entry written before fragments were stored
+                    fragments = self.build_fragments(cached_entry["data"], self._read_whole_source(fname))
+                    cached_entry = dict(cached_entry, fragments=fragments)
+                    self.TAGS_CACHE[fname] = cached_entry
+                self.fragment_cache[rel_fname] = cached_entry["fragments"]
                 return cached_entry["data"]
         except SQLITE_ERRORS:
             self.tags_cache_error()
         
         # Cache miss or file changed
         self.output_handlers['debug'](f"Cache miss for {rel_fname}, parsing file")
-        tags = self.get_tags_raw(fname, rel_fname)
-        
+        self.metrics.incr("tags_cache_misses")
+        # Read once for both the parse and the fragments
+        source = self._read_whole_source(fname)
+        tags = self.get_tags_raw(fname, rel_fname, source)
+        fragments = self.build_fragments(tags, source)
+        self.fragment_cache[rel_fname] = fragments
+        
+        self._pending_skeletons.pop(fname, None)
         try:
-            self.TAGS_CACHE[fname] = {"mtime": file_mtime, "data": tags}
+            self.TAGS_CACHE[fname] = {"mtime": file_mtime, "data": tags, "fragments": fragments}
         except SQLITE_ERRORS:
             self.tags_cache_error()
         
         return tags
+
+    def _read_whole_source(self, fname: str) -> Optional[bytes]:
+        """The file's bytes, or None if it cannot be read or is large enough to be streamed."""
+        try:
+            if os.path.getsize(fname) > STREAM_SCAN_BYTES:
+                return None
+        except OSError:
+            return None
+        return self._read_source(fname)
+
+    def build_fragments(self, tags: List[Tag], source: Optional[bytes]) -> Optional[Dict[str, Any]]:
+        """Definition lines of a file rendered as render_tree shows them, with their token cost.
+
+        source is the file's content as read for parsing. Stored with the
+        tags so that to_tree can assemble maps without reading source files.
+        None for files render_tree streams or cannot read.
+        """
+        if not source:
+            return None
+
+        lines = source.decode("utf-8", errors="ignore").splitlines()
+        rendered = {}
+        for tag in tags:
+            if tag.kind == "def" and tag.line not in rendered and 1 <= tag.line <= len(lines):
+                text = f"{tag.line:4d}: {lines[tag.line - 1]}"
+                rendered[tag.line] = (text, self.token_count(text))
+        return {"num_lines": len(lines), "lines": rendered}
+
+    def get_fragments(self, rel_fname: str) -> Optional[Dict[str, Any]]:
+        """Stored fragments of a file, or None.
+
+        Files ranked from a snapshot never go through get_tags, so their
+        fragments are loaded from the tags cache when first needed, i.e.
+        only for files that make it into the map.
+        """
+        if rel_fname not in self.fragment_cache and self.snapshot is not None:
+            fname = str(self.root / rel_fname)
+            try:
+                cached_entry = self.TAGS_CACHE.get(fname)
+            except SQLITE_ERRORS:
+                cached_entry = None
+            if cached_entry and cached_entry.get("mtime") == self.get_mtime(fname):
+                self.metrics.incr("fragment_loads")
+                self.fragment_cache[rel_fname] = cached_entry.get("fragments")
+            else:
+                self.fragment_cache[rel_fname] = None
+        return self.fragment_cache.get(rel_fname)
     
-    def get_tags_raw(self, fname: str, rel_fname: str) -> List[Tag]:
-        """Parse file to extract tags using Tree-sitter."""
+    def get_tags_raw(self, fname: str, rel_fname: str, source: Optional[bytes] = None) -> List[Tag]:
+        """Parse file to extract tags using Tree-sitter.
+
+        source is the file's content if the caller has already read it.
+        """
         self.output_handlers['debug'](f"Starting get_tags_raw for {rel_fname}")
         try:
             from grep_ast import filename_to_lang
@@ -207,6 +406,16 @@ class RepoMap:
             self.output_handlers['info'](f"Language not supported for {fname}")
             return []
         
+        try:
+            size = os.path.getsize(fname)
+        except OSError:
+            size = 0
+        if size > STREAM_SCAN_BYTES:
+            self.output_handlers['info'](
+                f"{rel_fname} is {size / 2**20:.1f} MiB, tagging it with a streaming regex scan instead of Tree-sitter"
+            )
+            return self._stream_scan_tags(fname, rel_fname, lang)
+
         try:
             language = get_language(lang)
             parser = get_parser(lang)
@@ -241,80 +450,50 @@ class RepoMap:
             self.output_handlers['warning'](f"SCM file not found for {lang} at {scm_locations}")
             return []
 
-        code = self.read_text_func_internal(fname)
-        if not code:
+        if source is None:
+            source = self._read_source(fname)
+        if not source:
             return []
         
         try:
-            # Parse the code with Tree-sitter
-            self.output_handlers['debug'](f"Attempting Tree-sitter parsing for {rel_fname}")
-            tree = parser.parse(bytes(code, "utf-8"))
-            
-            if tree.root_node is None or tree.root_node.has_error:
-                self.output_handlers['warning'](f"Tree-sitter parsing failed for {rel_fname}, attempting regex fallback")
-                tags = self._regex_fallback(code, rel_fname, fname, lang)
-                self.output_handlers['info'](f"Regex fallback for {rel_fname}: {len(tags)} tags found")
-                return tags
-            
-            # Load query from SCM file
+            # Load query from SCM file (compiled once per process)
             try:
-                query_text = read_text(scm_fname)
-                if not query_text:
-                    self.output_handlers['warning'](f"Empty SCM file: {scm_fname}")
-                    tags = self._regex_fallback(code, rel_fname, fname, lang)
-                    self.output_handlers['info'](f"Regex fallback for {rel_fname}: {len(tags)} tags found")
-                    return tags
+                query = self.get_query(language, scm_fname)
             except Exception as e:
-                self.output_handlers['error'](f"Error reading SCM file {scm_fname}: {e}")
-                tags = self._regex_fallback(code, rel_fname, fname, lang)
+                self.output_handlers['error'](f"Error creating query from {scm_fname}: {e}")
+                tags = self._regex_fallback(source, rel_fname, fname, lang)
                 self.output_handlers['info'](f"Regex fallback for {rel_fname}: {len(tags)} tags found")
                 return tags
 
-            try:
-                query = language.query(query_text)
-            except Exception as e:
-                self.output_handlers['error'](f"Error creating query from {scm_fname}: {e}")
-                tags = self._regex_fallback(code, rel_fname, fname, lang)
+            # Parse the code with Tree-sitter, incrementally when the previous tree is known
+            self.output_handlers['debug'](f"Attempting Tree-sitter parsing for {rel_fname}")
+            previous = self.tree_cache.take(fname)
+            if previous is not None and previous.lang == lang:
+                tree, tags = self._reparse_tags(parser, query, previous, source, rel_fname, fname)
+            else:
+                tree = parser.parse(source)
+                tags = None
+            
+            if tree.root_node is None or tree.root_node.has_error:
+                self.output_handlers['warning'](f"Tree-sitter parsing failed for {rel_fname}, attempting regex fallback")
+                tags = self._regex_fallback(source, rel_fname, fname, lang)
                 self.output_handlers['info'](f"Regex fallback for {rel_fname}: {len(tags)} tags found")
                 return tags
             
-            # Use QueryCursor for modern tree-sitter API
-            from tree_sitter import QueryCursor
-            qcursor = QueryCursor(query)
-            matches = qcursor.matches(tree.root_node)
+            if tags is None:
+                tags = self._query_tags(query, tree, source, rel_fname, fname)
+                self.metrics.incr("full_parses")
+            self.tree_cache.put(fname, ParsedFile(lang=lang, source=source, tree=tree, tags=tags))
+            tags = list(tags)
             
             if self.verbose:
                 self.output_handlers['debug'](f"Tree-sitter found matches in {rel_fname}")
-            
-            tags = []
-            # Process matches and captures
-            for pattern_index, captures_dict in matches:
-                for capture_name, nodes in captures_dict.items():
-                    for node in nodes:
-                        if "name.definition" in capture_name:
-                            kind = "def"
-                        elif "name.reference" in capture_name:
-                            kind = "ref"
-                        else:
-                            # Skip other capture types
-                            continue
-                        
-                        line_num = node.start_point[0] + 1
-                        name = node.text.decode('utf-8') if node.text else ""
-                        
-                        tags.append(Tag(
-                            rel_fname=rel_fname,
-                            fname=fname,
-                            line=line_num,
-                            name=name,
-                            kind=kind
-                        ))
 
             # If tree-sitter fails, fallback to regex
             self.output_handlers['debug'](f"Tree-sitter parsing completed for {rel_fname}, found {len(tags)} tags")
             if not tags:
                 self.output_handlers['warning'](f"Tree-sitter found no tags for {rel_fname}, attempting regex fallback")
-                tags = self._regex_fallback(code, rel_fname, fname, lang)
+                tags = self._regex_fallback(source, rel_fname, fname, lang)
                 self.output_handlers['info'](f"Regex fallback for {rel_fname}: {len(tags)} tags found")
                 return tags
             
@@ -322,71 +501,252 @@ class RepoMap:
             return tags
             
         except Exception as e:
+            self.tree_cache.discard(fname)
             self.output_handlers['error'](f"Error parsing {fname}: {e}")
             import traceback
             self.output_handlers['debug'](f"Full traceback: {traceback.format_exc()}")
-            tags = self._regex_fallback(code, rel_fname, fname, lang)
+            tags = self._regex_fallback(source, rel_fname, fname, lang)
             self.output_handlers['info'](f"Regex fallback for {rel_fname}: {len(tags)} tags found")
             return tags
-    
-    def _regex_fallback(self, code: str, rel_fname: str, fname: str, lang: str) -> List[Tag]:
-        """Fallback to regex parsing when Tree-sitter fails."""
-        import re
-        patterns = {
-            'python': [
-                # Function definitions - match def function_name(...
-                (r'^\s*def\s+([a-zA-Z_][a-zA-Z0-9_]*)\s*\(', "def", 1),
-                # Class definitions - match class ClassName(...
-                (r'^\s*class\s+([a-zA-Z_][a-zA-Z0-9_]*)\s*(?:\(|:)', "def", 1),
-                # Variable assignments - match variable = value
-                (r'^\s*([a-zA-Z_][a-zA-Z0-9_]*)\s*=\s*(?!\d)', "def", 1),
-                # Import statements - match import module or from module import name
-                (r'^\s*(?:from\s+([a-zA-Z_][a-zA-Z0-9_.]*)\s+import|import\s+([a-zA-Z_][a-zA-Z0-9_.]*))', "ref", 1),
-                # Function calls - match function_name(...
-                (r'^\s*([a-zA-Z_][a-zA-Z0-9_]*)\s*\(', "ref", 1),
-            ],
-            'javascript': [
-                (r'^\s*(?:function|class)\s+([a-zA-Z_$][0-9a-zA-Z_$]*)', "def", 1),
-                (r'^\s*(?:const|let|var)\s+([a-zA-Z_$][0-9a-zA-Z_$]*)', "def", 1),
-                (r'^\s*([a-zA-Z_$][0-9a-zA-Z_$]*)\s*\(', "ref", 1),
-            ],
-            'java': [
-                (r'^\s*(?:public|private|protected)\s+[\w<>]+\s+([a-zA-Z_$][a-zA-Z\d_$]*)\([^)]*\)\s*\{?', "def", 1),
-                (r'^\s*class\s+([a-zA-Z_$][a-zA-Z\d_$]*)', "def", 1),
-            ],
-            'ruby': [
-                (r'^\s*(?:def|class|module)\s+([a-zA-Z_][0-9a-zA-Z_]*(?:::[a-zA-Z_][0-9a-zA-Z_]*)*)', "def", 1),
-            ]
-        }
-        
+
+    def get_query(self, language, scm_fname: str):
+        """Compile the tags query in scm_fname once per process."""
+        query = _QUERY_CACHE.get(scm_fname)
+        if query is None:
+            query_text = read_text(scm_fname)
+            if not query_text:
+                raise ValueError(f"Empty SCM file: {scm_fname}")
+            if hasattr(language, "query"):
+                query = language.query(query_text)
+            else:
+                # tree-sitter >= 0.25 removed Language.query
+                from tree_sitter import Query
+                query = Query(language, query_text)
+            _QUERY_CACHE[scm_fname] = query
+        return query
+
+    def _read_source(self, fname: str) -> Optional[bytes]:
+        """The bytes to parse; read directly unless a custom file reader was given."""
+        if self.read_text_func_internal is read_text:
+            return read_bytes(fname)
+        code = self.read_text_func_internal(fname)
+        return code.encode("utf-8") if code else None
+
+    def _query_tags(self, query, tree, source: bytes, rel_fname: str, fname: str) -> List[Tag]:
+        """Run the tags query over a whole tree, QUERY_WINDOW_BYTES of top-level nodes at a time.
+
+        Each capture is taken from the window its node starts in, which gives
+        the same tags in the same order as a single query over the tree.
+        """
+        from tree_sitter import QueryCursor
+
+        qcursor = QueryCursor(query)
         tags = []
-        lang_patterns = patterns.get(lang, [])
-        
-        for i, line in enumerate(code.splitlines()):
-            line = line.strip()
-            if not line or line.startswith('#'):
-                continue  # Skip empty lines and comments
-                
-            for pattern, kind, group_num in lang_patterns:
-                match = re.search(pattern, line)
-                if match:
-                    # Extract the identifier name from the appropriate capture group
-                    name = None
-                    for g in range(1, match.lastindex + 1 if match.lastindex else 1):
-                        candidate = match.group(g)
-                        if candidate and candidate not in ['from', 'import']:  # Skip keywords
-                            name = candidate
-                            break
+        window_start = None
+        children = tree.root_node.children
+        for i, child in enumerate(children):
+            if window_start is None:
+                window_start = child.start_byte
+            if child.end_byte - window_start < QUERY_WINDOW_BYTES and i < len(children) - 1:
+                continue
+            qcursor.set_byte_range(window_start, child.end_byte)
+            tags.extend(self._tags_from_matches(
+                qcursor.matches(tree.root_node), source, rel_fname, fname, window_start, child.end_byte
+            ))
+            window_start = None
+        return tags
+
+    def _tags_from_matches(
+        self,
+        matches,
+        source: bytes,
+        rel_fname: str,
+        fname: str,
+        start_byte: int = 0,
+        end_byte: Optional[int] = None
+    ) -> List[Tag]:
+        """Turn Tree-sitter query matches into definition and reference tags.
+
+        Names are sliced from source; captures starting outside
+        [start_byte, end_byte) are left to the window they start in.
+        """
+        if end_byte is None:
+            end_byte = len(source)
+        tags = []
+        # Process matches and captures
+        for pattern_index, captures_dict in matches:
+            for capture_name, nodes in captures_dict.items():
+                for node in nodes:
+                    if not start_byte <= node.start_byte < end_byte:
+                        continue
+                    if "name.definition" in capture_name:
+                        kind = "def"
+                    elif "name.reference" in capture_name:
+                        kind = "ref"
+                    else:
+                        # Skip other capture types
+                        continue
                     
-                    if name:
-                        tags.append(Tag(
-                            rel_fname=rel_fname,
-                            fname=fname,
-                            line=i + 1,
-                            name=name,
-                            kind=kind
-                        ))
-                        break  # Only match one pattern per line
+                    line_num = node.start_point[0] + 1
+                    name = source[node.start_byte:node.end_byte].decode("utf-8", errors="replace")
+                    
+                    tags.append(Tag(
+                        rel_fname=rel_fname,
+                        fname=fname,
+                        line=line_num,
+                        name=name,
+                        kind=kind
+                    ))
+        return tags
+
+    def _reparse_tags(self, parser, query, previous: ParsedFile, source: bytes, rel_fname: str, fname: str):
+        """Reparse a changed file from its previous tree and re-query only the changed region.
+
+        Tags outside the re-queried region are carried over from the previous
+        parse, shifted by the number of lines the edit added or removed.
+        """
+        from tree_sitter import QueryCursor
+
+        edit = compute_edit(previous.source, source)
+        if edit is None:
+            self.metrics.incr("unchanged_reparses")
+            return previous.tree, previous.tags
+
+        old_tree = previous.tree
+        old_tree.edit(**edit.as_kwargs())
+        tree = parser.parse(source, old_tree)
+
+        start_byte, end_byte = requery_span(tree, source, edit, old_tree.changed_ranges(tree))
+        start_row = byte_to_point(source, start_byte)[0]
+        end_row = byte_to_point(source, end_byte)[0]
+        line_delta = edit.new_end_point[0] - edit.old_end_point[0]
+
+        qcursor = QueryCursor(query)
+        qcursor.set_byte_range(start_byte, end_byte)
+        region_tags = [
+            tag for tag in self._tags_from_matches(qcursor.matches(tree.root_node), source, rel_fname, fname)
+            if start_row < tag.line <= end_row + 1
+        ]
+
+        # Tag lines are 1-based; the region covers rows start_row..end_row
+        tags = [tag for tag in previous.tags if tag.line <= start_row]
+        tags.extend(region_tags)
+        tags.extend(
+            tag._replace(line=tag.line + line_delta)
+            for tag in previous.tags if tag.line > end_row + 1 - line_delta
+        )
+        self.metrics.incr("incremental_parses")
+        return tree, tags
+    
+    def get_skeleton(self, fname: str, rel_fname: str) -> Tuple[List[Tag], Set[str]]:
+        """Approximate definitions and referenced names of a file, without Tree-sitter.
+
+        Tags already in the tags cache are used as they are; otherwise
+        definitions come from the regex fallback patterns and every
+        identifier in the file counts as a reference. Scanned skeletons are
+        kept in memory and, once save_skeletons() runs, in the tags cache
+        entry of the file, so later requests (and RepoMap instances) only
+        scan files that changed.
+        """
+        file_mtime = self.get_mtime(fname)
+        if file_mtime is None:
+            return [], set()
+
+        cached_entry = self.skeleton_cache.get(fname)
+        if cached_entry and cached_entry["mtime"] == file_mtime:
+            return cached_entry["data"]
+
+        try:
+            cached_entry = self.TAGS_CACHE.get(fname)
+        except SQLITE_ERRORS:
+            self.tags_cache_error()
+            cached_entry = None
+
+        if cached_entry and cached_entry.get("mtime") == file_mtime and "data" in cached_entry:
+            tags = cached_entry["data"]
+            skeleton = (
+                [tag for tag in tags if tag.kind == "def"],
+                {tag.name for tag in tags if tag.kind == "ref"},
+            )
+        elif cached_entry and cached_entry.get("mtime") == file_mtime and "skeleton" in cached_entry:
+            skeleton = cached_entry["skeleton"]
+        else:
+            from grep_ast import filename_to_lang
+
+            lang = filename_to_lang(fname)
+            code = self.read_text_func_internal(fname) if lang else None
+            if code:
+                definitions = [
+                    Tag(rel_fname=rel_fname, fname=fname, line=line, name=name, kind=kind)
+                    for line, name, kind in regex_fallback.extract_tags(code, lang)
+                    if kind == "def"
+                ]
+                skeleton = (definitions, regex_fallback.identifiers(code))
+            else:
+                skeleton = ([], set())
+            self.metrics.incr("skeleton_scans")
+            self._pending_skeletons[fname] = {"mtime": file_mtime, "skeleton": skeleton}
+
+        if len(self.skeleton_cache) >= MAX_CACHED_SKELETONS:
+            self.skeleton_cache.clear()
+        self.skeleton_cache[fname] = {"mtime": file_mtime, "data": skeleton}
+        return skeleton
+
+    def save_skeletons(self):
+        """Write the skeletons scanned since the last call to the tags cache, in one transaction.
+
+        One write per file would commit a SQLite transaction per file, which
+        costs as much as scanning the files on a cold repository.
+        """
+        pending, self._pending_skeletons = self._pending_skeletons, {}
+        if not pending:
+            return
+        try:
+            if isinstance(self.TAGS_CACHE, dict):
+                self.TAGS_CACHE.update(pending)
+            else:
+                with self.TAGS_CACHE.transact():
+                    for fname, entry in pending.items():
+                        self.TAGS_CACHE[fname] = entry
+        except SQLITE_ERRORS:
+            self.tags_cache_error()
+
+    def _stream_scan_tags(self, fname: str, rel_fname: str, lang: str) -> List[Tag]:
+        """Tag a very large file with the regex fallback patterns, a chunk of lines at a time.
+
+        Memory stays bounded by the chunk size: overlong (e.g. minified)
+        lines are dropped and at most MAX_FILE_BYTES characters are read.
+        """
+        tags = []
+        line_offset = 0
+        chunk = []
+
+        def scan_chunk():
+            for line, name, kind in regex_fallback.extract_tags("".join(chunk), lang):
+                tags.append(Tag(rel_fname=rel_fname, fname=fname, line=line + line_offset, name=name, kind=kind))
+
+        try:
+            for line in iter_bounded_lines(fname, MAX_LINE_LENGTH, MAX_FILE_BYTES):
+                chunk.append(line)
+                if len(chunk) == STREAM_SCAN_CHUNK_LINES:
+                    scan_chunk()
+                    line_offset += len(chunk)
+                    chunk = []
+            scan_chunk()
+        except OSError as e:
+            self.output_handlers['warning'](f"Could not scan {rel_fname}: {e}")
+            return []
+        self.metrics.incr("stream_scans")
+        return tags
+
+    def _regex_fallback(self, code: Union[str, bytes], rel_fname: str, fname: str, lang: str) -> List[Tag]:
+        """Fallback to regex parsing when Tree-sitter fails."""
+        if isinstance(code, bytes):
+            code = code.decode("utf-8", errors="ignore")
+        tags = [
+            Tag(rel_fname=rel_fname, fname=fname, line=line, name=name, kind=kind)
+            for line, name, kind in regex_fallback.extract_tags(code, lang)
+        ]
         
         if tags:
             self.output_handlers['info'](f"Regex fallback found {len(tags)} tags in {rel_fname}")
@@ -400,9 +760,23 @@ class RepoMap:
         chat_fnames: List[str],
         other_fnames: List[str],
         mentioned_fnames: Optional[Set[str]] = None,
-        mentioned_idents: Optional[Set[str]] = None
+        mentioned_idents: Optional[Set[str]] = None,
+        max_map_tokens: Optional[int] = None
     ) -> Tuple[List[Tuple[float, Tag]], FileReport]:
-        """Get ranked tags using PageRank algorithm with file report."""
+        """Get ranked tags using PageRank algorithm with file report.
+
+        With skeleton_index, the graph is built from a cheap regex pass over
+        every file and only the best ranked files, enough to fill
+        max_map_tokens several times over, are parsed with Tree-sitter.
+        With lazy_parse, only files reachable from the chat and mentioned
+        files are parsed and ranked (see _lazy_candidates). With sharded,
+        files are ranked per package and combined (see rank_files_sharded).
+        With a tag store or a snapshot (and none of those modes), ranking
+        runs as set-based queries on the store or, for files the snapshot
+        holds unchanged, from its arrays (see _get_ranked_tags_from_snapshot).
+        With max_map_tokens, the result is a RankedTags that only orders the
+        definitions the budget could admit, sorting the rest if they are read.
+        """
         # Return empty list and empty report if no files
         if not chat_fnames and not other_fnames:
             return [], FileReport(excluded={}, definition_matches=0, reference_matches=0, total_files_considered=0)
@@ -423,7 +797,29 @@ class RepoMap:
         
         chat_fnames = [normalize_path(f) for f in chat_fnames]
         other_fnames = [normalize_path(f) for f in other_fnames]
-        
+
+        if self.tag_store is not None and not (self.skeleton_index or self.lazy_parse or self.sharded):
+            try:
+                return self._get_ranked_tags_from_store(
+                    chat_fnames, other_fnames, mentioned_fnames, mentioned_idents,
+                    self.top_tags_limit(max_map_tokens)
+                )
+            except SQLITE_ERRORS as e:
+                self.output_handlers['warning'](f"Tag store query failed, falling back to in-memory ranking: {e}")
+                self.drop_tag_store()
+
+        if self.snapshot is not None and not (self.skeleton_index or self.lazy_parse or self.sharded):
+            return self._get_ranked_tags_from_snapshot(
+                chat_fnames, other_fnames, mentioned_fnames, mentioned_idents,
+                self.top_tags_limit(max_map_tokens)
+            )
+
+        misses_before = self.metrics.counters["tags_cache_misses"]
+        if self.lazy_parse:
+            other_fnames = self._lazy_candidates(
+                chat_fnames, other_fnames, mentioned_fnames, mentioned_idents, max_map_tokens
+            )
+
         # Initialize file report
         included: List[str] = []
         excluded: Dict[str, str] = {}
@@ -436,43 +832,287 @@ class RepoMap:
         references = defaultdict(set)
         definitions = defaultdict(set)
         
+        skeleton_names: Dict[str, Set[str]] = {}
+        
         personalization = {}
         chat_rel_fnames = set(self.get_rel_fname(f) for f in chat_fnames)
         
         all_fnames = list(set(chat_fnames + other_fnames))
         
-        for fname in all_fnames:
-            rel_fname = self.get_rel_fname(fname)
-            
-            if not os.path.exists(fname):
-                reason = "File not found"
-                excluded[fname] = reason
-                self.output_handlers['warning'](f"Repo-map can't include {fname}: {reason}")
-                continue
+        with self.metrics.phase("tags"):
+            for i, fname in enumerate(all_fnames):
+                if i % MEMORY_CHECK_EVERY == 0:
+                    self.metrics.check_memory()
+                rel_fname = self.get_rel_fname(fname)
                 
-            included.append(fname)
-            
-            tags = self.get_tags(fname, rel_fname)
+                if not os.path.exists(fname):
+                    reason = "File not found"
+                    excluded[fname] = reason
+                    self.output_handlers['warning'](f"Repo-map can't include {fname}: {reason}")
+                    continue
+                    
+                included.append(fname)
+                
+                if self.skeleton_index:
+                    skeleton_defs, skeleton_refs = self.get_skeleton(fname, rel_fname)
+                    for tag in skeleton_defs:
+                        defines[tag.name].add(rel_fname)
+                        definitions[rel_fname].add(tag.name)
+                    total_definitions += len(skeleton_defs)
+                    skeleton_names[rel_fname] = skeleton_refs
+                else:
+                    tags = self.get_tags(fname, rel_fname)
+                    
+                    for tag in tags:
+                        if tag.kind == "def":
+                            defines[tag.name].add(rel_fname)
+                            definitions[rel_fname].add(tag.name)
+                            total_definitions += 1
+                        elif tag.kind == "ref":
+                            references[tag.name].add(rel_fname)
+                            total_references += 1
+                
+                # Set personalization for chat files
+                if fname in chat_fnames:
+                    personalization[rel_fname] = 100.0
             
-            for tag in tags:
-                if tag.kind == "def":
-                    defines[tag.name].add(rel_fname)
-                    definitions[rel_fname].add(tag.name)
-                    total_definitions += 1
-                elif tag.kind == "ref":
-                    references[tag.name].add(rel_fname)
+            # Skeleton references are every word of a file; keep the names
+            # defined elsewhere (a file mentions all of its own definitions)
+            for rel_fname, names in skeleton_names.items():
+                for name in (names & defines.keys()) - definitions[rel_fname]:
+                    references[name].add(rel_fname)
                     total_references += 1
+            self.save_skeletons()
+        
+        files_parsed = self.metrics.counters["tags_cache_misses"] - misses_before
+        self.metrics.set("files_parsed", files_parsed)
+        self.metrics.set("files_reused", len(included) - files_parsed)
+        
+        rel_fnames = [self.get_rel_fname(fname) for fname in all_fnames]
+        if self.sharded:
+            with self.metrics.phase("pagerank"):
+                ranks = self.rank_files_sharded(rel_fnames, defines, references, personalization)
+        else:
+            with self.metrics.phase("graph"):
+                G = self.build_reference_graph(rel_fnames, defines, references)
+            
+            if not G.nodes():
+                return [], file_report
             
-            # Set personalization for chat files
-            if fname in chat_fnames:
-                personalization[rel_fname] = 100.0
+            with self.metrics.phase("pagerank"):
+                ranks = self.rank_files(G, personalization)
+        
+        # Update excluded dictionary with status information
+        for fname in set(chat_fnames + other_fnames):
+            if fname in excluded:
+                # Add status prefix to existing exclusion reason
+                excluded[fname] = f"[EXCLUDED] {excluded[fname]}"
+            elif fname not in included:
+                excluded[fname] = "[NOT PROCESSED] File not included in final processing"
+        
+        # Create file report
+        file_report = FileReport(
+            excluded=excluded,
+            definition_matches=total_definitions,
+            reference_matches=total_references,
+            total_files_considered=len(all_fnames)
+        )
+        
+        # Collect and rank tags
+        def_tags: List[Tag] = []
+        full_parse_fnames = None
+        if self.skeleton_index:
+            with self.metrics.phase("tags"):
+                full_parse_fnames = self._select_full_parse_files(
+                    included, ranks, definitions, chat_rel_fnames, max_map_tokens
+                )
         
-        # Build graph
+        with self.metrics.phase("rank_tags"):
+            # (rel_fname, file rank, number of its definitions in def_tags)
+            file_groups: List[Tuple[str, float, int]] = []
+            for fname in included:
+                rel_fname = self.get_rel_fname(fname)
+                file_rank = ranks.get(rel_fname, 0.0)
+
+                # Exclude files with low Page Rank if exclude_unranked is True
+                if self.exclude_unranked and file_rank <= 0.0001:  # Use a small threshold to exclude near-zero ranks
+                    continue
+                
+                if full_parse_fnames is None or fname in full_parse_fnames:
+                    tags = self.get_tags(fname, rel_fname)
+                else:
+                    tags = self.get_skeleton(fname, rel_fname)[0]
+                tags_before = len(def_tags)
+                def_tags.extend(tag for tag in tags if tag.kind == "def")
+                file_groups.append((rel_fname, file_rank, len(def_tags) - tags_before))
+            self.save_skeletons()
+
+            ranked_tags = self._rank_definitions(
+                def_tags, file_groups, chat_rel_fnames, mentioned_fnames, mentioned_idents,
+                self.top_tags_limit(max_map_tokens)
+            )
+
+        return ranked_tags, file_report
+
+    def top_tags_limit(self, max_map_tokens: Optional[int]) -> Optional[int]:
+        """Number of top ranked definitions to order for a map of max_map_tokens, None for all."""
+        if max_map_tokens is None or self.rollup:
+            # Rollups aggregate every definition
+            return None
+        return -(-max_map_tokens * TOP_TAGS_FACTOR // TOKENS_PER_TAG_ESTIMATE)
+
+    def _rank_definitions(
+        self,
+        def_tags: List[Tag],
+        file_groups: List[Tuple[str, float, int]],
+        chat_rel_fnames: Set[str],
+        mentioned_fnames: Set[str],
+        mentioned_idents: Set[str],
+        limit: Optional[int]
+    ) -> "RankedTags":
+        """Rank definition tags stored file by file, as (rel_fname, file rank, count) groups.
+
+        A definition ranks as its file, boosted x10 for a mentioned identifier,
+        x5 in a mentioned file and x20 in a chat file. The boosts are computed
+        per file and per tag as arrays; only the top limit are ordered.
+        """
+        import numpy as np
+        from ranked_tags import RankedTags
+
+        file_boosts = np.ones(len(file_groups))
+        file_ranks = np.empty(len(file_groups))
+        counts = np.empty(len(file_groups), dtype=np.int64)
+        for i, (rel_fname, file_rank, count) in enumerate(file_groups):
+            if rel_fname in mentioned_fnames:
+                file_boosts[i] *= 5.0
+            if rel_fname in chat_rel_fnames:
+                file_boosts[i] *= 20.0
+            file_ranks[i] = file_rank
+            counts[i] = count
+
+        # Products of the boosts are exact, so ranks equal rank * boost computed per tag
+        boost = np.repeat(file_boosts, counts)
+        if mentioned_idents:
+            boost[np.fromiter((tag.name in mentioned_idents for tag in def_tags), bool, len(def_tags))] *= 10.0
+        tag_ranks = np.repeat(file_ranks, counts) * boost
+        self.metrics.set("ranked_definitions", len(def_tags))
+        return RankedTags(tag_ranks, np.arange(len(def_tags)), def_tags.__getitem__, limit)
+
+    def _lazy_candidates(
+        self,
+        chat_fnames: List[str],
+        other_fnames: List[str],
+        mentioned_fnames: Set[str],
+        mentioned_idents: Set[str],
+        max_map_tokens: Optional[int]
+    ) -> List[str]:
+        """Other files worth ranking, found by parsing outward from the chat and mentioned files.
+
+        A name index built from skeleton definitions tells which files
+        define the identifiers a parsed file references. Files are parsed
+        breadth first along it, the ones referenced most often first, until
+        the parsed definitions could fill SKELETON_FULL_PARSE_FACTOR times
+        the token budget. Without chat or mentioned files nothing is skipped.
+        """
+        chat_set = set(chat_fnames)
+        other_fnames = [fname for fname in other_fnames if fname not in chat_set]
+        rel_fnames = {fname: self.get_rel_fname(fname) for fname in chat_fnames + other_fnames}
+
+        with self.metrics.phase("name_index"):
+            name_index: Dict[str, Set[str]] = defaultdict(set)
+            for i, fname in enumerate(other_fnames):
+                if i % MEMORY_CHECK_EVERY == 0:
+                    self.metrics.check_memory()
+                if not os.path.exists(fname):
+                    continue
+                for tag in self.get_skeleton(fname, rel_fnames[fname])[0]:
+                    name_index[tag.name].add(fname)
+            self.save_skeletons()
+
+        frontier = [fname for fname in chat_fnames if os.path.exists(fname)]
+        frontier += [fname for fname in other_fnames if rel_fnames[fname] in mentioned_fnames]
+        for name in mentioned_idents:
+            frontier.extend(name_index.get(name, ()))
+        if not frontier:
+            return other_fnames
+
+        budget = (max_map_tokens or self.max_map_tokens) * SKELETON_FULL_PARSE_FACTOR
+        seen = set(frontier)
+        candidates = []
+        estimated_tokens = 0
+        with self.metrics.phase("tags"):
+            while frontier and estimated_tokens < budget:
+                referenced = defaultdict(int)
+                for fname in frontier:
+                    if estimated_tokens >= budget:
+                        break
+                    if fname not in chat_set:
+                        candidates.append(fname)
+                    tags = self.get_tags(fname, rel_fnames[fname])
+                    definitions = sum(1 for tag in tags if tag.kind == "def")
+                    estimated_tokens += max(1, definitions) * SKELETON_TOKENS_PER_DEF
+                    for tag in tags:
+                        if tag.kind != "ref":
+                            continue
+                        for def_fname in name_index.get(tag.name, ()):
+                            if def_fname not in seen:
+                                referenced[def_fname] += 1
+                frontier = sorted(referenced, key=referenced.get, reverse=True)
+                seen.update(frontier)
+
+        self.metrics.set("files_skipped", len(other_fnames) - len(candidates))
+        return candidates
+
+    def _select_full_parse_files(
+        self,
+        included: List[str],
+        ranks: Dict[str, float],
+        definitions: Dict[str, Set[str]],
+        chat_rel_fnames: Set[str],
+        max_map_tokens: Optional[int]
+    ) -> Set[str]:
+        """Pick the skeleton-indexed files worth parsing with Tree-sitter.
+
+        Chat files and then files in rank order are taken until their
+        approximate definitions could fill SKELETON_FULL_PARSE_FACTOR times
+        the token budget; the rest of the map keeps its skeleton tags.
+        """
+        budget = (max_map_tokens or self.max_map_tokens) * SKELETON_FULL_PARSE_FACTOR
+        rel_fnames = {fname: self.get_rel_fname(fname) for fname in included}
+        by_rank = sorted(
+            included,
+            key=lambda fname: (rel_fnames[fname] not in chat_rel_fnames, -ranks.get(rel_fnames[fname], 0.0)),
+        )
+        selected = set()
+        estimated_tokens = 0
+        for fname in by_rank:
+            if estimated_tokens >= budget:
+                break
+            selected.add(fname)
+            estimated_tokens += max(1, len(definitions.get(rel_fnames[fname], ()))) * SKELETON_TOKENS_PER_DEF
+        
+        misses_before = self.metrics.counters["tags_cache_misses"]
+        for fname in selected:
+            self.get_tags(fname, rel_fnames[fname])
+        files_parsed = self.metrics.counters["tags_cache_misses"] - misses_before
+        self.metrics.set("files_parsed", files_parsed)
+        self.metrics.set("files_reused", len(selected) - files_parsed)
+        self.metrics.set("skeleton_only_files", len(included) - len(selected))
+        return selected
+
+    def build_reference_graph(
+        self,
+        rel_fnames: List[str],
+        defines: Dict[str, Set[str]],
+        references: Dict[str, Set[str]]
+    ) -> "nx.MultiDiGraph":
+        """Build the file graph with one edge per identifier a file references and another defines."""
+        import networkx as nx
+
         G = nx.MultiDiGraph()
         
         # Add nodes
-        for fname in all_fnames:
-            rel_fname = self.get_rel_fname(fname)
+        for rel_fname in rel_fnames:
             G.add_node(rel_fname)
         
         # Add edges based on references
@@ -483,73 +1123,344 @@ class RepoMap:
                     if ref_fname != def_fname:
                         G.add_edge(ref_fname, def_fname, name=name)
         
-        if not G.nodes():
-            return [], file_report
-        
-        # Run PageRank
+        return G
+    
+    def rank_files(self, G: "nx.Graph", personalization: Dict[str, float]) -> Dict[str, float]:
+        """Run PageRank over the file graph, personalized towards chat files.
+
+        Personalized ranks of large graphs are approximated by forward push
+        (see local_pagerank.py), which only visits the chat files' neighbourhood.
+        """
+        import networkx as nx
+
         try:
-            ranks = nx.pagerank(G, personalization=personalization if personalization else None, alpha=0.85)
+            if personalization and len(G) >= PUSH_MIN_NODES:
+                ranks = self._push_rank(graph_successors(G), personalization, max_work=G.number_of_edges())
+                if ranks is not None:
+                    return ranks
+            return nx.pagerank(G, personalization=personalization if personalization else None, alpha=0.85)
         except Exception as e:
             self.output_handlers['error'](f"Error running PageRank: {e}")
             # Fallback to uniform ranking
-            ranks = {node: 1.0 for node in G.nodes()}
-        
-        # Update excluded dictionary with status information
-        for fname in set(chat_fnames + other_fnames):
-            if fname in excluded:
-                # Add status prefix to existing exclusion reason
-                excluded[fname] = f"[EXCLUDED] {excluded[fname]}"
-            elif fname not in included:
-                excluded[fname] = "[NOT PROCESSED] File not included in final processing"
-        
-        # Create file report
+            return {node: 1.0 for node in G.nodes()}
+
+    def _push_rank(self, successors, personalization: Dict[Any, float], max_work: int) -> Optional[Dict[Any, float]]:
+        """push_pagerank, counted in the request metrics; None if it gave up."""
+        ranks = push_pagerank(successors, personalization, alpha=0.85, max_work=max_work)
+        if ranks is None:
+            self.metrics.incr("push_pagerank_fallbacks")
+        else:
+            self.metrics.incr("push_pagerank")
+            self.metrics.incr("push_pagerank_nodes", len(ranks))
+        return ranks
+    
+    def rank_files_sharded(
+        self,
+        rel_fnames: List[str],
+        defines: Dict[str, Set[str]],
+        references: Dict[str, Set[str]],
+        personalization: Dict[str, float]
+    ) -> Dict[str, float]:
+        """Rank files per package shard and combine through cross-package references (see sharding.py)."""
+        ranks, counters = rank_sharded(
+            rel_fnames, defines, references, personalization,
+            shard_of=ShardResolver(self.root).shard_of,
+            rank_graph=self.rank_files,
+            cache=SHARD_RANK_CACHE,
+        )
+        for name, value in counters.items():
+            self.metrics.incr(name, value)
+        return ranks
+
+    def _get_ranked_tags_from_store(
+        self,
+        chat_fnames: List[str],
+        other_fnames: List[str],
+        mentioned_fnames: Set[str],
+        mentioned_idents: Set[str],
+        limit: Optional[int] = None
+    ) -> Tuple[List[Tuple[float, Tag]], FileReport]:
+        """Rank tags with set-based queries against the relational tag store.
+
+        Only files whose stored mtime is stale are parsed and written; the
+        graph is built from aggregated file-pair weights and only definition
+        rows of ranked files are loaded for rendering.
+        """
+        import networkx as nx
+
+        excluded: Dict[str, str] = {}
+        included: List[str] = []
+        all_fnames = list(set(chat_fnames + other_fnames))
+        chat_rel_fnames = set(self.get_rel_fname(f) for f in chat_fnames)
+        stored_mtimes = self.tag_store.get_mtimes()
+        stale = []
+
+        for fname in all_fnames:
+            if not os.path.exists(fname):
+                reason = "File not found"
+                excluded[fname] = reason
+                self.output_handlers['warning'](f"Repo-map can't include {fname}: {reason}")
+                continue
+            included.append(fname)
+            file_mtime = self.get_mtime(fname)
+            if stored_mtimes.get(fname) != file_mtime:
+                stale.append((fname, file_mtime))
+
+        def stale_entries():
+            for fname, file_mtime in stale:
+                rel_fname = self.get_rel_fname(fname)
+                yield fname, rel_fname, file_mtime, self.get_tags(fname, rel_fname)
+
+        misses_before = self.metrics.counters["tags_cache_misses"]
+        if stale:
+            self.output_handlers['debug'](f"Updating tag store with {len(stale)} changed files")
+            with self.metrics.phase("tags"):
+                self.tag_store.update_files(stale_entries())
+        files_parsed = self.metrics.counters["tags_cache_misses"] - misses_before
+        self.metrics.set("files_parsed", files_parsed)
+        self.metrics.set("files_reused", len(included) - files_parsed)
+
+        with self.tag_store.selection(included) as store:
+            with self.metrics.phase("graph"):
+                total_definitions, total_references = store.count_occurrences()
+
+                G = nx.DiGraph()
+                for fname in all_fnames:
+                    G.add_node(self.get_rel_fname(fname))
+                for ref_fname, def_fname, weight in store.edge_weights():
+                    G.add_edge(ref_fname, def_fname, weight=weight)
+
+            personalization = {rel_fname: 100.0 for rel_fname in chat_rel_fnames if rel_fname in G}
+            with self.metrics.phase("pagerank"):
+                ranks = self.rank_files(G, personalization)
+
+            ranked_rel_fnames = set(self.get_rel_fname(f) for f in included)
+            if self.exclude_unranked:
+                ranked_rel_fnames = {f for f in ranked_rel_fnames if ranks.get(f, 0.0) > 0.0001}
+
+            def_tags: List[Tag] = []
+            file_groups: List[Tuple[str, float, int]] = []
+            with self.metrics.phase("rank_tags"):
+                # Definitions come file by file
+                for rel_fname, tags in groupby(store.iter_definitions(ranked_rel_fnames), key=lambda tag: tag.rel_fname):
+                    tags_before = len(def_tags)
+                    def_tags.extend(tags)
+                    file_groups.append((rel_fname, ranks.get(rel_fname, 0.0), len(def_tags) - tags_before))
+
+        for fname in excluded:
+            excluded[fname] = f"[EXCLUDED] {excluded[fname]}"
+
         file_report = FileReport(
             excluded=excluded,
             definition_matches=total_definitions,
             reference_matches=total_references,
             total_files_considered=len(all_fnames)
         )
-        
-        # Collect and rank tags
-        ranked_tags = []
-        
-        for fname in included:
-            rel_fname = self.get_rel_fname(fname)
-            file_rank = ranks.get(rel_fname, 0.0)
 
-            # Exclude files with low Page Rank if exclude_unranked is True
-            if self.exclude_unranked and file_rank <= 0.0001:  # Use a small threshold to exclude near-zero ranks
+        with self.metrics.phase("rank_tags"):
+            ranked_tags = self._rank_definitions(
+                def_tags, file_groups, chat_rel_fnames, mentioned_fnames, mentioned_idents, limit
+            )
+        return ranked_tags, file_report
+
+    def split_snapshot_files(self, fnames: List[str]) -> Tuple[Dict[str, int], List[str], List[str]]:
+        """Split files by their state in the snapshot.
+
+        Returns the files the snapshot holds unchanged (with their snapshot
+        index), the files changed or added since it was built, whose tags are
+        loaded as usual, and the files that do not exist.
+        """
+        file_indices = self.snapshot.file_indices()
+        mtimes = self.snapshot.arrays["file_mtimes"]
+        # Paths are resolved, so files under the root start with it
+        root_prefix = os.path.join(str(self.root), "")
+        current: Dict[str, int] = {}
+        changed: List[str] = []
+        missing: List[str] = []
+        for fname in fnames:
+            try:
+                file_mtime = os.path.getmtime(fname)
+            except OSError:
+                missing.append(fname)
                 continue
-            
-            tags = self.get_tags(fname, rel_fname)
-            for tag in tags:
-                if tag.kind == "def":
-                    # Boost for mentioned identifiers
-                    boost = 1.0
-                    if tag.name in mentioned_idents:
-                        boost *= 10.0
-                    if rel_fname in mentioned_fnames:
-                        boost *= 5.0
-                    if rel_fname in chat_rel_fnames:
-                        boost *= 20.0
-                    
-                    final_rank = file_rank * boost
-                    ranked_tags.append((final_rank, tag))
-        
-        # Sort by rank (descending)
-        ranked_tags.sort(key=lambda x: x[0], reverse=True)
-        
+            rel_fname = fname[len(root_prefix):] if fname.startswith(root_prefix) else self.get_rel_fname(fname)
+            index = file_indices.get(rel_fname)
+            if index is not None and mtimes[index] == file_mtime:
+                current[fname] = index
+            else:
+                changed.append(fname)
+        return current, changed, missing
+
+    def _get_ranked_tags_from_snapshot(
+        self,
+        chat_fnames: List[str],
+        other_fnames: List[str],
+        mentioned_fnames: Set[str],
+        mentioned_idents: Set[str],
+        limit: Optional[int] = None
+    ) -> Tuple[List[Tuple[float, Tag]], FileReport]:
+        """Rank tags from the arrays of the snapshot.
+
+        Only files changed since the snapshot was built have their tags
+        loaded; the graph is built and ranked with array operations (reusing
+        the stored graph and ranks when they apply), and Tags are created
+        only for the part of the ranking that is rendered.
+        """
+        import numpy as np
+        from ranked_tags import RankedTags
+        from snapshot import KIND_CODES, pagerank_csr, reference_graph
+
+        snapshot = self.snapshot
+        all_fnames = sorted(set(chat_fnames + other_fnames))
+        chat_rel_fnames = set(self.get_rel_fname(f) for f in chat_fnames)
+        excluded: Dict[str, str] = {}
+
+        misses_before = self.metrics.counters["tags_cache_misses"]
+        with self.metrics.phase("tags"):
+            current, changed, missing = self.split_snapshot_files(all_fnames)
+            for fname in missing:
+                excluded[fname] = "[EXCLUDED] File not found"
+                self.output_handlers['warning'](f"Repo-map can't include {fname}: File not found")
+
+            # Nodes are the current files in snapshot order, then the changed files,
+            # then missing files (which build_reference_graph keeps as nodes too)
+            file_indices = np.sort(np.fromiter(current.values(), dtype=np.int64, count=len(current)))
+            node_of_file = np.full(snapshot.num_files, -1, dtype=np.int64)
+            node_of_file[file_indices] = np.arange(len(file_indices))
+            occurrences = np.flatnonzero(node_of_file[snapshot.arrays["occ_file"]] >= 0)
+
+            changed_nodes: Dict[str, int] = {}
+            changed_tags: List[Tag] = []
+            changed_columns: List[Tuple[int, int, int]] = []
+            symbol_ids = snapshot.symbol_ids() if changed else {}
+            new_symbol_ids: Dict[str, int] = {}
+            for node, fname in enumerate(changed, len(file_indices)):
+                if node % MEMORY_CHECK_EVERY == 0:
+                    self.metrics.check_memory()
+                rel_fname = self.get_rel_fname(fname)
+                changed_nodes[rel_fname] = node
+                for tag in self.get_tags(fname, rel_fname):
+                    if tag.kind not in KIND_CODES:
+                        continue
+                    symbol = symbol_ids.get(tag.name)
+                    if symbol is None:
+                        symbol = new_symbol_ids.setdefault(tag.name, snapshot.num_symbols + len(new_symbol_ids))
+                    changed_tags.append(tag)
+                    changed_columns.append((node, symbol, KIND_CODES[tag.kind]))
+
+            changed_array = np.array(changed_columns, dtype=np.int64).reshape(-1, 3)
+            occ_node = np.concatenate([node_of_file[snapshot.arrays["occ_file"][occurrences]], changed_array[:, 0]])
+            occ_symbol = np.concatenate([snapshot.arrays["occ_symbol"][occurrences], changed_array[:, 1]])
+            occ_kind = np.concatenate([snapshot.arrays["occ_kind"][occurrences], changed_array[:, 2]])
+
+        files_parsed = self.metrics.counters["tags_cache_misses"] - misses_before
+        self.metrics.set("files_parsed", files_parsed)
+        self.metrics.set("files_reused", len(current) + len(changed) - files_parsed)
+        self.metrics.set("snapshot_files", len(current))
+
+        is_def = occ_kind == KIND_CODES["def"]
+        total_definitions = int(is_def.sum())
+        file_report = FileReport(
+            excluded=excluded,
+            definition_matches=total_definitions,
+            reference_matches=len(occ_kind) - total_definitions,
+            total_files_considered=len(all_fnames)
+        )
+        num_nodes = len(file_indices) + len(changed) + len(missing)
+        if not num_nodes:
+            return [], file_report
+
+        def node_mask(rel_fnames):
+            mask = np.zeros(num_nodes, dtype=bool)
+            for rel_fname in rel_fnames:
+                index = snapshot.file_indices().get(rel_fname)
+                if index is not None and node_of_file[index] >= 0:
+                    mask[node_of_file[index]] = True
+                elif rel_fname in changed_nodes:
+                    mask[changed_nodes[rel_fname]] = True
+            return mask
+
+        chat_mask = node_mask(chat_rel_fnames)
+        whole_snapshot = not changed and not missing and len(file_indices) == snapshot.num_files
+        with self.metrics.phase("graph"):
+            if whole_snapshot:
+                graph = (snapshot.arrays["graph_indptr"], snapshot.arrays["graph_indices"], snapshot.arrays["graph_weights"])
+            else:
+                graph = reference_graph(occ_node, occ_symbol, occ_kind, num_nodes)
+
+        with self.metrics.phase("pagerank"):
+            if whole_snapshot and not chat_mask.any():
+                ranks = snapshot.arrays["ranks"]
+            else:
+                try:
+                    ranks = None
+                    if chat_mask.any() and num_nodes >= PUSH_CSR_MIN_NODES:
+                        pushed = self._push_rank(
+                            csr_successors(*graph),
+                            {int(node): 100.0 for node in np.flatnonzero(chat_mask)},
+                            max_work=len(graph[1]) // PUSH_CSR_EDGE_COST,
+                        )
+                        if pushed is not None:
+                            ranks = np.zeros(num_nodes)
+                            ranks[list(pushed)] = list(pushed.values())
+                    if ranks is None:
+                        ranks = pagerank_csr(*graph, personalization=chat_mask * 100.0 if chat_mask.any() else None)
+                except Exception as e:
+                    self.output_handlers['error'](f"Error running PageRank: {e}")
+                    # Fallback to uniform ranking
+                    ranks = np.ones(num_nodes)
+
+        with self.metrics.phase("rank_tags"):
+            keep = is_def
+            if self.exclude_unranked:
+                keep = keep & (ranks[occ_node] > 0.0001)
+            positions = np.flatnonzero(keep)
+            def_nodes = occ_node[positions]
+
+            # Same boosts as get_ranked_tags, applied to every definition at once
+            boost = np.ones(len(positions))
+            if mentioned_idents:
+                all_symbol_ids = snapshot.symbol_ids()
+                ident_ids = [all_symbol_ids.get(name, new_symbol_ids.get(name, -1)) for name in mentioned_idents]
+                boost[np.isin(occ_symbol[positions], ident_ids)] *= 10.0
+            if mentioned_fnames:
+                boost[node_mask(mentioned_fnames)[def_nodes]] *= 5.0
+            if chat_mask.any():
+                boost[chat_mask[def_nodes]] *= 20.0
+            tag_ranks = ranks[def_nodes] * boost
+
+        num_current = len(occurrences)
+
+        def make_tag(position: int) -> Tag:
+            if position < num_current:
+                return snapshot.occurrence_tag(int(occurrences[position]))
+            return changed_tags[position - num_current]
+
+        with self.metrics.phase("rank_tags"):
+            ranked_tags = RankedTags(tag_ranks, positions, make_tag, limit)
         return ranked_tags, file_report
-    
+
     def render_tree(self, abs_fname: str, rel_fname: str, lois: List[int]) -> str:
         """Render a code snippet with specific lines of interest."""
+        try:
+            size = os.path.getsize(abs_fname)
+        except OSError:
+            size = 0
+        if size > STREAM_SCAN_BYTES:
+            return self._render_lines_streaming(abs_fname, rel_fname, lois)
+
         code = self.read_text_func_internal(abs_fname)
         if not code:
             return ""
         
+        from grep_ast import TreeContext
+
         # Use TreeContext for rendering
         try:
-            if rel_fname not in self.tree_context_cache:
+            if rel_fname in self.tree_context_cache:
+                self.metrics.incr("tree_context_cache_hits")
+            else:
+                self.metrics.incr("tree_context_cache_misses")
                 self.tree_context_cache[rel_fname] = TreeContext(
                     rel_fname,
                     code,
@@ -569,6 +1480,36 @@ class RepoMap:
             
             return "\n".join(result_lines)
     
+    def _render_lines_streaming(self, abs_fname: str, rel_fname: str, lois: List[int]) -> str:
+        """Render only the lines of interest of a very large file, without reading it whole."""
+        wanted = set(lois)
+        last = max(wanted, default=0)
+        result_lines = [f"{rel_fname}:"]
+        try:
+            for line_num, line in enumerate(iter_bounded_lines(abs_fname, MAX_LINE_LENGTH, MAX_FILE_BYTES), 1):
+                if line_num > last:
+                    break
+                if line_num in wanted:
+                    result_lines.append(f"{line_num:4d}: {line.rstrip()}")
+        except OSError as e:
+            self.output_handlers['warning'](f"Could not render {rel_fname}: {e}")
+            return ""
+        return "\n".join(result_lines)
+
+    def _render_fragments(self, rel_fname: str, lois: List[int]) -> Optional[str]:
+        """render_tree output assembled from stored fragments; None if some line is not stored."""
+        fragments = self.get_fragments(rel_fname)
+        if fragments is None:
+            return None
+        lines = fragments["lines"]
+        result_lines = [f"{rel_fname}:"]
+        for loi in sorted(set(lois)):
+            if loi in lines:
+                result_lines.append(lines[loi][0])
+            elif 1 <= loi <= fragments["num_lines"]:
+                return None
+        return "\n".join(result_lines)
+
     def to_tree(self, tags: List[Tuple[float, Tag]], chat_rel_fnames: Set[str]) -> str:
         """Convert ranked tags to formatted tree output."""
         if not tags:
@@ -598,8 +1539,13 @@ class RepoMap:
             # Get the max rank for the file
             max_rank = max(rank for rank, tag in file_tag_list)
             
-            # Render the tree for this file
-            rendered = self.render_tree(abs_fname, rel_fname, lois)
+            # Render the tree for this file, from stored fragments when possible
+            rendered = self._render_fragments(rel_fname, lois)
+            if rendered is None:
+                self.metrics.incr("source_renders")
+                rendered = self.render_tree(abs_fname, rel_fname, lois)
+            else:
+                self.metrics.incr("fragment_renders")
             if rendered:
                 # Add rank value to the output
                 rendered_lines = rendered.splitlines()
@@ -633,8 +1579,10 @@ class RepoMap:
         )
         
         if not force_refresh and cache_key in self.map_cache:
+            self.metrics.incr("map_cache_hits")
             return self.map_cache[cache_key]
         
+        self.metrics.incr("map_cache_misses")
         result = self.get_ranked_tags_map_uncached(
             chat_fnames, other_fnames, max_map_tokens,
             mentioned_fnames, mentioned_idents
@@ -653,8 +1601,9 @@ class RepoMap:
     ) -> Tuple[Optional[str], FileReport]:
         """Generate the ranked tags map without caching."""
         ranked_tags, file_report = self.get_ranked_tags(
-            chat_fnames, other_fnames, mentioned_fnames, mentioned_idents
+            chat_fnames, other_fnames, mentioned_fnames, mentioned_idents, max_map_tokens
         )
+        self.last_ranked_tags = ranked_tags
         
         if not ranked_tags:
             return None, file_report
@@ -664,38 +1613,219 @@ class RepoMap:
             [self.get_rel_fname(f) for f in other_fnames]
         )
         
-        # Binary search to find the right number of tags
         chat_rel_fnames = set(self.get_rel_fname(f) for f in chat_fnames)
+        if self.rollup:
+            best_tree = self.fit_rollup_to_budget(ranked_tags, max_map_tokens)
+        else:
+            best_tree = self.fit_tags_to_budget(ranked_tags, chat_rel_fnames, max_map_tokens)
         
+        return best_tree, file_report
+    
+    def fit_tags_to_budget(
+        self,
+        ranked_tags: List[Tuple[float, Tag]],
+        chat_rel_fnames: Set[str],
+        max_map_tokens: int
+    ) -> Optional[str]:
+        """Binary search for the largest prefix of ranked tags that fits the token budget."""
         def try_tags(num_tags: int) -> Tuple[Optional[str], int]:
             if num_tags <= 0:
                 return None, 0
             
             selected_tags = ranked_tags[:num_tags]
-            tree_output = self.to_tree(selected_tags, chat_rel_fnames)
+            with self.metrics.phase("render"):
+                tree_output = self.to_tree(selected_tags, chat_rel_fnames)
             
             if not tree_output:
                 return None, 0
             
-            tokens = self.token_count(tree_output)
+            with self.metrics.phase("token_count"):
+                tokens = self.token_count(tree_output)
             return tree_output, tokens
         
         # Binary search for optimal number of tags
         left, right = 0, len(ranked_tags)
         best_tree = None
         
-        while left <= right:
-            mid = (left + right) // 2
-            tree_output, tokens = try_tags(mid)
-            
-            if tree_output and tokens <= max_map_tokens:
-                best_tree = tree_output
-                left = mid + 1
-            else:
-                right = mid - 1
-        
-        return best_tree, file_report
+        with self.metrics.phase("fitting"):
+            # Narrow the search with the precomputed fragment costs; each
+            # bound is checked by a real render, so the result is unchanged
+            low, high = self._estimated_fit_bounds(ranked_tags, max_map_tokens)
+            if low:
+                self.metrics.incr("binary_search_iterations")
+                tree_output, tokens = try_tags(low)
+                if tree_output and tokens <= max_map_tokens:
+                    best_tree = tree_output
+                    left = low + 1
+            if high is not None:
+                self.metrics.incr("binary_search_iterations")
+                tree_output, tokens = try_tags(high)
+                if not tree_output or tokens > max_map_tokens:
+                    right = high - 1
+
+            # A RankedTags has only its top candidates ordered: search among them
+            # first, and order the rest only if every candidate fits
+            ordered = getattr(ranked_tags, "num_ordered", right)
+            while True:
+                upper = min(right, ordered)
+                while left <= upper:
+                    mid = (left + upper) // 2
+                    self.metrics.incr("binary_search_iterations")
+                    tree_output, tokens = try_tags(mid)
+
+                    if tree_output and tokens <= max_map_tokens:
+                        best_tree = tree_output
+                        left = mid + 1
+                    else:
+                        upper = right = mid - 1
+                if left > right:
+                    break
+                self.metrics.incr("top_tags_exhausted")
+                ordered = right
+        
+        return best_tree
     
+    def _estimated_fit_bounds(
+        self, ranked_tags: List[Tuple[float, Tag]], max_map_tokens: int
+    ) -> Tuple[int, Optional[int]]:
+        """Prefix lengths whose fragment cost is just under and just over the budget.
+
+        Returns (low, high): the longest prefix estimated within
+        (1 - FIT_ESTIMATE_SLACK) of the budget, and the shortest estimated
+        over (1 + FIT_ESTIMATE_SLACK) of it, or None when the stored
+        fragments run out before that.
+        """
+        low_tokens = max_map_tokens * (1 - FIT_ESTIMATE_SLACK)
+        high_tokens = max_map_tokens * (1 + FIT_ESTIMATE_SLACK)
+        low = 0
+        total = 0
+        seen_files = set()
+        seen_lines = set()
+        # Estimating past the ordered candidates would sort the rest of a RankedTags
+        ordered = getattr(ranked_tags, "num_ordered", len(ranked_tags))
+        for num_tags, (_, tag) in enumerate(islice(ranked_tags, ordered), 1):
+            fragments = self.get_fragments(tag.rel_fname)
+            if fragments is None:
+                return low, None
+            if tag.rel_fname not in seen_files:
+                seen_files.add(tag.rel_fname)
+                total += self.token_count(f"{tag.rel_fname}:\n(Rank value: 0.0000)")
+            if (tag.rel_fname, tag.line) not in seen_lines:
+                seen_lines.add((tag.rel_fname, tag.line))
+                fragment = fragments["lines"].get(tag.line)
+                if fragment is None and 1 <= tag.line <= fragments["num_lines"]:
+                    return low, None
+                total += fragment[1] if fragment else 0
+            if total <= low_tokens:
+                low = num_tags
+            elif total > high_tokens:
+                return low, num_tags
+        return low, None
+
+    def rollup_directories(self, ranked_tags: List[Tuple[float, Tag]]) -> List[Dict[str, Any]]:
+        """Aggregate ranked definitions by directory, most important directory first.
+
+        A file counts with its best tag rank towards every directory above
+        it, so a directory sorts before its subdirectories. Each entry also
+        keeps the top (rank, name) symbols of the files directly inside it.
+        """
+        directories: Dict[str, Dict[str, Any]] = {}
+        file_ranks: Dict[str, float] = {}
+        for rank, tag in ranked_tags:
+            directory = os.path.dirname(tag.rel_fname)
+            own = directories.get(directory)
+            if own is None:
+                own = directories[directory] = {"path": directory, "files": set(), "definitions": 0, "symbols": []}
+            if len(own["symbols"]) < ROLLUP_SYMBOLS_PER_DIRECTORY and all(tag.name != name for _, name in own["symbols"]):
+                own["symbols"].append((rank, tag.name))
+            while True:
+                entry = directories.get(directory)
+                if entry is None:
+                    entry = directories[directory] = {"path": directory, "files": set(), "definitions": 0, "symbols": []}
+                entry["files"].add(tag.rel_fname)
+                entry["definitions"] += 1
+                if not directory:
+                    break
+                directory = os.path.dirname(directory)
+            if rank > file_ranks.get(tag.rel_fname, -1.0):
+                file_ranks[tag.rel_fname] = rank
+
+        for entry in directories.values():
+            entry["rank"] = sum(file_ranks[f] for f in entry["files"])
+        return sorted(directories.values(), key=lambda e: (-e["rank"], e["path"].count(os.sep), e["path"]))
+
+    def to_rollup(self, directories: List[Dict[str, Any]], num_shown: int) -> str:
+        """Render the first num_shown directories as a tree with their top symbols.
+
+        Symbols of directories that are not shown are listed under their
+        closest shown parent; no file contents are read.
+        """
+        shown = {entry["path"]: entry for entry in directories[:num_shown]}
+        if not shown:
+            return ""
+
+        def shown_parent(directory):
+            while directory not in shown and directory:
+                directory = os.path.dirname(directory)
+            return directory
+
+        candidates = defaultdict(list)
+        for entry in directories:
+            if entry["symbols"]:
+                candidates[shown_parent(entry["path"])].extend(entry["symbols"])
+        symbols = {}
+        for directory, ranked_names in candidates.items():
+            names = []
+            for _, name in sorted(ranked_names, key=lambda x: -x[0]):
+                if name not in names:
+                    names.append(name)
+                if len(names) == ROLLUP_SYMBOLS_PER_DIRECTORY:
+                    break
+            symbols[directory] = names
+
+        children = defaultdict(list)
+        for path, entry in shown.items():
+            if path:
+                children[shown_parent(os.path.dirname(path))].append(entry)
+        roots = [shown[""]] if "" in shown else children.pop("", [])
+
+        lines = ["Directory rollup (request a directory with scan_directories to see its files):"]
+
+        def render(entry, depth):
+            label = f"{entry['path']}/" if entry["path"] else "./"
+            line = (f"{'  ' * depth}{label} (rank {entry['rank']:.4f}, {len(entry['files'])} files, "
+                    f"{entry['definitions']} definitions)")
+            if symbols.get(entry["path"]):
+                line += ": " + ", ".join(symbols[entry["path"]])
+            lines.append(line)
+            for child in sorted(children.get(entry["path"], []), key=lambda e: -e["rank"]):
+                render(child, depth + 1)
+
+        for entry in sorted(roots, key=lambda e: -e["rank"]):
+            render(entry, 0)
+        return "\n".join(lines)
+
+    def fit_rollup_to_budget(self, ranked_tags: List[Tuple[float, Tag]], max_map_tokens: int) -> Optional[str]:
+        """Binary search for the most directories whose rollup fits the token budget."""
+        with self.metrics.phase("rollup"):
+            directories = self.rollup_directories(ranked_tags)
+        best = None
+        left, right = 1, len(directories)
+        with self.metrics.phase("fitting"):
+            while left <= right:
+                mid = (left + right) // 2
+                self.metrics.incr("binary_search_iterations")
+                with self.metrics.phase("render"):
+                    output = self.to_rollup(directories, mid)
+                with self.metrics.phase("token_count"):
+                    tokens = self.token_count(output)
+                if tokens <= max_map_tokens:
+                    best = output
+                    left = mid + 1
+                else:
+                    right = mid - 1
+        return best
+
     def _get_source_files_hash(self, all_files: List[str]) -> str:
         """Compute a hash for all source files."""
         hasher = hashlib.sha1()
@@ -707,6 +1837,36 @@ class RepoMap:
                 continue  # Ignore files that can't be read
         return hasher.hexdigest()
 
+    def _map_cache_key(
+        self,
+        all_files: List[str],
+        chat_files: List[str],
+        mentioned_fnames: Optional[Set[str]],
+        mentioned_idents: Optional[Set[str]]
+    ) -> str:
+        """Key of the persistent map cache: the sources plus everything that changes how they are ranked.
+
+        Each mode ranks differently, so a map built in one is never returned to another.
+        """
+        settings = {
+            "files": all_files,
+            "chat_files": sorted(chat_files),
+            "mentioned_fnames": sorted(mentioned_fnames or []),
+            "mentioned_idents": sorted(mentioned_idents or []),
+            "max_map_tokens": self.max_map_tokens,
+            "max_context_window": self.max_context_window,
+            "exclude_unranked": self.exclude_unranked,
+            "skeleton_index": self.skeleton_index,
+            "lazy_parse": self.lazy_parse,
+            "sharded": self.sharded,
+            "rollup": self.rollup,
+            "tag_store": self.tag_store is not None,
+            "snapshot": self.snapshot is not None,
+        }
+        hasher = hashlib.sha1(self._get_source_files_hash(all_files).encode("ascii"))
+        hasher.update(json.dumps(settings, sort_keys=True).encode("utf-8", errors="surrogateescape"))
+        return hasher.hexdigest()
+
     def get_repo_map(
         self,
         chat_files: List[str] = None,
@@ -714,26 +1874,63 @@ class RepoMap:
         mentioned_fnames: Optional[Set[str]] = None,
         mentioned_idents: Optional[Set[str]] = None,
         force_refresh: bool = False,
-        auto_mode: bool = False
+        auto_mode: bool = False,
+        metrics: Optional[RequestMetrics] = None,
+        skipped_files: Optional[Dict[str, str]] = None
+    ) -> Tuple[Optional[str], FileReport]:
+        """Generate the repository map with file report.
+
+        Phase timings and counters are recorded into metrics (a fresh
+        RequestMetrics when not given, e.g. to include caller-side phases
+        such as file discovery) and returned in FileReport.metrics. When
+        metrics.trace_memory is set, per-phase memory and approximate cache
+        sizes are included; metrics.memory_limit_bytes makes the request
+        raise MemoryLimitExceeded instead of growing past the limit.
+        skipped_files maps files left out during discovery (see
+        discovery.find_src_files) to their reason, for FileReport.excluded.
+        """
+        self.metrics = metrics if metrics is not None else RequestMetrics()
+        self.last_ranked_tags = None
+        with self.metrics.tracing(), self.metrics.phase("total"):
+            map_content, file_report = self._get_repo_map(
+                chat_files, other_files, mentioned_fnames, mentioned_idents, force_refresh
+            )
+        for fname, reason in (skipped_files or {}).items():
+            file_report.excluded.setdefault(fname, f"[EXCLUDED] {reason}")
+        if self.metrics.trace_memory:
+            self.metrics.memory["caches"] = self.cache_sizes()
+            self.metrics.memory["resident_bytes"] = resident_memory_bytes()
+        file_report.metrics = self.metrics.as_dict()
+        return map_content, file_report
+
+    def _get_repo_map(
+        self,
+        chat_files: Optional[List[str]],
+        other_files: Optional[List[str]],
+        mentioned_fnames: Optional[Set[str]],
+        mentioned_idents: Optional[Set[str]],
+        force_refresh: bool
     ) -> Tuple[Optional[str], FileReport]:
-        """Generate the repository map with file report."""
         if chat_files is None:
             chat_files = []
         if other_files is None:
             other_files = []
 
         all_files = sorted(list(set(chat_files + other_files)))
-        current_hash = self._get_source_files_hash(all_files)
+        with self.metrics.phase("cache_check"):
+            current_hash = self._map_cache_key(all_files, chat_files, mentioned_fnames, mentioned_idents)
 
-        if not force_refresh and self.cache_path.exists():
-            try:
-                with open(self.cache_path, "r") as f:
-                    cached_data = json.load(f)
-                if cached_data.get("hash") == current_hash:
-                    self.output_handlers['info']("Returning cached repository map.")
-                    return cached_data.get("map"), FileReport(**cached_data.get("report"))
-            except (json.JSONDecodeError, IOError) as e:
-                self.output_handlers['warning'](f"Could not read cache file: {e}")
+            if not force_refresh and self.cache_path.exists():
+                try:
+                    with open(self.cache_path, "r") as f:
+                        cached_data = json.load(f)
+                    if cached_data.get("hash") == current_hash:
+                        self.output_handlers['info']("Returning cached repository map.")
+                        self.metrics.incr("map_cache_hits")
+                        return cached_data.get("map"), FileReport(**cached_data.get("report"))
+                except (json.JSONDecodeError, IOError) as e:
+                    self.output_handlers['warning'](f"Could not read cache file: {e}")
+        self.metrics.incr("map_cache_misses")
 
         # Create empty report for error cases
         empty_report = FileReport({}, 0, 0, 0)
@@ -786,7 +1983,7 @@ class RepoMap:
                 json.dump({
                     "hash": current_hash,
                     "map": repo_content,
-                    "report": file_report.__dict__
+                    "report": {k: v for k, v in file_report.__dict__.items() if k != "metrics"}
                 }, f)
         except IOError as e:
             self.output_handlers['warning'](f"Could not write to cache file: {e}")
@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""
+Standalone index builder for RepoMap.
+
+Discovers source files, parses them in parallel and writes the persistent
+tags cache (plus the SQLite tag store when requested) so that later map and
+search requests start warm. Finished files are checkpointed to a state file,
+so an interrupted run resumes without re-parsing them.
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from discovery import find_src_files
+from repomap_class import RepoMap, TAGS_CACHE_DIR, CACHE_VERSION
+
+INDEX_STATE_FNAME = f".repomap.index.state.v{CACHE_VERSION}.json"
+
+# Number of finished files between checkpoints of the index state
+CHECKPOINT_EVERY = 200
+
+log = logging.getLogger()
+
+
+@dataclass
+class IndexProgress:
+    total_files: int = 0
+    done_files: int = 0             # Files finished in this run or a previous one
+    parsed_files: int = 0           # Files parsed (or cache-verified) in this run
+    resumed_files: int = 0          # Files skipped thanks to the checkpoint
+    missing_files: int = 0          # Files that vanished during indexing
+    total_tags: int = 0
+    started_at: float = field(default_factory=time.time)
+    finished: bool = False
+
+    @property
+    def elapsed(self) -> float:
+        return time.time() - self.started_at
+
+    @property
+    def files_per_second(self) -> float:
+        elapsed = self.elapsed
+        return self.parsed_files / elapsed if elapsed > 0 else 0.0
+
+    def as_dict(self) -> Dict:
+        return {
+            "total_files": self.total_files,
+            "done_files": self.done_files,
+            "parsed_files": self.parsed_files,
+            "resumed_files": self.resumed_files,
+            "missing_files": self.missing_files,
+            "total_tags": self.total_tags,
+            "elapsed_seconds": round(self.elapsed, 3),
+            "files_per_second": round(self.files_per_second, 1),
+            "finished": self.finished,
+        }
+
+
+def load_index_state(root: Path) -> Dict[str, float]:
+    """Load the checkpoint of finished files (fname -> mtime)."""
+    state_path = root / INDEX_STATE_FNAME
+    # A checkpoint without its tags cache would skip files that were never cached
+    if not (root / TAGS_CACHE_DIR).exists() or not state_path.exists():
+        return {}
+    try:
+        with open(state_path, "r") as f:
+            return json.load(f).get("files", {})
+    except (json.JSONDecodeError, IOError) as e:
+        log.warning(f"Ignoring unreadable index state {state_path}: {e}")
+        return {}
+
+
+def save_index_state(root: Path, finished: Dict[str, float]):
+    """Atomically write the checkpoint of finished files."""
+    state_path = root / INDEX_STATE_FNAME
+    tmp_path = state_path.with_suffix(".tmp")
+    try:
+        with open(tmp_path, "w") as f:
+            json.dump({"version": CACHE_VERSION, "files": finished}, f)
+        os.replace(tmp_path, state_path)
+    except IOError as e:
+        log.warning(f"Could not write index state {state_path}: {e}")
+
+
+# Per-process RepoMap used by the worker pool
+_worker_repo_map: Optional[RepoMap] = None
+
+
+def _init_worker(root: str):
+    global _worker_repo_map
+    _worker_repo_map = RepoMap(
+        root=root,
+        output_handler_funcs={
+            'info': lambda msg: None,
+            'warning': log.warning,
+            'error': log.error,
+        },
+    )
+
+
+def _index_file(fname: str):
+    """Parse one file into the shared tags cache; returns (fname, mtime, tag count)."""
+    mtime = _worker_repo_map.get_mtime(fname)
+    if mtime is None:
+        return fname, None, 0
+    tags = _worker_repo_map.get_tags(fname, _worker_repo_map.get_rel_fname(fname))
+    return fname, mtime, len(tags)
+
+
+def build_index(
+    root: str,
+    files: Optional[List[str]] = None,
+    file_patterns: Optional[List[str]] = None,
+    workers: Optional[int] = None,
+    use_tag_store: bool = False,
+    resume: bool = True,
+    progress_callback: Optional[Callable[[IndexProgress], None]] = None,
+    progress_interval: float = 1.0,
+    snapshot_path: Optional[str] = None,
+) -> IndexProgress:
+    """Build the tags cache (and optionally the tag store) for a repository.
+
+    Args:
+        root: Repository root
+        files: Files to index; discovered under root when None
+        file_patterns: Extensions used for discovery (see find_src_files)
+        workers: Number of parser processes; 0 or 1 parses in-process
+        use_tag_store: Also populate the SQLite tag store
+        resume: Skip files recorded as finished by an earlier run
+        progress_callback: Called with the current IndexProgress at most
+            every progress_interval seconds, and once at the end
+        snapshot_path: Also write a binary snapshot of the tags, graph and
+            ranks there (see snapshot.py)
+    """
+    root_path = Path(root).resolve()
+    if files is None:
+        files = find_src_files(str(root_path), file_patterns)
+    files = sorted(set(str(Path(f).resolve()) for f in files))
+
+    progress = IndexProgress(total_files=len(files))
+    finished = load_index_state(root_path) if resume else {}
+
+    pending = []
+    for fname in files:
+        try:
+            mtime = os.path.getmtime(fname)
+        except OSError:
+            progress.missing_files += 1
+            continue
+        if finished.get(fname) == mtime:
+            progress.resumed_files += 1
+        else:
+            pending.append(fname)
+    progress.done_files = progress.resumed_files + progress.missing_files
+
+    last_report = 0.0
+
+    def report(force: bool = False):
+        nonlocal last_report
+        if progress_callback and (force or time.time() - last_report >= progress_interval):
+            last_report = time.time()
+            progress_callback(progress)
+
+    def record(result):
+        fname, mtime, num_tags = result
+        progress.done_files += 1
+        if mtime is None:
+            progress.missing_files += 1
+        else:
+            progress.parsed_files += 1
+            progress.total_tags += num_tags
+            finished[fname] = mtime
+            if progress.parsed_files % CHECKPOINT_EVERY == 0:
+                save_index_state(root_path, finished)
+        report()
+
+    report(force=True)
+    try:
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if workers <= 1 or len(pending) < 2:
+            _init_worker(str(root_path))
+            for fname in pending:
+                record(_index_file(fname))
+        else:
+            with ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=_init_worker,
+                initargs=(str(root_path),),
+                # Spawned workers are safe to start from a threaded server process
+                mp_context=multiprocessing.get_context("spawn"),
+            ) as executor:
+                for result in executor.map(_index_file, pending, chunksize=16):
+                    record(result)
+    finally:
+        # Keep whatever finished so an interrupted run can resume
+        save_index_state(root_path, finished)
+
+    if use_tag_store:
+        repo_map = RepoMap(
+            root=str(root_path),
+            output_handler_funcs={'info': lambda msg: None, 'warning': log.warning, 'error': log.error},
+            use_tag_store=True,
+        )
+        if repo_map.tag_store is not None:
+            stored_mtimes = repo_map.tag_store.get_mtimes()
+            repo_map.tag_store.update_files(
+                (fname, repo_map.get_rel_fname(fname), mtime,
+                 repo_map.get_tags(fname, repo_map.get_rel_fname(fname)))
+                for fname, mtime in finished.items()
+                if stored_mtimes.get(fname) != mtime
+            )
+
+    if snapshot_path:
+        from snapshot import build_snapshot, write_snapshot
+
+        repo_map = RepoMap(
+            root=str(root_path),
+            output_handler_funcs={'info': lambda msg: None, 'warning': log.warning, 'error': log.error},
+        )
+        write_snapshot(build_snapshot(repo_map, finished), snapshot_path)
+
+    progress.finished = True
+    report(force=True)
+    return progress
+
+
+def print_progress(progress: IndexProgress):
+    """Print a one-line progress summary to stderr."""
+    percent = 100.0 * progress.done_files / progress.total_files if progress.total_files else 100.0
+    print(
+        f"[{progress.done_files:>7}/{progress.total_files}] {percent:5.1f}%  "
+        f"parsed={progress.parsed_files} resumed={progress.resumed_files} "
+        f"tags={progress.total_tags}  {progress.files_per_second:.1f} files/s  "
+        f"{progress.elapsed:.1f}s",
+        file=sys.stderr,
+    )
+
+
+def main():
+    from snapshot import SNAPSHOT_FNAME
+
+    parser = argparse.ArgumentParser(description="Build the RepoMap index for a repository.")
+    parser.add_argument("root", nargs="?", default=".", help="Repository root to index (default: current directory)")
+    parser.add_argument("--workers", type=int, default=None, help="Parser processes (default: CPU count; 1 disables parallelism)")
+    parser.add_argument("--file-patterns", nargs="*", help="File extensions to index, e.g. .py .js (default: common source extensions)")
+    parser.add_argument("--tag-store", action="store_true", help="Also populate the SQLite tag store")
+    parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint of a previous run and re-verify every file")
+    parser.add_argument("--progress-interval", type=float, default=1.0, help="Seconds between progress lines (default: 1.0)")
+    parser.add_argument("--snapshot", nargs="?", const="", metavar="FILE",
+                        help=f"Also write a binary snapshot of tags, graph and ranks (default: ROOT/{SNAPSHOT_FNAME})")
+    parser.add_argument("--json", action="store_true", help="Print the final summary as JSON on stdout")
+    parser.add_argument("--debug", action="store_true", help="Enable debug logging")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.WARNING)
+    snapshot_path = args.snapshot
+    if snapshot_path == "":
+        snapshot_path = str(Path(args.root).resolve() / SNAPSHOT_FNAME)
+
+    try:
+        progress = build_index(
+            args.root,
+            file_patterns=args.file_patterns,
+            workers=args.workers,
+            use_tag_store=args.tag_store,
+            resume=not args.restart,
+            progress_callback=print_progress,
+            progress_interval=args.progress_interval,
+            snapshot_path=snapshot_path,
+        )
+    except KeyboardInterrupt:
+        print("Interrupted; progress has been checkpointed and the next run will resume.", file=sys.stderr)
+        sys.exit(130)
+
+    if args.json:
+        print(json.dumps(progress.as_dict(), indent=2))
+    else:
+        print(
+            f"Indexed {progress.parsed_files} files ({progress.resumed_files} resumed) "
+            f"in {progress.elapsed:.1f}s, {progress.total_tags} tags"
+        )
+
+
+if __name__ == "__main__":
+    main()
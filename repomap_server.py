@@ -4,134 +4,25 @@ import os
 import logging
 import argparse
 import fnmatch
+import threading
 from pathlib import Path
 from typing import List, Optional, Dict, Any, Set
 import dataclasses
+from concurrent.futures import ThreadPoolExecutor
 
 from fastmcp import FastMCP, settings
-from repomap_class import RepoMap
-from utils import count_tokens, read_text
+from repomap_class import RepoMap, MEMORY_CHECK_EVERY, TAGS_CACHE_DIR
+from utils import count_tokens, preload_tokenizer, read_text
 from scm import get_scm_fname
 from importance import filter_important_files
+from discovery import find_src_files, is_source_file, parse_gitignore, should_exclude_from_gitignore
+from repomap_index import IndexProgress, build_index
+from tree_cache import TreeCache
+from multi_repo import RootRanking, fit_combined_map
+from map_delta import versioned_map
+from identifier_search import match_queries
+from metrics import PROFILE_TOP_N, MemoryLimitExceeded, RequestMetrics, ServerStats, hot_functions, run_profiled
 
-def parse_gitignore(directory: str) -> List[str]:
-    """Parse .gitignore file and return list of patterns to exclude."""
-    gitignore_path = os.path.join(directory, '.gitignore')
-    patterns = []
-    
-    if os.path.exists(gitignore_path):
-        try:
-            with open(gitignore_path, 'r') as f:
-                for line in f:
-                    line = line.strip()
-                    # Skip empty lines and comments
-                    if line and not line.startswith('#'):
-                        patterns.append(line)
-        except Exception as e:
-            log.warning(f"Error reading .gitignore file {gitignore_path}: {e}")
-    
-    return patterns
-
-def should_exclude_from_gitignore(file_path: str, gitignore_patterns: List[str], root_dir: str) -> bool:
-    """Check if a file should be excluded based on .gitignore patterns."""
-    if not gitignore_patterns:
-        return False
-    
-    # Get relative path from root directory
-    try:
-        rel_path = os.path.relpath(file_path, root_dir)
-    except ValueError:
-        return False
-    
-    for pattern in gitignore_patterns:
-        # Handle directory patterns (ending with /)
-        if pattern.endswith('/'):
-            dir_pattern = pattern.rstrip('/')
-            if fnmatch.fnmatch(rel_path, dir_pattern) or fnmatch.fnmatch(rel_path, pattern + '*'):
-                return True
-        # Handle regular file patterns
-        elif fnmatch.fnmatch(rel_path, pattern) or fnmatch.fnmatch(os.path.basename(file_path), pattern):
-            return True
-    
-    return False
-
-# Enhanced file filtering with configurable patterns and .gitignore support
-def find_src_files(directory: str, file_patterns: Optional[List[str]] = None) -> List[str]:
-    """Find source files in a directory with proper filtering, including .gitignore support.
-    
-    Args:
-        directory: Directory to search
-        file_patterns: List of file extensions to include (e.g., ['.py', '.js'])
-                     If None, uses default source code extensions
-    """
-    if not os.path.isdir(directory):
-        if os.path.isfile(directory) and is_source_file(directory, file_patterns):
-            return [directory]
-        return []
-    
-    # Default source code extensions
-    default_extensions = {'.py', '.js', '.ts', '.java', '.c', '.cpp', '.h', '.hpp',
-                         '.go', '.rs', '.rb', '.php', '.swift', '.scala', '.kt'}
-    
-    # Use provided patterns or default to source extensions
-    if file_patterns:
-        extensions = {ext.lower() for ext in file_patterns if ext.startswith('.')}
-    else:
-        extensions = default_extensions
-    
-    # Parse .gitignore patterns
-    gitignore_patterns = parse_gitignore(directory)
-    if gitignore_patterns:
-        log.debug(f"Found {len(gitignore_patterns)} .gitignore patterns: {gitignore_patterns}")
-    
-    src_files = []
-    
-    for root, dirs, files in os.walk(directory):
-        # Skip hidden directories and common non-source directories
-        dirs[:] = [d for d in dirs if not d.startswith('.') and d not in {
-            'node_modules', '__pycache__', 'venv', 'env', '.git',
-            'dist', 'build', 'target', 'out', 'bin', 'obj',
-            'static', 'templates', 'research', 'settings', 'test_example'
-        }]
-        
-        # Also exclude directories based on .gitignore patterns
-        dirs[:] = [d for d in dirs if not should_exclude_from_gitignore(
-            os.path.join(root, d), gitignore_patterns, directory
-        )]
-        
-        for file in files:
-            if not file.startswith('.'):
-                file_path = os.path.join(root, file)
-                
-                # Check .gitignore exclusion
-                if should_exclude_from_gitignore(file_path, gitignore_patterns, directory):
-                    continue
-                
-                file_ext = os.path.splitext(file)[1].lower()
-                if file_ext in extensions:
-                    src_files.append(file_path)
-    
-    # Debug logging
-    log.debug(f"find_src_files in {directory}: found {len(src_files)} source files with patterns {file_patterns}")
-    if src_files and len(src_files) > 0:
-        log.debug(f"Sample files found: {src_files[:5]}")
-    
-    return src_files
-
-def is_source_file(filepath: str, file_patterns: Optional[List[str]] = None) -> bool:
-    """Check if a file is a source code file based on extensions."""
-    # Default source code extensions
-    default_extensions = {'.py', '.js', '.ts', '.java', '.c', '.cpp', '.h', '.hpp',
-                         '.go', '.rs', '.rb', '.php', '.swift', '.scala', '.kt'}
-    
-    # Use provided patterns or default to source extensions
-    if file_patterns:
-        extensions = {ext.lower() for ext in file_patterns if ext.startswith('.')}
-    else:
-        extensions = default_extensions
-    
-    file_ext = os.path.splitext(filepath)[1].lower()
-    return file_ext in extensions
 
 # Configure logging
 log = logging.getLogger()
@@ -140,10 +31,195 @@ log = logging.getLogger()
 # Set global stateless_http setting
 settings.stateless_http = True
 
+# Use the SQLite tag store for ranking (set from the command line in main())
+USE_TAG_STORE = False
+
+# Whether tools may run requests under the profiler (set via --allow-profiling)
+ALLOW_PROFILING = False
+
+# Per-request memory growth ceiling in bytes (set via --max-memory-mb); None disables it
+MEMORY_LIMIT_BYTES: Optional[int] = None
+
+# Answer requests from prebuilt index snapshots where projects have one (cleared via --no-snapshots)
+USE_SNAPSHOTS = True
+
+# Threads shared by all batch_repo_map requests
+BATCH_WORKERS = 4
+# Options of repo_map, also accepted for each repository of a batch_repo_map request
+REPO_MAP_OPTIONS = (
+    "chat_files", "other_files", "token_limit", "exclude_unranked", "force_refresh", "mentioned_files",
+    "mentioned_idents", "verbose", "max_context_window", "file_patterns", "scan_directories", "profile",
+    "trace_memory", "skeleton_index", "lazy_parse", "sharded", "rollup", "since_version",
+)
+# Keys accepted for each repository of a batch_repo_map request
+BATCH_REPOSITORY_KEYS = {"project_root", *REPO_MAP_OPTIONS}
+
+
+@dataclasses.dataclass
+class WarmupStatus:
+    project_root: str
+    state: str = "pending"                  # pending | indexing | mapping | ready | failed
+    progress: Optional[IndexProgress] = None
+    error: Optional[str] = None
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "project_root": self.project_root,
+            "state": self.state,
+            "progress": self.progress.as_dict() if self.progress else None,
+            "error": self.error,
+        }
+
+
+# Last Tree-sitter trees of recently parsed files, shared by all requests so
+# that files edited between requests are reparsed incrementally
+TREE_CACHE = TreeCache()
+
+# Process-wide request statistics reported by server_stats and /metrics
+SERVER_STATS = ServerStats()
+
+# Worker pool mapping the roots of batch_repo_map requests
+_batch_executor = ThreadPoolExecutor(max_workers=BATCH_WORKERS, thread_name_prefix="batch_repo_map")
+
+# Background warm-up status per project root
+_warmup_status: Dict[str, WarmupStatus] = {}
+_warmup_lock = threading.Lock()
+
+
+def _run_warmup(status: WarmupStatus, workers: Optional[int]):
+    """Index a project and pre-cache its map; runs on a background thread."""
+    def on_progress(progress: IndexProgress):
+        status.progress = progress
+
+    try:
+        if not os.path.isdir(status.project_root):
+            raise FileNotFoundError(f"Project root directory not found: {status.project_root}")
+        status.state = "indexing"
+        all_files = find_src_files(status.project_root)
+        build_index(
+            status.project_root,
+            files=all_files,
+            workers=workers,
+            use_tag_store=USE_TAG_STORE,
+            progress_callback=on_progress,
+        )
+        status.state = "mapping"
+        repo_mapper = RepoMap(
+            root=status.project_root,
+            output_handler_funcs={'info': log.debug, 'warning': log.warning, 'error': log.error, 'debug': log.debug},
+            use_tag_store=USE_TAG_STORE
+        )
+        repo_mapper.get_repo_map(other_files=all_files, auto_mode=True)
+        status.state = "ready"
+        log.info(f"Repository map for {status.project_root} has been pre-cached.")
+    except Exception as e:
+        status.state = "failed"
+        status.error = str(e)
+        log.error(f"Failed to pre-cache repository map for {status.project_root}: {e}")
+
+
+def start_background_warmup(project_root: str, workers: Optional[int] = None) -> WarmupStatus:
+    """Start warming a project's caches without blocking request handling."""
+    root = str(Path(project_root).resolve())
+    with _warmup_lock:
+        status = _warmup_status.get(root)
+        if status is not None and status.state in ("pending", "indexing", "mapping"):
+            return status
+        status = WarmupStatus(project_root=root)
+        _warmup_status[root] = status
+    thread = threading.Thread(target=_run_warmup, args=(status, workers), name=f"warmup:{root}", daemon=True)
+    thread.start()
+    return status
+
 # Create MCP server
 mcp = FastMCP("RepoMapServer")
 
+
+def _call_profiled(profile: bool, func, *args, **kwargs):
+    """Call func, under cProfile when requested and allowed by the server.
+
+    Returns (result, profile), where profile is None unless profiling was requested.
+    """
+    if not profile:
+        return func(*args, **kwargs), None
+    if not ALLOW_PROFILING:
+        result = func(*args, **kwargs)
+        return result, {"error": "Profiling is disabled on this server; start it with --allow-profiling."}
+    result, profiler = run_profiled(func, *args, **kwargs)
+    return result, {"sort": "cumulative", "top_functions": hot_functions(profiler, PROFILE_TOP_N)}
+
+
+async def _run_in_thread(profile: bool, func, *args, **kwargs):
+    """Run func in a worker thread, under cProfile when requested (see _call_profiled)."""
+    return await asyncio.to_thread(_call_profiled, profile, func, *args, **kwargs)
+
+
+def _get_snapshot(project_root: str):
+    """The project's index snapshot (see snapshot.py), mapped once per process, or None."""
+    if not USE_SNAPSHOTS:
+        return None
+    # Imported here so that numpy only loads once a request needs it
+    from snapshot import SNAPSHOTS
+    return SNAPSHOTS.get(project_root)
+
+
+def _parse_token_limit(token_limit: Any, default: int = 2048) -> int:
+    """Positive integer token limit, falling back to default."""
+    try:
+        token_limit = int(token_limit) if token_limit else default
+    except (TypeError, ValueError):
+        return default
+    return token_limit if token_limit > 0 else default
+
+
+def _discover_files(
+    project_root: str,
+    scan_directories: Optional[List[str]],
+    file_patterns: Optional[List[str]],
+    metrics: RequestMetrics,
+    skipped_files: Dict[str, str]
+) -> List[str]:
+    """Source files under the scan directories (default: the project root)."""
+    directories_to_scan = scan_directories or [project_root]
+    log.info(f"No other_files provided, scanning directories: {directories_to_scan}")
+    found = []
+    with metrics.phase("discovery"):
+        for directory in directories_to_scan:
+            abs_directory = str(Path(project_root) / directory) if directory != project_root else project_root
+            if os.path.exists(abs_directory):
+                files_in_dir = find_src_files(abs_directory, file_patterns, skipped_files)
+                found.extend(files_in_dir)
+                log.info(f"Found {len(files_in_dir)} source files in {directory}")
+            else:
+                log.warning(f"Directory not found: {abs_directory}")
+    return found
+
+
+def _resolve_files(project_root: str, chat_files: List[str], other_files: List[str]):
+    """Resolve files against the project root; returns (root_path, abs_chat_files, abs_other_files)."""
+    root_path = Path(project_root).resolve()
+    abs_chat_files = [str(root_path / f) for f in chat_files]
+    abs_other_files = [str(root_path / f) for f in other_files]
+
+    # Remove any chat files from the other_files list to avoid duplication
+    abs_chat_files_set = set(abs_chat_files)
+    abs_other_files = [f for f in abs_other_files if f not in abs_chat_files_set]
+    return root_path, abs_chat_files, abs_other_files
+
+
+def _report_dict(file_report) -> Dict[str, Any]:
+    """Convert a FileReport to a dictionary for JSON serialization."""
+    return {
+        "excluded": file_report.excluded,
+        "definition_matches": file_report.definition_matches,
+        "reference_matches": file_report.reference_matches,
+        "total_files_considered": file_report.total_files_considered,
+        "metrics": file_report.metrics
+    }
+
+
 @mcp.tool()
+@SERVER_STATS.track("repo_map")
 async def repo_map(
     project_root: str,
     chat_files: Optional[List[str]] = None,
@@ -156,7 +232,14 @@ async def repo_map(
     verbose: bool = False,
     max_context_window: Optional[int] = None,
     file_patterns: Optional[List[str]] = None,
-    scan_directories: Optional[List[str]] = None
+    scan_directories: Optional[List[str]] = None,
+    profile: bool = False,
+    trace_memory: bool = False,
+    skeleton_index: bool = False,
+    lazy_parse: bool = False,
+    sharded: bool = False,
+    rollup: bool = False,
+    since_version: Optional[str] = None
 ) -> Dict[str, Any]:
     """Generate a repository map for the specified files, providing a list of function prototypes and variables for files as well as relevant related
     files. Provide filenames relative to the project_root. In addition to the files provided, relevant related files will also be included with a
@@ -172,54 +255,98 @@ async def repo_map(
     :param mentioned_idents: Optional list of identifiers explicitly mentioned in the conversation, to boost their ranking.
     :param verbose: If True, enables verbose logging for the RepoMap generation process. Defaults to False.
     :param max_context_window: Optional maximum context window size for token calculation, used to adjust map token limit when no chat files are provided.
+    :param profile: If True and the server was started with --allow-profiling, run the map generation under cProfile. Defaults to False.
+    :param trace_memory: If True, report traced memory per phase and approximate cache sizes in the metrics (slows the request down). Defaults to False.
+    :param skeleton_index: If True, build the file graph from a fast regex pass and parse only the best ranked files with Tree-sitter. Much faster on very large repositories, with approximate ranking. Defaults to False.
+    :param lazy_parse: If True, parse only the chat and mentioned files and the files defining what they reference, expanding outward until the token budget is covered; other files are left out of the map. Defaults to False.
+    :param sharded: If True, rank each package (directory with a pyproject.toml, package.json, go.mod, ... or top-level directory) separately and combine them through cross-package references. Package rankings are cached, so a change in one package only re-ranks that package. Defaults to False.
+    :param rollup: If True, return a compact overview of the most important directories with their file and definition counts and top symbols instead of file contents. Drill down by calling again with scan_directories set to a directory of interest. Defaults to False.
+    :param since_version: The 'map_version' of a map returned earlier for this project. If given, 'map' holds only the file blocks added or changed (in rank or content) since then, followed by a line listing removed files; see 'delta'. Unknown or expired versions return the full map. This saves tokens in the response only: the full map is still generated and then compared with the earlier one, so the request takes as long as without since_version.
     :returns: A dictionary containing:
-        - 'map': the generated repository map string
+        - 'map': the generated repository map string (only the changed file blocks when since_version is known)
+        - 'map_version': token identifying this map, to pass as since_version next time
+        - 'delta': only when since_version is known; 'added', 'changed' and 'removed' file lists and
+          the number of 'unchanged' files ('delta_unavailable' explains when the full map is returned instead)
         - 'report': a dictionary with file processing details including:
             - 'included': list of processed files
-            - 'excluded': dictionary of excluded files with reasons
+            - 'excluded': dictionary of excluded files with reasons (including files skipped during
+              discovery as too large, binary, minified or generated)
             - 'definition_matches': count of matched definitions
             - 'reference_matches': count of matched references
             - 'total_files_considered': total files processed
+            - 'metrics': wall/CPU seconds per phase (discovery, cache_check, tags, graph, pagerank,
+              rank_tags, fitting, render, token_count, total) and counters (tags/tree context/map
+              cache hits and misses, files parsed vs reused, binary search iterations); with trace_memory,
+              peak/retained bytes per phase and a 'memory' entry with cache sizes and resident memory
+        - 'profile': only when profile is True; the hottest functions with call counts and
+          total/cumulative seconds, or an 'error' if profiling is disabled on the server
         Or an 'error' key if an error occurred.
     """
+    options = {
+        "chat_files": chat_files, "other_files": other_files, "token_limit": token_limit,
+        "exclude_unranked": exclude_unranked, "force_refresh": force_refresh,
+        "mentioned_files": mentioned_files, "mentioned_idents": mentioned_idents, "verbose": verbose,
+        "max_context_window": max_context_window, "file_patterns": file_patterns,
+        "scan_directories": scan_directories, "profile": profile, "trace_memory": trace_memory,
+        "skeleton_index": skeleton_index, "lazy_parse": lazy_parse, "sharded": sharded, "rollup": rollup,
+        "since_version": since_version,
+    }
+    result, _ = await asyncio.to_thread(_map_project, project_root, options)
+    return result
+
+
+def _build_repo_map(root_path: Path, options: Dict[str, Any]) -> RepoMap:
+    """RepoMap for a project, configured from repo_map's options."""
+    return RepoMap(
+        map_tokens=_parse_token_limit(options.get("token_limit")),
+        root=str(root_path),
+        token_counter_func=lambda text: count_tokens(text, "gpt-4"),
+        file_reader_func=read_text,
+        output_handler_funcs={'info': log.info, 'warning': log.warning, 'error': log.error, 'debug': log.debug},
+        verbose=bool(options.get("verbose")),
+        exclude_unranked=bool(options.get("exclude_unranked")),
+        max_context_window=options.get("max_context_window"),
+        use_tag_store=USE_TAG_STORE,
+        tree_cache=TREE_CACHE,
+        skeleton_index=bool(options.get("skeleton_index")),
+        lazy_parse=bool(options.get("lazy_parse")),
+        sharded=bool(options.get("sharded")),
+        rollup=bool(options.get("rollup")),
+        snapshot=_get_snapshot(str(root_path))
+    )
+
+
+def _map_project(project_root: str, options: Dict[str, Any], rank_for_combined: bool = False):
+    """Map one project with repo_map's options (see REPO_MAP_OPTIONS); runs on a worker thread.
+
+    Shared by repo_map and the roots of batch_repo_map. Returns (result,
+    ranking), where ranking holds the ranked tags behind the map for a
+    combined map, or None when not requested or no map was generated.
+    """
     if not os.path.isdir(project_root):
-        return {"error": f"Project root directory not found: {project_root}"}
+        return {"error": f"Project root directory not found: {project_root}"}, None
 
     # 1. Handle and validate parameters
-    # Convert token_limit to integer with fallback
-    try:
-        token_limit = int(token_limit) if token_limit else 2048
-    except (TypeError, ValueError):
-        token_limit = 2048
-    
-    # Ensure token_limit is positive
-    if token_limit <= 0:
-        token_limit = 2048
-    
-    chat_files_list = chat_files or []
-    mentioned_fnames_set = set(mentioned_files) if mentioned_files else None
-    mentioned_idents_set = set(mentioned_idents) if mentioned_idents else None
+    metrics = RequestMetrics(trace_memory=bool(options.get("trace_memory")), memory_limit_bytes=MEMORY_LIMIT_BYTES)
+    chat_files_list = options.get("chat_files") or []
+    mentioned_fnames_set = set(options["mentioned_files"]) if options.get("mentioned_files") else None
+    mentioned_idents_set = set(options["mentioned_idents"]) if options.get("mentioned_idents") else None
+    file_patterns = options.get("file_patterns")
+    scan_directories = options.get("scan_directories")
 
     # 2. If a specific list of other_files isn't provided, scan specified directories or root
-    effective_other_files = []
-    if other_files:
-        effective_other_files = other_files
-    else:
+    skipped_files: Dict[str, str] = {}
+    effective_other_files = options.get("other_files") or []
+    if not effective_other_files:
         # Use specified directories or default to project root
-        directories_to_scan = scan_directories or [project_root]
-        log.info(f"No other_files provided, scanning directories: {directories_to_scan}")
-        
-        for directory in directories_to_scan:
-            abs_directory = str(Path(project_root) / directory) if directory != project_root else project_root
-            if os.path.exists(abs_directory):
-                files_in_dir = find_src_files(abs_directory, file_patterns)
-                effective_other_files.extend(files_in_dir)
-                log.info(f"Found {len(files_in_dir)} source files in {directory}")
-            else:
-                log.warning(f"Directory not found: {abs_directory}")
+        try:
+            effective_other_files = _discover_files(project_root, scan_directories, file_patterns, metrics, skipped_files)
+        except MemoryLimitExceeded as e:
+            log.error(f"Aborted repository map for project '{project_root}': {e}")
+            return {"error": str(e)}, None
 
     # Enhanced debugging information
-    if verbose:
+    if options.get("verbose"):
         log.info(f"Project root: {project_root}")
         log.info(f"Chat files: {chat_files_list}")
         log.info(f"File patterns: {file_patterns or 'default source extensions'}")
@@ -231,67 +358,275 @@ async def repo_map(
     # If after all that we have no files, we can exit early.
     if not chat_files_list and not effective_other_files:
         log.info("No files to process.")
-        return {"map": "No files found to generate a map."}
+        return {"map": "No files found to generate a map."}, None
 
     # 3. Resolve paths relative to project root
-    root_path = Path(project_root).resolve()
-    abs_chat_files = [str(root_path / f) for f in chat_files_list]
-    abs_other_files = [str(root_path / f) for f in effective_other_files]
-    
-    # Remove any chat files from the other_files list to avoid duplication
-    abs_chat_files_set = set(abs_chat_files)
-    abs_other_files = [f for f in abs_other_files if f not in abs_chat_files_set]
+    root_path, abs_chat_files, abs_other_files = _resolve_files(project_root, chat_files_list, effective_other_files)
 
     # 4. Instantiate and run RepoMap
     try:
-        repo_mapper = RepoMap(
-            map_tokens=token_limit,
-            root=str(root_path),
-            token_counter_func=lambda text: count_tokens(text, "gpt-4"),
-            file_reader_func=read_text,
-            output_handler_funcs={'info': log.info, 'warning': log.warning, 'error': log.error, 'debug': log.debug},
-            verbose=verbose,
-            exclude_unranked=exclude_unranked,
-            max_context_window=max_context_window
-        )
+        repo_mapper = _build_repo_map(root_path, options)
     except Exception as e:
         log.exception(f"Failed to initialize RepoMap for project '{project_root}': {e}")
-        return {"error": f"Failed to initialize RepoMap: {str(e)}"}
+        return {"error": f"Failed to initialize RepoMap: {str(e)}"}, None
 
     try:
-        map_content, file_report = await asyncio.to_thread(
+        (map_content, file_report), profile_info = _call_profiled(
+            bool(options.get("profile")),
             repo_mapper.get_repo_map,
             chat_files=abs_chat_files,
             other_files=abs_other_files,
             mentioned_fnames=mentioned_fnames_set,
             mentioned_idents=mentioned_idents_set,
-            force_refresh=force_refresh
+            force_refresh=bool(options.get("force_refresh")),
+            metrics=metrics,
+            skipped_files={str(Path(f).resolve()): reason for f, reason in skipped_files.items()}
         )
-        
-        # Convert FileReport to dictionary for JSON serialization
-        report_dict = {
-            "excluded": file_report.excluded,
-            "definition_matches": file_report.definition_matches,
-            "reference_matches": file_report.reference_matches,
-            "total_files_considered": file_report.total_files_considered
-        }
-        
-        return {
-            "map": map_content or "No repository map could be generated.",
-            "report": report_dict
-        }
+
+        result = versioned_map(
+            str(root_path), map_content or "No repository map could be generated.", options.get("since_version")
+        )
+        result["report"] = _report_dict(file_report)
+        if profile_info is not None:
+            result["profile"] = profile_info
+
+        ranking = None
+        if rank_for_combined:
+            ranked_tags = repo_mapper.last_ranked_tags
+            if ranked_tags is None:
+                # The map came from the map cache, so rank here
+                ranked_tags, _ = repo_mapper.get_ranked_tags(
+                    abs_chat_files, abs_other_files, mentioned_fnames_set, mentioned_idents_set
+                )
+            ranking = RootRanking(
+                label=str(root_path),
+                repo_map=repo_mapper,
+                ranked_tags=ranked_tags,
+                chat_rel_fnames={repo_mapper.get_rel_fname(f) for f in abs_chat_files},
+            )
+        return result, ranking
+    except MemoryLimitExceeded as e:
+        log.error(f"Aborted repository map for project '{project_root}': {e}")
+        return {"error": str(e)}, None
     except Exception as e:
         log.exception(f"Error generating repository map for project '{project_root}': {e}")
-        return {"error": f"Error generating repository map: {str(e)}"}
-    
+        return {"error": f"Error generating repository map: {str(e)}"}, None
+
+
+def _map_repository(
+    spec: Dict[str, Any],
+    force_refresh: bool,
+    verbose: bool,
+    rank_for_combined: bool
+):
+    """Map one repository of a batch; runs on the batch worker pool.
+
+    force_refresh and verbose apply unless the repository sets them. Returns
+    (result, ranking) as _map_project does, with the project_root in result.
+    """
+    if not isinstance(spec, dict):
+        return {"error": f"Expected a repository object, got: {spec!r}"}, None
+    project_root = spec.get("project_root")
+    if not project_root or not os.path.isdir(project_root):
+        return {"project_root": project_root, "error": f"Project root directory not found: {project_root}"}, None
+    unknown = sorted(set(spec) - BATCH_REPOSITORY_KEYS)
+    if unknown:
+        return {"project_root": project_root, "error": f"Unknown repository keys: {', '.join(unknown)}"}, None
+
+    options = {"force_refresh": force_refresh, "verbose": verbose, **spec}
+    result, ranking = _map_project(project_root, options, rank_for_combined)
+    return {"project_root": project_root, **result}, ranking
+
+
 @mcp.tool()
+@SERVER_STATS.track("batch_repo_map")
+async def batch_repo_map(
+    repositories: List[Dict[str, Any]],
+    combined_token_limit: Optional[int] = None,
+    force_refresh: bool = False,
+    verbose: bool = False
+) -> Dict[str, Any]:
+    """Generate repository maps for several project roots in one request. The roots are mapped concurrently on the
+    server's worker pool; optionally their best ranked definitions are also merged into one combined map.
+
+    :param repositories: One object per repository with 'project_root' (absolute path, required) and optionally
+        any other repo_map parameter ('chat_files', 'other_files', 'token_limit', 'scan_directories', 'lazy_parse',
+        'since_version', ...), with the same meaning as for repo_map.
+    :param combined_token_limit: If set, also return a combined map of all repositories within this many tokens.
+        Each repository's ranks are scaled so that its best definition ranks 1.0 before merging.
+    :param force_refresh: If True, forces a refresh of the cached repository maps, unless a repository sets it. Defaults to False.
+    :param verbose: If True, enables verbose logging, unless a repository sets it. Defaults to False.
+    :returns: A dictionary containing:
+        - 'results': one entry per repository, in request order, with 'project_root' and either 'map', 'map_version',
+          'report' and, when profiled, 'profile' (as returned by repo_map) or 'error'
+        - 'combined_map': only when combined_token_limit is set; sections of the form
+          'Repository <root>:' followed by that repository's files
+        - 'combined_metrics': only when combined_token_limit is set; timings of merging and fitting
+        Or an 'error' key if no repositories were given.
+    """
+    if not repositories:
+        return {"error": "No repositories given."}
+
+    rank_for_combined = combined_token_limit is not None
+    loop = asyncio.get_running_loop()
+    outcomes = await asyncio.gather(*(
+        loop.run_in_executor(_batch_executor, _map_repository, spec, force_refresh, verbose, rank_for_combined)
+        for spec in repositories
+    ))
+    response: Dict[str, Any] = {"results": [result for result, _ in outcomes]}
+
+    if rank_for_combined:
+        rankings = [ranking for _, ranking in outcomes if ranking is not None]
+        metrics = RequestMetrics()
+        combined = await loop.run_in_executor(
+            _batch_executor, fit_combined_map, rankings, _parse_token_limit(combined_token_limit),
+            lambda text: count_tokens(text, "gpt-4"), metrics
+        )
+        response["combined_map"] = combined or "No combined repository map could be generated."
+        response["combined_metrics"] = metrics.as_dict()
+    return response
+
+
+# Extensions searched by search_identifiers and search_identifiers_batch
+SEARCH_EXTENSIONS = ['.py', '.js', '.ts', '.java', '.c', '.cpp', '.h', '.hpp', '.go', '.rs', '.rb', '.php', '.swift', '.scala', '.kt']
+
+
+def _collect_search_tags(project_root: str, queries: List[str]):
+    """Collect the tags of the project's source files that queries may match; returns (repo_map, tags).
+
+    Files the project's snapshot holds unchanged contribute only the
+    occurrences of symbols matching a query, read from its arrays; other
+    files have all their tags loaded.
+    """
+    snapshot = _get_snapshot(project_root)
+    # Initialize RepoMap with search-specific settings
+    repo_map = RepoMap(
+        root=project_root,
+        token_counter_func=lambda text: count_tokens(text, "gpt-4"),
+        file_reader_func=read_text,
+        output_handler_funcs={'info': log.info, 'warning': log.warning, 'error': log.error, 'debug': log.debug},
+        verbose=False,
+        exclude_unranked=True,
+        tree_cache=TREE_CACHE,
+        snapshot=snapshot
+    )
+    repo_map.metrics = RequestMetrics(memory_limit_bytes=MEMORY_LIMIT_BYTES)
+
+    # Find all source files in the project with enhanced filtering
+    all_files = find_src_files(project_root, SEARCH_EXTENSIONS)
+
+    # Get all tags (definitions and references) for all files
+    all_tags = []
+    with repo_map.metrics.phase("tags"):
+        current, snapshot_tags = {}, {}
+        if snapshot is not None:
+            current, _, _ = repo_map.split_snapshot_files(all_files)
+            snapshot_tags = snapshot.matching_tags(current.values(), snapshot.matching_symbols(queries))
+            repo_map.metrics.set("snapshot_files", len(current))
+        for i, file_path in enumerate(all_files):
+            if i % MEMORY_CHECK_EVERY == 0:
+                repo_map.metrics.check_memory()
+            index = current.get(file_path)
+            if index is not None:
+                all_tags.extend(snapshot_tags.get(index, ()))
+                continue
+            rel_path = str(Path(file_path).relative_to(project_root))
+            all_tags.extend(repo_map.get_tags(file_path, rel_path))
+    return repo_map, all_tags
+
+
+def _context_range(line: int, context_lines: int) -> List[int]:
+    return list(range(max(1, line - context_lines), line + context_lines + 1))
+
+
+def _search_identifiers(
+    project_root: str,
+    query: str,
+    max_results: int,
+    context_lines: int,
+    include_definitions: bool,
+    include_references: bool
+) -> List[Dict[str, Any]]:
+    """Find tags whose name contains query and render their context."""
+    repo_map, all_tags = _collect_search_tags(project_root, [query])
+
+    # Definitions first, then by where the query occurs in the name
+    matching_tags = match_queries(all_tags, [query], include_definitions, include_references, max_results)[0]
+
+    # Format results with context
+    results = []
+    for tag in matching_tags:
+        file_path = str(Path(project_root) / tag.rel_fname)
+        context = repo_map.render_tree(
+            file_path,
+            tag.rel_fname,
+            _context_range(tag.line, context_lines)
+        )
+
+        if context:
+            results.append({
+                "file": tag.rel_fname,
+                "line": tag.line,
+                "name": tag.name,
+                "kind": tag.kind,
+                "context": context
+            })
+
+    SERVER_STATS.add_counters(repo_map.metrics.counters)
+    return results
+
+
+def _search_identifiers_batch(
+    project_root: str,
+    queries: List[str],
+    max_results: int,
+    context_lines: int,
+    include_definitions: bool,
+    include_references: bool
+) -> Dict[str, Any]:
+    """Match all queries in one pass over the tags and render each hit file once."""
+    repo_map, all_tags = _collect_search_tags(project_root, queries)
+
+    with repo_map.metrics.phase("match"):
+        matches = match_queries(all_tags, queries, include_definitions, include_references, max_results)
+
+    # Lines of interest of all hits, per file
+    file_lois: Dict[str, Set[int]] = {}
+    for tags in matches:
+        for tag in tags:
+            file_lois.setdefault(tag.rel_fname, set()).update(_context_range(tag.line, context_lines))
+
+    contexts = {}
+    with repo_map.metrics.phase("render"):
+        for rel_fname, lois in file_lois.items():
+            context = repo_map.render_tree(str(Path(project_root) / rel_fname), rel_fname, sorted(lois))
+            if context:
+                contexts[rel_fname] = context
+
+    results = [
+        {
+            "query": query,
+            "matches": [
+                {"file": tag.rel_fname, "line": tag.line, "name": tag.name, "kind": tag.kind}
+                for tag in tags if tag.rel_fname in contexts
+            ]
+        }
+        for query, tags in zip(queries, matches)
+    ]
+    SERVER_STATS.add_counters(repo_map.metrics.counters)
+    return {"results": results, "contexts": contexts}
+
+
+@mcp.tool()
+@SERVER_STATS.track("search_identifiers")
 async def search_identifiers(
     project_root: str,
     query: str,
     max_results: int = 50,
     context_lines: int = 2,
     include_definitions: bool = True,
-    include_references: bool = True
+    include_references: bool = True,
+    profile: bool = False
 ) -> Dict[str, Any]:
     """Search for identifiers in code files. Get back a list of matching identifiers with their file, line number, and context.
        When searching, just use the identifier name without any special characters, prefixes or suffixes. The search is 
@@ -304,6 +639,8 @@ async def search_identifiers(
         context_lines: Number of lines of context to show
         include_definitions: Whether to include definition occurrences
         include_references: Whether to include reference occurrences
+        profile: Run the search under cProfile and return the hottest functions in 'profile'
+            (requires the server to be started with --allow-profiling)
     
     Returns:
         Dictionary containing search results or error message
@@ -312,81 +649,178 @@ async def search_identifiers(
         return {"error": f"Project root directory not found: {project_root}"}
 
     try:
-        # Initialize RepoMap with search-specific settings
-        repo_map = RepoMap(
-            root=project_root,
-            token_counter_func=lambda text: count_tokens(text, "gpt-4"),
-            file_reader_func=read_text,
-            output_handler_funcs={'info': log.info, 'warning': log.warning, 'error': log.error, 'debug': log.debug},
-            verbose=False,
-            exclude_unranked=True
+        results, profile_info = await _run_in_thread(
+            profile,
+            _search_identifiers,
+            project_root,
+            query,
+            max_results,
+            context_lines,
+            include_definitions,
+            include_references
         )
+        result = {"results": results}
+        if profile_info is not None:
+            result["profile"] = profile_info
+        return result
+
+    except MemoryLimitExceeded as e:
+        log.error(f"Aborted identifier search in project '{project_root}': {e}")
+        return {"error": str(e)}
+    except Exception as e:
+        log.exception(f"Error searching identifiers in project '{project_root}': {e}")
+        return {"error": f"Error searching identifiers: {str(e)}"}    
 
-        # Find all source files in the project with enhanced filtering
-        all_files = find_src_files(project_root, ['.py', '.js', '.ts', '.java', '.c', '.cpp', '.h', '.hpp', '.go', '.rs', '.rb', '.php', '.swift', '.scala', '.kt'])
-        
-        # Get all tags (definitions and references) for all files
-        all_tags = []
-        for file_path in all_files:
-            rel_path = str(Path(file_path).relative_to(project_root))
-            tags = repo_map.get_tags(file_path, rel_path)
-            all_tags.extend(tags)
-
-        # Filter tags based on search query and options
-        matching_tags = []
-        query_lower = query.lower()
-        
-        for tag in all_tags:
-            if query_lower in tag.name.lower():
-                if (tag.kind == "def" and include_definitions) or \
-                   (tag.kind == "ref" and include_references):
-                    matching_tags.append(tag)
-
-        # Sort by relevance (definitions first, then references)
-        matching_tags.sort(key=lambda x: (x.kind != "def", x.name.lower().find(query_lower)))
-
-        # Limit results
-        matching_tags = matching_tags[:max_results]
-
-        # Format results with context
-        results = []
-        for tag in matching_tags:
-            file_path = str(Path(project_root) / tag.rel_fname)
-            
-            # Calculate context range based on context_lines parameter
-            start_line = max(1, tag.line - context_lines)
-            end_line = tag.line + context_lines
-            context_range = list(range(start_line, end_line + 1))
-            
-            context = repo_map.render_tree(
-                file_path,
-                tag.rel_fname,
-                context_range
-            )
-            
-            if context:
-                results.append({
-                    "file": tag.rel_fname,
-                    "line": tag.line,
-                    "name": tag.name,
-                    "kind": tag.kind,
-                    "context": context
-                })
 
-        return {"results": results}
+@mcp.tool()
+@SERVER_STATS.track("search_identifiers_batch")
+async def search_identifiers_batch(
+    project_root: str,
+    queries: List[str],
+    max_results_per_query: int = 20,
+    context_lines: int = 2,
+    include_definitions: bool = True,
+    include_references: bool = True,
+    profile: bool = False
+) -> Dict[str, Any]:
+    """Search for several identifiers at once. Prefer this over repeated search_identifiers calls: the project's tags
+       are collected once, all queries are matched in a single pass, and each file is rendered once even when several
+       matches share it. Matching is case-insensitive, like search_identifiers.
+
+    Args:
+        project_root: Root directory of the project to search.  (must be an absolute path!)
+        queries: Search queries (identifier names)
+        max_results_per_query: Maximum number of matches to return per query
+        context_lines: Number of lines of context to show around each match
+        include_definitions: Whether to include definition occurrences
+        include_references: Whether to include reference occurrences
+        profile: Run the search under cProfile and return the hottest functions in 'profile'
+            (requires the server to be started with --allow-profiling)
+
+    Returns:
+        Dictionary with 'results', one entry per query in request order with its 'matches' (file, line, name,
+        kind), and 'contexts', the rendered context of every file with matches keyed by file; or an error message
+    """
+    if not os.path.isdir(project_root):
+        return {"error": f"Project root directory not found: {project_root}"}
+    if not queries:
+        return {"error": "No queries given."}
+
+    try:
+        result, profile_info = await _run_in_thread(
+            profile,
+            _search_identifiers_batch,
+            project_root,
+            queries,
+            max_results_per_query,
+            context_lines,
+            include_definitions,
+            include_references
+        )
+        if profile_info is not None:
+            result["profile"] = profile_info
+        return result
 
+    except MemoryLimitExceeded as e:
+        log.error(f"Aborted identifier search in project '{project_root}': {e}")
+        return {"error": str(e)}
     except Exception as e:
         log.exception(f"Error searching identifiers in project '{project_root}': {e}")
-        return {"error": f"Error searching identifiers: {str(e)}"}    
+        return {"error": f"Error searching identifiers: {str(e)}"}
+
+@mcp.tool()
+@SERVER_STATS.track("indexing_status")
+async def indexing_status(project_root: Optional[str] = None) -> Dict[str, Any]:
+    """Report the progress of background indexing (warm-up) started with --auto-cache.
+    Map and search requests are served while indexing runs; they only get faster as it progresses.
+
+    Args:
+        project_root: Optional absolute project root to report on. Reports every project when omitted.
+
+    Returns:
+        Dictionary with a 'projects' list; each entry has 'project_root', 'state'
+        (pending, indexing, mapping, ready or failed), 'progress' (file counts,
+        throughput and elapsed time) and 'error'.
+    """
+    with _warmup_lock:
+        statuses = list(_warmup_status.values())
+    if project_root:
+        root = str(Path(project_root).resolve())
+        statuses = [status for status in statuses if status.project_root == root]
+    return {"projects": [status.as_dict() for status in statuses]}
+
+def _tags_cache_sizes() -> Dict[str, Dict[str, int]]:
+    """Entry count and on-disk size of the tags cache of every known project."""
+    import diskcache
+
+    with _warmup_lock:
+        roots = set(SERVER_STATS.projects) | set(_warmup_status)
+    sizes = {}
+    for root in sorted(roots):
+        cache_dir = Path(root) / TAGS_CACHE_DIR
+        if not cache_dir.is_dir():
+            continue
+        try:
+            with diskcache.Cache(str(cache_dir)) as cache:
+                sizes[root] = {"entries": len(cache), "bytes": cache.volume()}
+        except Exception as e:
+            log.debug(f"Could not inspect tags cache {cache_dir}: {e}")
+    return sizes
+
+
+@mcp.tool()
+async def server_stats() -> Dict[str, Any]:
+    """Report process-wide server statistics: request counts, errors and latency histograms per tool,
+    requests in flight (queue depth), cache hit rates, tags cache sizes per project, number of warm
+    projects and resident memory.
+
+    Returns:
+        Dictionary of server statistics.
+    """
+    stats = SERVER_STATS.snapshot()
+    cache_sizes = await asyncio.to_thread(_tags_cache_sizes)
+    stats["tags_cache_sizes"] = cache_sizes
+    stats["warm_projects"] = sum(1 for size in cache_sizes.values() if size["entries"])
+    return stats
+
+
+async def metrics_endpoint(request):
+    """Serve server statistics in the Prometheus text exposition format."""
+    from starlette.responses import PlainTextResponse
+
+    cache_sizes = await asyncio.to_thread(_tags_cache_sizes)
+    body = SERVER_STATS.to_prometheus({
+        "warm_projects": sum(1 for size in cache_sizes.values() if size["entries"]),
+        "tags_cache_entries": {root: size["entries"] for root, size in cache_sizes.items()},
+        "tags_cache_bytes": {root: size["bytes"] for root, size in cache_sizes.items()},
+    })
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
+
 
 # --- Main Entry Point ---
 def main():
     parser = argparse.ArgumentParser(description="RepoMap MCP Server")
     parser.add_argument("--debug", action="store_true", help="Enable debug logging")
-    parser.add_argument("--auto-cache", action="store_true", help="Automatically pre-cache the repository map on startup.")
+    parser.add_argument("--auto-cache", action="store_true", help="Pre-cache the repository map in the background after startup.")
+    parser.add_argument("--warmup-workers", type=int, default=None, help="Parser processes used by --auto-cache (default: CPU count).")
     parser.add_argument("--project-root", default=".", help="Project root for auto-caching.")
+    parser.add_argument("--tag-store", action="store_true", help="Rank using the SQLite tag store instead of loading every tag into memory.")
+    parser.add_argument("--transport", choices=["stdio", "http"], default="stdio", help="MCP transport (default: stdio).")
+    parser.add_argument("--host", default="127.0.0.1", help="Host to bind with --transport http.")
+    parser.add_argument("--port", type=int, default=8000, help="Port to bind with --transport http.")
+    parser.add_argument("--allow-profiling", action="store_true", help="Let repo_map and search_identifiers requests opt in to cProfile profiling.")
+    parser.add_argument("--max-memory-mb", type=int, default=None, help="Fail map and search requests that grow the server's memory by more than this many MiB.")
+    parser.add_argument("--metrics-endpoint", action="store_true", help="Serve Prometheus metrics at /metrics (HTTP transport only).")
+    parser.add_argument("--snapshot", metavar="FILE", default=None, help="Index snapshot of --project-root to map at startup (default: the project's .repomap.snapshot.v1.bin, opened on first use).")
+    parser.add_argument("--no-snapshots", action="store_true", help="Ignore index snapshots and always load tags from the tags cache.")
     args = parser.parse_args()
 
+    global USE_TAG_STORE, ALLOW_PROFILING, MEMORY_LIMIT_BYTES, USE_SNAPSHOTS
+    USE_TAG_STORE = args.tag_store
+    ALLOW_PROFILING = args.allow_profiling
+    MEMORY_LIMIT_BYTES = args.max_memory_mb * 2**20 if args.max_memory_mb else None
+    USE_SNAPSHOTS = not args.no_snapshots
+
     # Configure logging based on debug flag
     if args.debug:
         logging.basicConfig(level=logging.DEBUG, format='%(levelname)-5s %(asctime)-15s %(name)s:%(funcName)s:%(lineno)d - %(message)s')
@@ -397,24 +831,32 @@ def main():
         logging.getLogger('fastmcp').setLevel(logging.ERROR)
         logging.getLogger('fastmcp.server').setLevel(logging.ERROR)
 
+    if args.snapshot and USE_SNAPSHOTS:
+        from snapshot import SNAPSHOTS
+        SNAPSHOTS.register(args.project_root, args.snapshot)
+        if SNAPSHOTS.get(args.project_root) is None:
+            log.warning(f"Snapshot {args.snapshot} could not be opened; serving from the tags cache.")
+
     if args.auto_cache:
-        log.info("Auto-caching enabled. Pre-caching repository map...")
-        try:
-            root_path = Path(args.project_root).resolve()
-            repo_mapper = RepoMap(
-                root=str(root_path),
-                output_handler_funcs={'info': log.info, 'warning': log.warning, 'error': log.error, 'debug': log.debug},
-            )
-            all_files = find_src_files(str(root_path))
-            repo_mapper.get_repo_map(other_files=all_files, auto_mode=True)
-            log.info("Repository map has been pre-cached.")
-        except Exception as e:
-            log.error(f"Failed to pre-cache repository map: {e}")
+        log.info("Auto-caching enabled. Warming up repository map in the background...")
+        start_background_warmup(args.project_root, workers=args.warmup_workers)
 
     # Run the MCP server
+    if args.metrics_endpoint:
+        if args.transport == "http":
+            mcp.custom_route("/metrics", methods=["GET"])(metrics_endpoint)
+        else:
+            log.warning("--metrics-endpoint requires --transport http; ignoring.")
+
+    # Load the tokenizer while the client is still connecting
+    preload_tokenizer("gpt-4")
+
     log.info("Starting FastMCP server...")
     try:
-        mcp.run()
+        if args.transport == "http":
+            mcp.run(transport="http", host=args.host, port=args.port)
+        else:
+            mcp.run()
     except KeyboardInterrupt:
         print("\nServer shutting down gracefully.")
 
@@ -0,0 +1,210 @@
+"""
+Hierarchical per-package ranking for monorepos.
+
+Files are partitioned into shards (packages), each shard is ranked on its
+own subgraph, and the shards are ranked against each other on a small graph
+of cross-package references. A file's rank is its shard's rank times its
+rank inside the shard. Shard rankings are cached by the content of their
+subgraph, so a change in one package only invalidates that package's shard.
+"""
+
+import hashlib
+import os
+import threading
+from collections import Counter, OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+# Files that make a directory a package of its own
+PACKAGE_MARKERS = (
+    "pyproject.toml", "setup.py", "setup.cfg", "package.json", "go.mod", "Cargo.toml",
+    "pom.xml", "build.gradle", "build.gradle.kts", "composer.json", "Gemfile", "BUILD", "BUILD.bazel",
+)
+# Shard of the files at the repository root
+ROOT_SHARD = "."
+# Share of a file's in-shard rank given by references from other shards
+CROSS_REFERENCE_WEIGHT = 0.5
+# Threads ranking uncached shards
+SHARD_WORKERS = 4
+# Number of shard rankings kept
+MAX_CACHED_SHARDS = 1024
+
+
+class ShardResolver:
+    """Maps a relative file name to its shard: the nearest enclosing directory
+    with a package marker, else its top-level directory."""
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self._shards: Dict[str, str] = {}
+
+    def shard_of(self, rel_fname: str) -> str:
+        return self._shard_of_dir(os.path.dirname(rel_fname))
+
+    def _shard_of_dir(self, directory: str) -> str:
+        shard = self._shards.get(directory)
+        if shard is not None:
+            return shard
+        if not directory:
+            shard = ROOT_SHARD
+        elif any((self.root / directory / marker).exists() for marker in PACKAGE_MARKERS):
+            shard = directory
+        else:
+            shard = self._shard_of_dir(os.path.dirname(directory))
+            if shard == ROOT_SHARD:
+                shard = directory.split(os.sep)[0]
+        self._shards[directory] = shard
+        return shard
+
+
+class ShardRankCache:
+    """LRU cache of in-shard ranks keyed by a digest of the shard's subgraph."""
+
+    def __init__(self, max_shards: int = MAX_CACHED_SHARDS):
+        self.max_shards = max_shards
+        self._entries: "OrderedDict[str, Dict[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Dict[str, float]]:
+        with self._lock:
+            ranks = self._entries.get(key)
+            if ranks is not None:
+                self._entries.move_to_end(key)
+            return ranks
+
+    def put(self, key: str, ranks: Dict[str, float]):
+        with self._lock:
+            self._entries[key] = ranks
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_shards:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+SHARD_RANK_CACHE = ShardRankCache()
+
+
+def shard_key(files: Iterable[str], edges: Counter, personalization: Dict[str, float]) -> str:
+    """Digest of everything an in-shard ranking depends on."""
+    hasher = hashlib.sha1()
+    for rel_fname in sorted(files):
+        hasher.update(rel_fname.encode("utf-8", errors="replace") + b"\0")
+    hasher.update(b"\1")
+    for (ref_fname, def_fname), weight in sorted(edges.items()):
+        hasher.update(f"{ref_fname}\0{def_fname}\0{weight}\0".encode("utf-8", errors="replace"))
+    hasher.update(b"\1")
+    for rel_fname, value in sorted(personalization.items()):
+        hasher.update(f"{rel_fname}\0{value}\0".encode("utf-8", errors="replace"))
+    return hasher.hexdigest()
+
+
+def rank_sharded(
+    rel_fnames: List[str],
+    defines: Dict[str, Set[str]],
+    references: Dict[str, Set[str]],
+    personalization: Dict[str, float],
+    shard_of: Callable[[str], str],
+    rank_graph: Callable,
+    cache: Optional[ShardRankCache] = None,
+    workers: int = SHARD_WORKERS,
+) -> Tuple[Dict[str, float], Dict[str, int]]:
+    """Rank files shard by shard and combine through the inter-shard graph.
+
+    rank_graph(G, personalization) runs PageRank over a weighted DiGraph.
+    Returns the file ranks and counters (shards, cache hits and misses).
+    """
+    import networkx as nx
+
+    shard_files: Dict[str, List[str]] = defaultdict(list)
+    file_shard: Dict[str, str] = {}
+    for rel_fname in rel_fnames:
+        shard = shard_of(rel_fname)
+        file_shard[rel_fname] = shard
+        shard_files[shard].append(rel_fname)
+
+    intra_edges: Dict[str, Counter] = defaultdict(Counter)
+    cross_edges: Counter = Counter()
+    cross_inbound: Counter = Counter()
+    for name, ref_fnames in references.items():
+        def_fnames = defines.get(name)
+        if not def_fnames:
+            continue
+        for ref_fname in ref_fnames:
+            ref_shard = file_shard.get(ref_fname)
+            for def_fname in def_fnames:
+                if ref_fname == def_fname:
+                    continue
+                def_shard = file_shard.get(def_fname)
+                if ref_shard is None or def_shard is None:
+                    continue
+                if ref_shard == def_shard:
+                    intra_edges[ref_shard][(ref_fname, def_fname)] += 1
+                else:
+                    cross_edges[(ref_shard, def_shard)] += 1
+                    cross_inbound[def_fname] += 1
+
+    def rank_shard(shard: str) -> Dict[str, float]:
+        G = nx.DiGraph()
+        G.add_nodes_from(shard_files[shard])
+        for (ref_fname, def_fname), weight in intra_edges[shard].items():
+            G.add_edge(ref_fname, def_fname, weight=weight)
+        return rank_graph(G, shard_personalization[shard] or None)
+
+    shard_personalization = {
+        shard: {f: personalization[f] for f in files if f in personalization}
+        for shard, files in shard_files.items()
+    }
+    local_ranks: Dict[str, Dict[str, float]] = {}
+    keys = {}
+    for shard, files in shard_files.items():
+        keys[shard] = shard_key(files, intra_edges[shard], shard_personalization[shard])
+        cached = cache.get(keys[shard]) if cache is not None else None
+        if cached is not None:
+            local_ranks[shard] = cached
+
+    stale = [shard for shard in shard_files if shard not in local_ranks]
+    if len(stale) > 1 and workers > 1:
+        with ThreadPoolExecutor(max_workers=min(workers, len(stale))) as executor:
+            for shard, ranks in zip(stale, executor.map(rank_shard, stale)):
+                local_ranks[shard] = ranks
+    else:
+        for shard in stale:
+            local_ranks[shard] = rank_shard(shard)
+    if cache is not None:
+        for shard in stale:
+            cache.put(keys[shard], local_ranks[shard])
+
+    # Rank the shards themselves on cross-package references
+    shard_graph = nx.DiGraph()
+    shard_graph.add_nodes_from(shard_files)
+    for (ref_shard, def_shard), weight in cross_edges.items():
+        shard_graph.add_edge(ref_shard, def_shard, weight=weight)
+    chat_shards = Counter()
+    for rel_fname, value in personalization.items():
+        if rel_fname in file_shard:
+            chat_shards[file_shard[rel_fname]] += value
+    shard_ranks = rank_graph(shard_graph, dict(chat_shards) or None)
+
+    ranks = {}
+    for shard, files in shard_files.items():
+        inbound_total = sum(cross_inbound[f] for f in files)
+        for rel_fname in files:
+            local = local_ranks[shard].get(rel_fname, 0.0)
+            if inbound_total:
+                # Files other packages depend on matter beyond their own package
+                local = (1 - CROSS_REFERENCE_WEIGHT) * local + CROSS_REFERENCE_WEIGHT * cross_inbound[rel_fname] / inbound_total
+            ranks[rel_fname] = shard_ranks.get(shard, 0.0) * local
+
+    counters = {
+        "shards": len(shard_files),
+        "shard_rank_cache_hits": len(shard_files) - len(stale),
+        "shard_rank_cache_misses": len(stale),
+    }
+    return ranks, counters
@@ -0,0 +1,567 @@
+"""
+Compact binary snapshot of a repository's tags, file graph and ranks.
+
+A snapshot is one file: an 8-byte magic, the length of a JSON header and the
+header itself, followed by 64-byte aligned numpy arrays whose dtype, shape
+and offset the header lists:
+
+- file and symbol string tables: UTF-8 names concatenated in `*_data`, with
+  `*_offsets` (n + 1 int64) delimiting them; files are sorted by name
+- `file_mtimes`: modification time of each file when it was indexed
+- occurrence columns sorted by file: `occ_file`, `occ_symbol`, `occ_line`,
+  `occ_kind` (0 definition, 1 reference), with `file_occ_offsets` (n + 1)
+  delimiting each file's occurrences
+- the weighted reference graph in CSR form: `graph_indptr` (n + 1),
+  `graph_indices` (definition file of each edge) and `graph_weights`
+  (number of identifiers linking the two files)
+- `ranks`: the PageRank of every file without personalization
+
+Loading maps or reads the file and slices the arrays out of it without
+copying or decoding, so it takes milliseconds regardless of repository size.
+Mapped snapshots are shared through the page cache by every process that
+opens them; SnapshotRegistry keeps one open per project root for the server.
+"""
+
+import json
+import logging
+import mmap
+import os
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from utils import Tag
+
+if TYPE_CHECKING:
+    from repomap_class import RepoMap
+
+log = logging.getLogger()
+
+SNAPSHOT_MAGIC = b"RMSNAP01"
+SNAPSHOT_VERSION = 1
+SNAPSHOT_ALIGNMENT = 64
+# Default snapshot location inside the repository
+SNAPSHOT_FNAME = f".repomap.snapshot.v{SNAPSHOT_VERSION}.bin"
+
+KIND_CODES = {"def": 0, "ref": 1}
+KIND_NAMES = ("def", "ref")
+
+# Arrays of every snapshot, grouped by their length: one per file (plus one
+# for offsets), per file name byte, per symbol, per symbol name byte, per
+# occurrence and per graph edge
+SNAPSHOT_ARRAY_LENGTHS = {
+    "file_offsets": "files+1",
+    "file_data": "file_bytes",
+    "file_mtimes": "files",
+    "symbol_offsets": "symbols+1",
+    "symbol_data": "symbol_bytes",
+    "occ_file": "occurrences",
+    "occ_symbol": "occurrences",
+    "occ_line": "occurrences",
+    "occ_kind": "occurrences",
+    "file_occ_offsets": "files+1",
+    "graph_indptr": "files+1",
+    "graph_indices": "edges",
+    "graph_weights": "edges",
+    "ranks": "files",
+}
+
+
+class SnapshotError(ValueError):
+    """Raised for files that are not snapshots, are malformed or have an unsupported version."""
+
+
+def _string_table(names: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    encoded = [name.encode("utf-8", errors="surrogateescape") for name in names]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    if encoded:
+        np.cumsum([len(e) for e in encoded], out=offsets[1:])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+
+@dataclass
+class Snapshot:
+    """Arrays of a snapshot; see the module docstring for their layout."""
+    root: str
+    arrays: Dict[str, np.ndarray]
+    # Keeps a mapped file open for as long as the arrays are used
+    _buffer: Optional[object] = None
+    # Lookup tables decoded on first use and shared by every request
+    _file_indices: Optional[Dict[str, int]] = field(default=None, repr=False)
+    _symbol_names: Optional[List[str]] = field(default=None, repr=False)
+    _symbol_ids: Optional[Dict[str, int]] = field(default=None, repr=False)
+    # Lowercased symbol names joined by newlines, and where each one starts
+    _symbol_text: Optional[Tuple[str, np.ndarray]] = field(default=None, repr=False)
+
+    @property
+    def num_files(self) -> int:
+        return len(self.arrays["file_offsets"]) - 1
+
+    @property
+    def num_symbols(self) -> int:
+        return len(self.arrays["symbol_offsets"]) - 1
+
+    def file_name(self, index: int) -> str:
+        return self._name("file", index)
+
+    def symbol_name(self, index: int) -> str:
+        return self._name("symbol", index)
+
+    def _name(self, table: str, index: int) -> str:
+        offsets = self.arrays[f"{table}_offsets"]
+        data = self.arrays[f"{table}_data"]
+        return data[offsets[index]:offsets[index + 1]].tobytes().decode("utf-8", errors="surrogateescape")
+
+    def _names(self, table: str) -> List[str]:
+        data = self.arrays[f"{table}_data"].tobytes()
+        offsets = self.arrays[f"{table}_offsets"].tolist()
+        return [
+            data[start:end].decode("utf-8", errors="surrogateescape")
+            for start, end in zip(offsets, offsets[1:])
+        ]
+
+    def file_names(self) -> List[str]:
+        return self._names("file")
+
+    def file_index(self, rel_fname: str) -> Optional[int]:
+        """Index of a file by binary search over the sorted file table, or None."""
+        target = rel_fname.encode("utf-8", errors="surrogateescape")
+        lo, hi = 0, self.num_files
+        while lo < hi:
+            mid = (lo + hi) // 2
+            offsets = self.arrays["file_offsets"]
+            name = self.arrays["file_data"][offsets[mid]:offsets[mid + 1]].tobytes()
+            if name < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.num_files and self.file_name(lo) == rel_fname:
+            return lo
+        return None
+
+    def file_indices(self) -> Dict[str, int]:
+        """Index of every file by name."""
+        if self._file_indices is None:
+            self._file_indices = {name: index for index, name in enumerate(self.file_names())}
+        return self._file_indices
+
+    def symbol_names(self) -> List[str]:
+        if self._symbol_names is None:
+            self._symbol_names = self._names("symbol")
+        return self._symbol_names
+
+    def symbol_ids(self) -> Dict[str, int]:
+        """Index of every symbol by name."""
+        if self._symbol_ids is None:
+            self._symbol_ids = {name: index for index, name in enumerate(self.symbol_names())}
+        return self._symbol_ids
+
+    def matching_symbols(self, queries: List[str]) -> np.ndarray:
+        """Mask of the symbols whose name contains any of the queries, ignoring case.
+
+        Scans all names at once with str.find, so a query costs about as
+        much as searching one string of the size of the symbol table.
+        """
+        mask = np.zeros(self.num_symbols, dtype=bool)
+        if not all(queries):
+            mask[:] = True
+            return mask
+        if self._symbol_text is None:
+            names = self.symbol_names()
+            starts = np.zeros(len(names), dtype=np.int64)
+            np.cumsum([len(name) + 1 for name in names[:-1]], out=starts[1:])
+            self._symbol_text = ("\n".join(names).lower(), starts)
+        text, starts = self._symbol_text
+        for query in {query.lower() for query in queries}:
+            if "\n" in query:
+                continue
+            hits = []
+            pos = text.find(query)
+            while pos != -1:
+                hits.append(pos)
+                # A symbol containing the query once is enough; skip to the next one
+                pos = text.find("\n", pos + len(query))
+                pos = text.find(query, pos) if pos != -1 else -1
+            mask[np.searchsorted(starts, hits, side="right") - 1] = True
+        return mask
+
+    def occurrence_tag(self, occurrence: int) -> Tag:
+        """Materialize one occurrence."""
+        rel_fname = self.file_name(int(self.arrays["occ_file"][occurrence]))
+        return Tag(
+            rel_fname=rel_fname,
+            fname=str(Path(self.root) / rel_fname),
+            line=int(self.arrays["occ_line"][occurrence]),
+            name=self.symbol_name(int(self.arrays["occ_symbol"][occurrence])),
+            kind=KIND_NAMES[self.arrays["occ_kind"][occurrence]],
+        )
+
+    def file_tags(self, index: int) -> List[Tag]:
+        """Materialize the tags of one file."""
+        start, end = self.arrays["file_occ_offsets"][index:index + 2]
+        rel_fname = self.file_name(index)
+        fname = str(Path(self.root) / rel_fname)
+        return [
+            Tag(rel_fname=rel_fname, fname=fname, line=int(line),
+                name=self.symbol_name(symbol), kind=KIND_NAMES[kind])
+            for symbol, line, kind in zip(
+                self.arrays["occ_symbol"][start:end].tolist(),
+                self.arrays["occ_line"][start:end].tolist(),
+                self.arrays["occ_kind"][start:end].tolist(),
+            )
+        ]
+
+    def matching_tags(self, file_indices: Iterable[int], symbols: np.ndarray) -> Dict[int, List[Tag]]:
+        """Tags of the symbols in a mask within the given files, by file index, in file order."""
+        selected = np.zeros(self.num_files, dtype=bool)
+        selected[np.fromiter(file_indices, dtype=np.int64)] = True
+        occurrences = np.flatnonzero(symbols[self.arrays["occ_symbol"]] & selected[self.arrays["occ_file"]])
+        tags: Dict[int, List[Tag]] = {}
+        for file_index, symbol, line, kind in zip(
+            self.arrays["occ_file"][occurrences].tolist(),
+            self.arrays["occ_symbol"][occurrences].tolist(),
+            self.arrays["occ_line"][occurrences].tolist(),
+            self.arrays["occ_kind"][occurrences].tolist(),
+        ):
+            file_tags = tags.get(file_index)
+            if file_tags is None:
+                file_tags = tags[file_index] = []
+                rel_fname = self.file_name(file_index)
+                fname = str(Path(self.root) / rel_fname)
+            else:
+                rel_fname, fname = file_tags[0].rel_fname, file_tags[0].fname
+            file_tags.append(Tag(rel_fname=rel_fname, fname=fname, line=line,
+                                 name=self.symbol_name(symbol), kind=KIND_NAMES[kind]))
+        return tags
+
+    def ranks_by_file(self) -> Dict[str, float]:
+        return dict(zip(self.file_names(), self.arrays["ranks"].tolist()))
+
+    def close(self):
+        """Release the mapped file; the arrays must not be used afterwards."""
+        self.arrays = {}
+        if self._buffer is not None:
+            try:
+                self._buffer.close()
+            except BufferError:
+                # Views handed out earlier are still alive; the mapping goes with them
+                pass
+            self._buffer = None
+
+
+def reference_graph(
+    occ_node: np.ndarray, occ_symbol: np.ndarray, occ_kind: np.ndarray, num_nodes: int
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """CSR file graph from tag occurrences, as RepoMap.build_reference_graph builds it.
+
+    Each file referencing an identifier gets an edge to every other file
+    defining it; an edge's weight is the number of identifiers linking the
+    two files. Returns (indptr, indices, weights).
+    """
+    key = occ_symbol.astype(np.int64) * num_nodes + occ_node
+    is_def = occ_kind == KIND_CODES["def"]
+    def_symbol, def_node = np.divmod(np.unique(key[is_def]), num_nodes)
+    ref_symbol, ref_node = np.divmod(np.unique(key[~is_def]), num_nodes)
+
+    # Definitions are sorted by symbol, so each reference joins a contiguous run
+    start = np.searchsorted(def_symbol, ref_symbol, side="left")
+    counts = np.searchsorted(def_symbol, ref_symbol, side="right") - start
+    src = np.repeat(ref_node, counts)
+    dst = def_node[np.repeat(start - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())]
+    keep = src != dst
+
+    edges, weights = np.unique(src[keep] * num_nodes + dst[keep], return_counts=True)
+    src, dst = np.divmod(edges, num_nodes)
+    indptr = np.zeros(num_nodes + 1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=num_nodes), out=indptr[1:])
+    return indptr, dst.astype(np.int32), weights.astype(np.float32)
+
+
+def pagerank_csr(
+    indptr: np.ndarray,
+    indices: np.ndarray,
+    weights: np.ndarray,
+    personalization: Optional[np.ndarray] = None,
+    alpha: float = 0.85,
+    max_iter: int = 100,
+    tol: float = 1.0e-6,
+) -> np.ndarray:
+    """PageRank of a CSR graph; the same power iteration as networkx.pagerank.
+
+    personalization holds a weight per node (None for uniform); dangling
+    nodes distribute their rank like it. Raises ZeroDivisionError for an
+    all-zero personalization and RuntimeError when the iteration does not
+    converge, where networkx raises its own exceptions.
+    """
+    import scipy.sparse
+
+    num_nodes = len(indptr) - 1
+    if num_nodes == 0:
+        return np.zeros(0)
+    weights = weights.astype(np.float64)
+    rows = np.repeat(np.arange(num_nodes), np.diff(indptr))
+    out_weight = np.bincount(rows, weights=weights, minlength=num_nodes)
+    scale = np.zeros(num_nodes)
+    np.divide(1.0, out_weight, out=scale, where=out_weight != 0)
+    A = scipy.sparse.csr_array(
+        (weights * scale[rows], indices, indptr),
+        shape=(num_nodes, num_nodes),
+    )
+
+    x = np.repeat(1.0 / num_nodes, num_nodes)
+    if personalization is None:
+        p = np.repeat(1.0 / num_nodes, num_nodes)
+    else:
+        p = np.asarray(personalization, dtype=np.float64)
+        if p.sum() == 0:
+            raise ZeroDivisionError
+        p = p / p.sum()
+    is_dangling = np.flatnonzero(out_weight == 0)
+    for _ in range(max_iter):
+        xlast = x
+        x = alpha * (x @ A + x[is_dangling].sum() * p) + (1 - alpha) * p
+        if np.absolute(x - xlast).sum() < num_nodes * tol:
+            return x
+    raise RuntimeError(f"PageRank failed to converge in {max_iter} iterations")
+
+
+def build_snapshot(repo_map: "RepoMap", fnames: Iterable[str]) -> Snapshot:
+    """Collect the tags of fnames through repo_map (and its caches) into a snapshot."""
+    files = sorted((repo_map.get_rel_fname(str(Path(f).resolve())), str(Path(f).resolve())) for f in fnames)
+    symbols: Dict[str, int] = {}
+    occ_symbol: List[int] = []
+    occ_line: List[int] = []
+    occ_kind: List[int] = []
+    occ_counts: List[int] = []
+    mtimes: List[float] = []
+
+    for rel_fname, fname in files:
+        # Parser errors and other non-identifier tags never take part in ranking
+        tags = [tag for tag in repo_map.get_tags(fname, rel_fname) if tag.kind in KIND_CODES]
+        mtimes.append(repo_map.get_mtime(fname) or 0.0)
+        occ_counts.append(len(tags))
+        for tag in tags:
+            occ_symbol.append(symbols.setdefault(tag.name, len(symbols)))
+            occ_line.append(tag.line)
+            occ_kind.append(KIND_CODES[tag.kind])
+
+    num_files = len(files)
+    file_data, file_offsets = _string_table([rel_fname for rel_fname, _ in files])
+    symbol_data, symbol_offsets = _string_table(list(symbols))
+    occ_file = np.repeat(np.arange(num_files, dtype=np.int32), occ_counts)
+    file_occ_offsets = np.zeros(num_files + 1, dtype=np.int64)
+    np.cumsum(occ_counts, out=file_occ_offsets[1:])
+    occ_symbol = np.array(occ_symbol, dtype=np.int32)
+    occ_kind = np.array(occ_kind, dtype=np.uint8)
+
+    indptr, indices, weights = reference_graph(occ_file, occ_symbol, occ_kind, num_files)
+    try:
+        ranks = pagerank_csr(indptr, indices, weights)
+    except RuntimeError as e:
+        repo_map.output_handlers['error'](f"Error running PageRank: {e}")
+        ranks = np.ones(num_files)
+
+    arrays = {
+        "file_data": file_data,
+        "file_offsets": file_offsets,
+        "file_mtimes": np.array(mtimes, dtype=np.float64),
+        "symbol_data": symbol_data,
+        "symbol_offsets": symbol_offsets,
+        "occ_file": occ_file,
+        "occ_symbol": occ_symbol,
+        "occ_line": np.array(occ_line, dtype=np.int32),
+        "occ_kind": occ_kind,
+        "file_occ_offsets": file_occ_offsets,
+        "graph_indptr": indptr,
+        "graph_indices": indices,
+        "graph_weights": weights,
+        "ranks": ranks,
+    }
+    return Snapshot(root=str(repo_map.root), arrays=arrays)
+
+
+def write_snapshot(snapshot: Snapshot, path: str):
+    """Write a snapshot atomically (through a temporary file and a rename)."""
+    layout = {}
+    offset = 0
+    for name, array in snapshot.arrays.items():
+        offset = -(-offset // SNAPSHOT_ALIGNMENT) * SNAPSHOT_ALIGNMENT
+        layout[name] = {"dtype": array.dtype.newbyteorder("<").str, "shape": list(array.shape), "offset": offset}
+        offset += array.nbytes
+    header = json.dumps({
+        "version": SNAPSHOT_VERSION,
+        "root": snapshot.root,
+        "arrays": layout,
+    }).encode("utf-8")
+    # Array offsets are relative to the first aligned byte after the header
+    data_start = -(-(len(SNAPSHOT_MAGIC) + 8 + len(header)) // SNAPSHOT_ALIGNMENT) * SNAPSHOT_ALIGNMENT
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(SNAPSHOT_MAGIC)
+        f.write(len(header).to_bytes(8, "little"))
+        f.write(header)
+        for name, array in snapshot.arrays.items():
+            f.write(b"\0" * (data_start + layout[name]["offset"] - f.tell()))
+            f.write(np.ascontiguousarray(array, dtype=layout[name]["dtype"]).tobytes())
+    os.replace(tmp_path, path)
+
+
+def _check_values(arrays: Dict[str, np.ndarray]) -> Optional[str]:
+    """Why the arrays cannot be indexed safely, or None if they can."""
+    num_files = len(arrays["file_offsets"]) - 1
+    num_symbols = len(arrays["symbol_offsets"]) - 1
+    # Offsets start at zero, never decrease and end at the length they index
+    for name, target in (
+        ("file_offsets", "file_data"),
+        ("symbol_offsets", "symbol_data"),
+        ("file_occ_offsets", "occ_file"),
+        ("graph_indptr", "graph_indices"),
+    ):
+        offsets = arrays[name]
+        if offsets[0] != 0 or offsets[-1] != len(arrays[target]) or not np.all(np.diff(offsets) >= 0):
+            return f"array {name} is not a valid offset table into {target}"
+    for name, bound in (
+        ("occ_file", num_files),
+        ("occ_symbol", num_symbols),
+        ("occ_kind", len(KIND_NAMES)),
+        ("graph_indices", num_files),
+    ):
+        values = arrays[name]
+        if len(values) and (values.min() < 0 or values.max() >= bound):
+            return f"array {name} has entries outside [0, {bound})"
+    return None
+
+
+def load_snapshot(path: str, use_mmap: bool = True) -> Snapshot:
+    """Open a snapshot; with use_mmap the arrays are read-only views of the mapped file."""
+    if os.path.getsize(path) < len(SNAPSHOT_MAGIC) + 8:
+        raise SnapshotError(f"{path}: not a RepoMap snapshot")
+    with open(path, "rb") as f:
+        if use_mmap:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            buffer = f.read()
+
+    def fail(message):
+        if use_mmap:
+            buffer.close()
+        raise SnapshotError(f"{path}: {message}")
+
+    if buffer[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+        fail("not a RepoMap snapshot")
+    header_len = int.from_bytes(buffer[len(SNAPSHOT_MAGIC):len(SNAPSHOT_MAGIC) + 8], "little")
+    header_start = len(SNAPSHOT_MAGIC) + 8
+    try:
+        header = json.loads(bytes(buffer[header_start:header_start + header_len]).decode("utf-8"))
+    except (UnicodeDecodeError, json.JSONDecodeError) as e:
+        fail(f"unreadable header ({e})")
+    if not isinstance(header, dict):
+        fail("unreadable header")
+    if header.get("version") != SNAPSHOT_VERSION:
+        fail(f"unsupported snapshot version {header.get('version')}")
+    if not isinstance(header.get("root"), str) or not isinstance(header.get("arrays"), dict):
+        fail("header lacks the root or the array layout")
+    missing = sorted(set(SNAPSHOT_ARRAY_LENGTHS) - set(header["arrays"]))
+    if missing:
+        fail(f"missing arrays {', '.join(missing)}")
+    data_start = -(-(header_start + header_len) // SNAPSHOT_ALIGNMENT) * SNAPSHOT_ALIGNMENT
+
+    # Check every array fits before creating views, which pin the mapping open
+    layout = {}
+    for name, spec in header["arrays"].items():
+        try:
+            dtype = np.dtype(spec["dtype"])
+            shape = [int(n) for n in spec["shape"]]
+            offset = int(spec["offset"])
+        except (KeyError, TypeError, ValueError) as e:
+            fail(f"array {name} has a malformed layout ({e!r})")
+        if dtype.hasobject or offset < 0 or any(n < 0 for n in shape):
+            fail(f"array {name} has a malformed layout")
+        count = int(np.prod(shape, dtype=np.int64))
+        start = data_start + offset
+        if start + count * dtype.itemsize > len(buffer):
+            fail(f"array {name} is truncated")
+        layout[name] = (dtype, count, start, shape)
+
+    # Arrays indexed alongside each other must agree in length
+    lengths: Dict[str, int] = {}
+    for name, group in SNAPSHOT_ARRAY_LENGTHS.items():
+        shape = layout[name][3]
+        if len(shape) != 1:
+            fail(f"array {name} is not one-dimensional")
+        expected = lengths.setdefault(group, shape[0])
+        if shape[0] != expected:
+            fail(f"array {name} has {shape[0]} entries, expected {expected}")
+    if lengths["files+1"] < 1 or lengths["symbols+1"] < 1 or lengths["files"] != lengths["files+1"] - 1:
+        fail("file arrays disagree in length")
+    arrays = {
+        name: np.frombuffer(buffer, dtype=dtype, count=count, offset=start).reshape(shape)
+        for name, (dtype, count, start, shape) in layout.items()
+    }
+    message = _check_values(arrays)
+    if message:
+        # Drop the views first, or closing the mapping fails
+        del arrays
+        fail(message)
+    return Snapshot(root=header["root"], arrays=arrays, _buffer=buffer if use_mmap else None)
+
+
+class SnapshotRegistry:
+    """Snapshots opened by this process, one per project root.
+
+    A snapshot is reopened when its file is replaced (e.g. by a new
+    `repomap_index.py --snapshot` run); requests still holding the old one
+    keep using it until they finish.
+    """
+
+    def __init__(self):
+        self._paths: Dict[str, str] = {}
+        # root -> ((inode, size, mtime), snapshot or None if it could not be used)
+        self._open: Dict[str, Tuple[Tuple[int, int, int], Optional[Snapshot]]] = {}
+        self._lock = threading.Lock()
+
+    def register(self, project_root: str, path: str):
+        """Use path instead of SNAPSHOT_FNAME in the project root."""
+        with self._lock:
+            self._paths[str(Path(project_root).resolve())] = str(Path(path).resolve())
+
+    def get(self, project_root: str) -> Optional[Snapshot]:
+        """The current snapshot of a project, or None if it has none or it cannot be used."""
+        root = str(Path(project_root).resolve())
+        with self._lock:
+            path = self._paths.get(root) or os.path.join(root, SNAPSHOT_FNAME)
+            try:
+                st = os.stat(path)
+            except OSError:
+                self._open.pop(root, None)
+                return None
+            key = (st.st_ino, st.st_size, st.st_mtime_ns)
+            entry = self._open.get(root)
+            if entry is not None and entry[0] == key:
+                return entry[1]
+
+            try:
+                snapshot = load_snapshot(path)
+            except (SnapshotError, OSError) as e:
+                log.warning(f"Ignoring snapshot {path}: {e}")
+                snapshot = None
+            if snapshot is not None and snapshot.root != root:
+                log.warning(f"Ignoring snapshot {path}: it was built for {snapshot.root}")
+                snapshot = None
+            elif snapshot is not None:
+                log.info(f"Opened snapshot {path} ({snapshot.num_files} files, {snapshot.num_symbols} symbols)")
+            self._open[root] = (key, snapshot)
+            return snapshot
+
+    def clear(self):
+        with self._lock:
+            self._paths.clear()
+            self._open.clear()
+
+
+# Snapshots opened by this process
+SNAPSHOTS = SnapshotRegistry()
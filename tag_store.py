@@ -0,0 +1,186 @@
+"""
+SQLite-backed relational tag store for RepoMap.
+
+Tags are kept in normalized tables (files, symbols, occurrences) so that the
+per-identifier definition/reference file sets and the file-pair edge weights
+used for ranking can be computed with set-based queries instead of loading
+every tag into Python.
+"""
+
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from utils import Tag
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    fname TEXT NOT NULL UNIQUE,
+    rel_fname TEXT NOT NULL,
+    mtime REAL
+);
+CREATE TABLE IF NOT EXISTS symbols (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS occurrences (
+    file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    symbol_id INTEGER NOT NULL REFERENCES symbols(id),
+    line INTEGER NOT NULL,
+    kind TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS occurrences_symbol_kind ON occurrences(symbol_id, kind, file_id);
+CREATE INDEX IF NOT EXISTS occurrences_file_kind ON occurrences(file_id, kind);
+"""
+
+# Number of files written between commits when bulk-updating the store
+COMMIT_EVERY = 500
+
+
+class TagStore:
+    """Relational store of definition and reference tags."""
+
+    def __init__(self, db_path: str):
+        self.db_path = str(db_path)
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._conn.execute(
+            "CREATE TEMP TABLE IF NOT EXISTS selected_files (file_id INTEGER PRIMARY KEY)"
+        )
+        self._symbol_ids: Dict[str, int] = {}
+
+    def close(self):
+        """Close the underlying database connection."""
+        with self._lock:
+            self._conn.close()
+
+    def get_mtimes(self) -> Dict[str, float]:
+        """Return the stored modification time for every known file."""
+        with self._lock:
+            return dict(self._conn.execute("SELECT fname, mtime FROM files"))
+
+    def _symbol_id(self, cur: sqlite3.Cursor, name: str) -> int:
+        sid = self._symbol_ids.get(name)
+        if sid is None:
+            cur.execute("INSERT OR IGNORE INTO symbols(name) VALUES (?)", (name,))
+            cur.execute("SELECT id FROM symbols WHERE name = ?", (name,))
+            sid = cur.fetchone()[0]
+            self._symbol_ids[name] = sid
+        return sid
+
+    def _replace_file_tags(self, cur: sqlite3.Cursor, fname: str, rel_fname: str,
+                           mtime: Optional[float], tags: List[Tag]):
+        cur.execute(
+            "INSERT INTO files(fname, rel_fname, mtime) VALUES (?, ?, ?) "
+            "ON CONFLICT(fname) DO UPDATE SET rel_fname = excluded.rel_fname, mtime = excluded.mtime",
+            (fname, rel_fname, mtime),
+        )
+        cur.execute("SELECT id FROM files WHERE fname = ?", (fname,))
+        file_id = cur.fetchone()[0]
+        cur.execute("DELETE FROM occurrences WHERE file_id = ?", (file_id,))
+        cur.executemany(
+            "INSERT INTO occurrences(file_id, symbol_id, line, kind) VALUES (?, ?, ?, ?)",
+            [
+                (file_id, self._symbol_id(cur, tag.name), tag.line, tag.kind)
+                for tag in tags
+                if tag.kind in ("def", "ref")
+            ],
+        )
+
+    def update_files(self, entries: Iterable[Tuple[str, str, Optional[float], List[Tag]]]) -> int:
+        """Replace the stored tags of each (fname, rel_fname, mtime, tags) entry.
+
+        Entries are consumed lazily and committed in batches, so a generator
+        can be passed to keep memory flat on cold stores.
+        """
+        count = 0
+        with self._lock:
+            cur = self._conn.cursor()
+            try:
+                for fname, rel_fname, mtime, tags in entries:
+                    self._replace_file_tags(cur, fname, rel_fname, mtime, tags)
+                    count += 1
+                    if count % COMMIT_EVERY == 0:
+                        self._conn.commit()
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                self._symbol_ids.clear()
+                raise
+        return count
+
+    def get_file_tags(self, fname: str) -> List[Tag]:
+        """Return all stored tags for a single file."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT f.rel_fname, o.line, s.name, o.kind FROM occurrences o "
+                "JOIN files f ON f.id = o.file_id JOIN symbols s ON s.id = o.symbol_id "
+                "WHERE f.fname = ? ORDER BY o.rowid",
+                (fname,),
+            ).fetchall()
+        return [Tag(rel_fname=rel, fname=fname, line=line, name=name, kind=kind)
+                for rel, line, name, kind in rows]
+
+    @contextmanager
+    def selection(self, fnames: Iterable[str]) -> Iterator["TagStore"]:
+        """Restrict the aggregation queries below to the given files."""
+        with self._lock:
+            self._conn.execute("DELETE FROM selected_files")
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO selected_files(file_id) SELECT id FROM files WHERE fname = ?",
+                ((fname,) for fname in fnames),
+            )
+            try:
+                yield self
+            finally:
+                self._conn.execute("DELETE FROM selected_files")
+
+    def count_occurrences(self) -> Tuple[int, int]:
+        """Return (definitions, references) across the selected files."""
+        counts = dict(self._conn.execute(
+            "SELECT o.kind, COUNT(*) FROM occurrences o "
+            "JOIN selected_files q ON q.file_id = o.file_id GROUP BY o.kind"
+        ))
+        return counts.get("def", 0), counts.get("ref", 0)
+
+    def edge_weights(self) -> Iterator[Tuple[str, str, int]]:
+        """Yield (referencing file, defining file, weight) between selected files.
+
+        The weight is the number of distinct identifiers the first file
+        references and the second defines, matching one graph edge per name.
+        """
+        return self._conn.execute(
+            """
+            WITH refs AS (
+                SELECT DISTINCT o.file_id, o.symbol_id FROM occurrences o
+                JOIN selected_files q ON q.file_id = o.file_id WHERE o.kind = 'ref'
+            ), defs AS (
+                SELECT DISTINCT o.file_id, o.symbol_id FROM occurrences o
+                JOIN selected_files q ON q.file_id = o.file_id WHERE o.kind = 'def'
+            )
+            SELECT rf.rel_fname, df.rel_fname, COUNT(*)
+            FROM refs r
+            JOIN defs d ON d.symbol_id = r.symbol_id AND d.file_id != r.file_id
+            JOIN files rf ON rf.id = r.file_id
+            JOIN files df ON df.id = d.file_id
+            GROUP BY r.file_id, d.file_id
+            """
+        )
+
+    def iter_definitions(self, rel_fnames: Optional[Iterable[str]] = None) -> Iterator[Tag]:
+        """Yield definition tags of the selected files, optionally narrowed further."""
+        rows = self._conn.execute(
+            "SELECT f.rel_fname, f.fname, o.line, s.name FROM occurrences o "
+            "JOIN selected_files q ON q.file_id = o.file_id "
+            "JOIN files f ON f.id = o.file_id JOIN symbols s ON s.id = o.symbol_id "
+            "WHERE o.kind = 'def' ORDER BY o.file_id, o.rowid"
+        )
+        wanted = set(rel_fnames) if rel_fnames is not None else None
+        for rel_fname, fname, line, name in rows:
+            if wanted is None or rel_fname in wanted:
+                yield Tag(rel_fname=rel_fname, fname=fname, line=line, name=name, kind="def")
@@ -0,0 +1,32 @@
+"""
+Helpers shared by the tests. pytest loads this module itself; the tests
+import it by name so that they also run as scripts.
+"""
+
+import pytest
+
+HANDLERS = {'info': lambda msg: None, 'warning': lambda msg: None, 'error': lambda msg: None}
+
+
+def python_parser_available():
+    try:
+        from grep_ast.tsl import get_parser
+        get_parser("python")
+        return True
+    except Exception:
+        return False
+
+
+def require_python_parser():
+    """Skip the calling test when the Tree-sitter Python grammar cannot be loaded."""
+    if not python_parser_available():
+        pytest.skip("Tree-sitter Python grammar unavailable")
+
+
+def run_tests(*tests):
+    """Run tests from a script's __main__ block, reporting skips instead of stopping at them."""
+    for test in tests:
+        try:
+            test()
+        except pytest.skip.Exception as e:
+            print(f"- Skipped {test.__name__}: {e.msg}")
@@ -8,22 +8,35 @@ Uses Tree-sitter for parsing and PageRank for ranking importance.
 """
 
 import argparse
+import cProfile
 import os
 import sys
 import json
 from pathlib import Path
-from typing import List
+from typing import Dict, List, Optional
 
-from utils import count_tokens, read_text, Tag
+from utils import count_tokens, preload_tokenizer, read_text, Tag
 from scm import get_scm_fname
 from importance import is_important, filter_important_files
 from repomap_class import RepoMap
+from metrics import MemoryLimitExceeded, RequestMetrics
+from discovery import skip_reason
 
 
-def find_src_files(directory: str) -> List[str]:
-    """Find source files in a directory."""
+def find_src_files(directory: str, skipped: Optional[Dict[str, str]] = None) -> List[str]:
+    """Find source files in a directory.
+
+    Files that are too large, binary, minified or generated are left out and
+    recorded in skipped with their reason.
+    """
+    def keep(path):
+        reason = skip_reason(path)
+        if reason is not None and skipped is not None:
+            skipped[path] = reason
+        return reason is None
+
     if not os.path.isdir(directory):
-        return [directory] if os.path.isfile(directory) else []
+        return [directory] if os.path.isfile(directory) and keep(directory) else []
     
     src_files = []
     for root, dirs, files in os.walk(directory):
@@ -33,7 +46,8 @@ def find_src_files(directory: str) -> List[str]:
         for file in files:
             if not file.startswith('.'):
                 full_path = os.path.join(root, file)
-                src_files.append(full_path)
+                if keep(full_path):
+                    src_files.append(full_path)
     
     return src_files
 
@@ -53,6 +67,43 @@ def tool_error(message):
     print(f"Error: {message}", file=sys.stderr)
 
 
+def resolve_input_files(args, root_path: Path, skipped: Optional[Dict[str, str]] = None):
+    """Expand the CLI path arguments into absolute (chat_files, other_files).
+
+    Files left out during discovery are recorded in skipped with their reason.
+    """
+    if args.auto:
+        tool_output("Running in automatic mode...")
+        chat_files = []
+        other_files = [str(Path(p).resolve()) for p in find_src_files(str(root_path), skipped=skipped)]
+    else:
+        # Process file arguments
+        chat_files_from_args = args.chat_files or [] # These are the paths as strings from the CLI
+        
+        # Determine the list of unresolved path specifications that will form the 'other_files'
+        # These can be files or directories. find_src_files will expand them.
+        unresolved_paths_for_other_files_specs = []
+        if args.other_files:  # If --other-files is explicitly provided, it's the source
+            unresolved_paths_for_other_files_specs.extend(args.other_files)
+        elif args.paths:  # Else, if positional paths are given, they are the source
+            unresolved_paths_for_other_files_specs.extend(args.paths)
+        # If neither, unresolved_paths_for_other_files_specs remains empty.
+
+        # Now, expand all directory paths in unresolved_paths_for_other_files_specs into actual file lists
+        # and collect all file paths. find_src_files handles both files and directories.
+        effective_other_files_unresolved = []
+        for path_spec_str in unresolved_paths_for_other_files_specs:
+            effective_other_files_unresolved.extend(find_src_files(path_spec_str, skipped=skipped))
+        
+        # Convert to absolute paths
+        # chat_files for RepoMap are from --chat-files argument, resolved.
+        chat_files = [str(Path(f).resolve()) for f in chat_files_from_args]
+        # other_files for RepoMap are the effective_other_files, resolved after expansion.
+        other_files = [str(Path(f).resolve()) for f in effective_other_files_unresolved]
+
+    return chat_files, other_files
+
+
 def main():
     """Main CLI entry point."""
     parser = argparse.ArgumentParser(
@@ -140,6 +191,54 @@ Examples:
         help="Exclude files with Page Rank 0 from the map"
     )
 
+    parser.add_argument(
+        "--tag-store",
+        action="store_true",
+        help="Rank using the SQLite tag store instead of loading every tag into memory"
+    )
+
+    parser.add_argument(
+        "--skeleton-index",
+        action="store_true",
+        help="Build the graph from a fast regex pass and parse only the best ranked files with Tree-sitter (for very large repositories)"
+    )
+
+    parser.add_argument(
+        "--lazy-parse",
+        action="store_true",
+        help="Parse outward from the chat and mentioned files and stop once the map budget is covered"
+    )
+
+    parser.add_argument(
+        "--sharded",
+        action="store_true",
+        help="Rank each package separately and combine them through cross-package references (for monorepos)"
+    )
+
+    parser.add_argument(
+        "--rollup",
+        action="store_true",
+        help="Show ranked directories with their top symbols instead of file contents"
+    )
+
+    parser.add_argument(
+        "--profile",
+        metavar="FILE",
+        help="Profile the run with cProfile and dump pstats to FILE (inspect with: python -m pstats FILE)"
+    )
+
+    parser.add_argument(
+        "--trace-memory",
+        action="store_true",
+        help="Report traced memory per phase and approximate cache sizes (implies printing metrics)"
+    )
+
+    parser.add_argument(
+        "--max-memory-mb",
+        type=int,
+        help="Abort with an error once mapping has grown memory by more than this many MiB"
+    )
+
     parser.add_argument(
         "--auto",
         action="store_true",
@@ -148,6 +247,9 @@ Examples:
     
     args = parser.parse_args()
     
+    # Load the tokenizer while files are discovered and parsed
+    preload_tokenizer(args.model)
+
     # Set up token counter with specified model
     def token_counter(text: str) -> int:
         return count_tokens(text, args.model)
@@ -159,36 +261,37 @@ Examples:
         'error': tool_error
     }
     
-    root_path = Path(args.root).resolve()
+    profiler = None
+    if args.profile:
+        profiler = cProfile.Profile()
+        profiler.enable()
 
-    if args.auto:
-        tool_output("Running in automatic mode...")
-        chat_files = []
-        other_files = [str(Path(p).resolve()) for p in find_src_files(str(root_path))]
-    else:
-        # Process file arguments
-        chat_files_from_args = args.chat_files or [] # These are the paths as strings from the CLI
-        
-        # Determine the list of unresolved path specifications that will form the 'other_files'
-        # These can be files or directories. find_src_files will expand them.
-        unresolved_paths_for_other_files_specs = []
-        if args.other_files:  # If --other-files is explicitly provided, it's the source
-            unresolved_paths_for_other_files_specs.extend(args.other_files)
-        elif args.paths:  # Else, if positional paths are given, they are the source
-            unresolved_paths_for_other_files_specs.extend(args.paths)
-        # If neither, unresolved_paths_for_other_files_specs remains empty.
+    try:
+        run(args, token_counter, output_handlers)
+    except MemoryLimitExceeded as e:
+        tool_error(str(e))
+        sys.exit(1)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+            tool_output(f"Profile written to {args.profile} (inspect with: python -m pstats {args.profile})")
 
-        # Now, expand all directory paths in unresolved_paths_for_other_files_specs into actual file lists
-        # and collect all file paths. find_src_files handles both files and directories.
-        effective_other_files_unresolved = []
-        for path_spec_str in unresolved_paths_for_other_files_specs:
-            effective_other_files_unresolved.extend(find_src_files(path_spec_str))
-        
-        # Convert to absolute paths
-        # chat_files for RepoMap are from --chat-files argument, resolved.
-        chat_files = [str(Path(f).resolve()) for f in chat_files_from_args]
-        # other_files for RepoMap are the effective_other_files, resolved after expansion.
-        other_files = [str(Path(f).resolve()) for f in effective_other_files_unresolved]
+
+def run(args, token_counter, output_handlers):
+    """Resolve the input files, generate the map and print it."""
+    root_path = Path(args.root).resolve()
+    metrics = RequestMetrics(
+        trace_memory=args.trace_memory,
+        memory_limit_bytes=args.max_memory_mb * 2**20 if args.max_memory_mb else None
+    )
+
+    skipped_files: Dict[str, str] = {}
+    with metrics.phase("discovery"):
+        chat_files, other_files = resolve_input_files(args, root_path, skipped_files)
+    if skipped_files and args.verbose:
+        for fname, reason in skipped_files.items():
+            tool_warning(f"Skipping {fname}: {reason}")
 
     print(f"Chat files: {chat_files}")
     
@@ -205,7 +308,12 @@ Examples:
         output_handler_funcs=output_handlers,
         verbose=args.verbose,
         max_context_window=args.max_context_window,
-        exclude_unranked=args.exclude_unranked
+        exclude_unranked=args.exclude_unranked,
+        use_tag_store=args.tag_store,
+        skeleton_index=args.skeleton_index,
+        lazy_parse=args.lazy_parse,
+        sharded=args.sharded,
+        rollup=args.rollup
     )
     
     # Generate the map
@@ -216,7 +324,9 @@ Examples:
             mentioned_fnames=mentioned_fnames,
             mentioned_idents=mentioned_idents,
             force_refresh=args.force_refresh,
-            auto_mode=args.auto
+            auto_mode=args.auto,
+            metrics=metrics,
+            skipped_files={str(Path(f).resolve()): reason for f, reason in skipped_files.items()}
         )
         
         if map_content:
@@ -245,10 +355,15 @@ Examples:
                 tool_output(map_content)
         else:
             tool_output("No repository map generated.")
+
+        if args.verbose or args.trace_memory:
+            tool_output(metrics.format())
             
     except KeyboardInterrupt:
         tool_error("Interrupted by user")
         sys.exit(1)
+    except MemoryLimitExceeded:
+        raise
     except Exception as e:
         tool_error(f"Error generating repository map: {e}")
         if args.verbose:
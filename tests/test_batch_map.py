@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Test multi-repository batch maps and the combined map.
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from conftest import HANDLERS, python_parser_available
+from multi_repo import RootRanking, fit_combined_map, merge_ranked_tags
+from repomap_class import RepoMap
+from utils import Tag
+
+
+def write_repo(temp_dir, prefix, num_files):
+    fnames = []
+    for i in range(num_files):
+        path = os.path.join(temp_dir, f"{prefix}{i}.py")
+        with open(path, "w") as f:
+            f.write(f"def {prefix}_func_{i}():\n    return {i}\n")
+        fnames.append(path)
+    return fnames
+
+
+def ranking(temp_dir, prefix, ranks):
+    repo_map = RepoMap(root=temp_dir, output_handler_funcs=dict(HANDLERS))
+    tags = [
+        (rank, Tag(rel_fname=f"{prefix}{i}.py", fname=os.path.join(temp_dir, f"{prefix}{i}.py"),
+                   line=1, name=f"{prefix}_func_{i}", kind="def"))
+        for i, rank in enumerate(ranks)
+    ]
+    return RootRanking(label=temp_dir, repo_map=repo_map, ranked_tags=tags)
+
+
+def test_merge_ranked_tags():
+    """Each root's ranks are scaled to its best tag before merging."""
+    with tempfile.TemporaryDirectory() as dir_a, tempfile.TemporaryDirectory() as dir_b:
+        roots = [ranking(dir_a, "a", [0.02, 0.01]), ranking(dir_b, "b", [0.5, 0.4, 0.1])]
+        merged = merge_ranked_tags(roots)
+        assert [(index, tag.name) for _, index, tag in merged] == [
+            (0, "a_func_0"), (1, "b_func_0"), (1, "b_func_1"), (0, "a_func_1"), (1, "b_func_2")
+        ]
+        assert merged[0][0] == 1.0 and merged[1][0] == 1.0
+        assert merge_ranked_tags([ranking(dir_a, "a", [])]) == []
+    print("✓ Merge ranked tags test passed")
+
+
+def test_fit_combined_map():
+    """The combined map has a section per root and stays within the budget."""
+    with tempfile.TemporaryDirectory() as dir_a, tempfile.TemporaryDirectory() as dir_b:
+        write_repo(dir_a, "a", 2)
+        write_repo(dir_b, "b", 3)
+        roots = [ranking(dir_a, "a", [0.02, 0.01]), ranking(dir_b, "b", [0.5, 0.4, 0.1])]
+        token_count = lambda text: len(text.split())
+
+        full = fit_combined_map(roots, 10**6, token_count)
+        assert full.index(f"Repository {dir_a}:") < full.index(f"Repository {dir_b}:")
+        assert all(f"{prefix}_func_{i}" in full for prefix, n in (("a", 2), ("b", 3)) for i in range(n))
+
+        small = fit_combined_map(roots, token_count(full) - 1, token_count)
+        assert token_count(small) < token_count(full)
+        assert "a_func_0" in small and "b_func_0" in small
+        assert fit_combined_map(roots, 1, token_count) is None
+    print("✓ Combined map fitting test passed")
+
+
+def test_batch_repo_map_tool():
+    """The tool maps every root, reports per-root errors and builds the combined map."""
+    import repomap_server
+
+    with tempfile.TemporaryDirectory() as dir_a, tempfile.TemporaryDirectory() as dir_b:
+        write_repo(dir_a, "a", 2)
+        write_repo(dir_b, "b", 3)
+        missing = os.path.join(dir_a, "missing")
+        response = asyncio.run(repomap_server.batch_repo_map(
+            [
+                {"project_root": dir_a, "token_limit": 512},
+                {"project_root": dir_b, "chat_files": ["b0.py"]},
+                {"project_root": missing},
+                {"project_root": dir_a, "chat_file": ["a0.py"]},
+            ],
+            combined_token_limit=1024,
+        ))
+        results = response["results"]
+        assert [result["project_root"] for result in results] == [dir_a, dir_b, missing, dir_a]
+        assert "map" in results[0] and "report" in results[0]
+        assert "map" in results[1]
+        assert "not found" in results[2]["error"]
+        assert "chat_file" in results[3]["error"]
+        if python_parser_available():
+            assert f"Repository {os.path.realpath(dir_a)}:" in response["combined_map"]
+            assert f"Repository {os.path.realpath(dir_b)}:" in response["combined_map"]
+        assert "fitting" in response["combined_metrics"]["phases"]
+
+        assert "error" in asyncio.run(repomap_server.batch_repo_map([]))
+    print("✓ Batch repo map tool test passed")
+
+
+def test_batch_roots_take_repo_map_options():
+    """Roots accept every repo_map option, and the combined map reuses each root's ranking."""
+    import repomap_server
+
+    calls = []
+    original = RepoMap.get_ranked_tags
+
+    def counting_get_ranked_tags(self, *args, **kwargs):
+        calls.append(self.root)
+        return original(self, *args, **kwargs)
+
+    with tempfile.TemporaryDirectory() as dir_a, tempfile.TemporaryDirectory() as dir_b:
+        write_repo(dir_a, "a", 2)
+        write_repo(dir_b, "b", 3)
+        RepoMap.get_ranked_tags = counting_get_ranked_tags
+        try:
+            response = asyncio.run(repomap_server.batch_repo_map(
+                [
+                    {"project_root": dir_a, "trace_memory": True, "sharded": True, "max_context_window": 8192},
+                    {"project_root": dir_b, "rollup": True, "profile": True, "force_refresh": True},
+                ],
+                combined_token_limit=1024,
+            ))
+        finally:
+            RepoMap.get_ranked_tags = original
+        results = response["results"]
+        assert all("map" in result for result in results), results
+        assert "memory" in results[0]["report"]["metrics"]
+        assert "profile" in results[1]
+        assert sorted(map(str, calls)) == sorted(os.path.realpath(d) for d in (dir_a, dir_b))
+    print("✓ Batch root options test passed")
+
+
+if __name__ == "__main__":
+    test_merge_ranked_tags()
+    test_fit_combined_map()
+    test_batch_repo_map_tool()
+    test_batch_roots_take_repo_map_options()
+    print("\nAll batch map tests passed!")
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Test the bytes-native parse path and windowed tag queries.
+"""
+
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from conftest import HANDLERS, require_python_parser, run_tests
+import repomap_class
+from repomap_class import RepoMap
+
+
+def test_read_source():
+    """Files are read as bytes; custom readers still work through an encode."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        fname = os.path.join(temp_dir, "mod.py")
+        with open(fname, "wb") as f:
+            f.write("def café():\n    pass\n".encode("utf-8"))
+
+        repo_map = RepoMap(root=temp_dir, output_handler_funcs=dict(HANDLERS))
+        assert repo_map._read_source(fname) == "def café():\n    pass\n".encode("utf-8")
+
+        custom = RepoMap(root=temp_dir, output_handler_funcs=dict(HANDLERS),
+                         file_reader_func=lambda path: "def other():\n    pass\n")
+        assert custom._read_source(fname) == b"def other():\n    pass\n"
+        assert RepoMap(root=temp_dir, output_handler_funcs=dict(HANDLERS),
+                       file_reader_func=lambda path: None)._read_source(fname) is None
+    print("✓ Read source test passed")
+
+
+def test_windowed_query_matches_single_query():
+    """Querying a window of top-level nodes at a time yields the same tags in the same order."""
+    require_python_parser()
+
+    original_window = repomap_class.QUERY_WINDOW_BYTES
+    try:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            fname = os.path.join(temp_dir, "mod.py")
+            with open(fname, "w") as f:
+                f.write("import os\n\n")
+                for i in range(200):
+                    f.write(f"class C{i}:\n    def m{i}(self):\n        return f{i}(os.sep)\n\n")
+                f.write("def café():\n    return C1()\n")
+
+            results = []
+            for window in (10**9, 64):
+                repomap_class.QUERY_WINDOW_BYTES = window
+                repo_map = RepoMap(root=temp_dir, output_handler_funcs=dict(HANDLERS))
+                results.append(repo_map.get_tags_raw(fname, "mod.py"))
+            assert results[0] == results[1]
+            names = {tag.name for tag in results[0]}
+            assert {"C0", "m199", "f42", "café"} <= names
+    finally:
+        repomap_class.QUERY_WINDOW_BYTES = original_window
+    print("✓ Windowed query test passed")
+
+
+if __name__ == "__main__":
+    run_tests(
+        test_read_source,
+        test_windowed_query_matches_single_query,
+    )
+    print("\nAll bytes parse tests passed!")
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Test the large, minified, binary and generated file guard.
+"""
+
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import discovery
+import repomap_class
+from conftest import HANDLERS
+from discovery import find_src_files, skip_reason
+from repomap_class import RepoMap
+from utils import iter_bounded_lines
+
+
+def write(temp_dir, rel_fname, content):
+    path = os.path.join(temp_dir, rel_fname)
+    mode = "wb" if isinstance(content, bytes) else "w"
+    with open(path, mode) as f:
+        f.write(content)
+    return path
+
+
+def test_skip_reason():
+    """Binary, minified and generated files are recognized from a small prefix."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        assert skip_reason(write(temp_dir, "ok.py", "def f():\n    return 1\n")) is None
+        assert skip_reason(write(temp_dir, "empty.py", "")) is None
+        assert skip_reason(write(temp_dir, "blob.py", b"\x00\x01\x02" * 100)) == "Binary file"
+        assert skip_reason(write(temp_dir, "app.min.js", "var a=1;")) == "Minified file"
+        assert skip_reason(write(temp_dir, "bundle.js", "var a=1;" * 2000)).startswith("Minified file")
+        assert skip_reason(write(temp_dir, "wide.js", ("x" * 400 + "\n") * 50)).startswith("Minified file")
+        assert skip_reason(write(temp_dir, "pb.go", "// Code generated by protoc-gen-go. DO NOT EDIT.\npackage pb\n")) == "Generated file"
+        # Markers outside comments are just code
+        assert skip_reason(write(temp_dir, "markers.py", 'MARKERS = ("DO NOT EDIT",)\n')) is None
+
+        original_limit = discovery.MAX_FILE_BYTES
+        discovery.MAX_FILE_BYTES = 1000
+        try:
+            assert skip_reason(write(temp_dir, "big.py", "x = 1\n" * 1000)).startswith("File too large")
+        finally:
+            discovery.MAX_FILE_BYTES = original_limit
+    print("✓ Skip reason test passed")
+
+
+def test_find_src_files_records_skipped():
+    """Skipped files are left out of discovery and reported with their reason."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        kept = write(temp_dir, "main.py", "def main():\n    pass\n")
+        blob = write(temp_dir, "data.py", b"\x00" * 64)
+        skipped = {}
+        assert find_src_files(temp_dir, skipped=skipped) == [kept]
+        assert skipped == {blob: "Binary file"}
+        assert find_src_files(temp_dir) == [kept]
+    print("✓ Discovery skip test passed")
+
+
+def test_sniff_verdicts_cached():
+    """Discovery reads a file's prefix again only after its size or mtime changes."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        blob = write(temp_dir, "data.py", b"\x00" * 64)
+        stat = os.stat(blob)
+        assert find_src_files(temp_dir) == []
+
+        # Same size and mtime: the remembered verdict is used without reading the file
+        write(temp_dir, "data.py", b"x" * 63 + b"\n")
+        os.utime(blob, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        assert find_src_files(temp_dir) == []
+
+        os.utime(blob, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+        assert find_src_files(temp_dir) == [blob]
+    print("✓ Sniff verdict cache test passed")
+
+
+def test_iter_bounded_lines():
+    """Overlong lines are blanked without being held in memory, and reading is capped."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = write(temp_dir, "mixed.py", "a = 1\n" + "b" * 5000 + "\nc = 3\nlast")
+        assert list(iter_bounded_lines(path, 100, 10**6)) == ["a = 1\n", "\n", "c = 3\n", "last"]
+        assert list(iter_bounded_lines(path, 100, 3)) == ["a = 1\n"]
+    print("✓ Bounded line reader test passed")
+
+
+def test_large_files_use_streaming_scan():
+    """Files over STREAM_SCAN_BYTES are tagged and rendered without Tree-sitter or a full read."""
+    original_limit = repomap_class.STREAM_SCAN_BYTES
+    original_chunk = repomap_class.STREAM_SCAN_CHUNK_LINES
+    repomap_class.STREAM_SCAN_BYTES = 1000
+    repomap_class.STREAM_SCAN_CHUNK_LINES = 7
+    try:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            content = "".join(f"def func_{i}(a):\n    return a\n" for i in range(100))
+            path = write(temp_dir, "big.py", content + "x = '" + "y" * 5000 + "'\ndef tail():\n    pass\n")
+            repo_map = RepoMap(root=temp_dir, output_handler_funcs=dict(HANDLERS))
+            tags = repo_map.get_tags_raw(path, "big.py")
+            defs = {(tag.name, tag.line) for tag in tags if tag.kind == "def"}
+            assert ("func_0", 1) in defs
+            assert ("func_99", 199) in defs
+            assert ("tail", 202) in defs
+            assert repo_map.metrics.counters["stream_scans"] == 1
+            assert repo_map.metrics.counters["full_parses"] == 0
+
+            rendered = repo_map.render_tree(path, "big.py", [1, 202])
+            assert rendered.splitlines() == ["big.py:", "   1: def func_0(a):", " 202: def tail():"]
+    finally:
+        repomap_class.STREAM_SCAN_BYTES = original_limit
+        repomap_class.STREAM_SCAN_CHUNK_LINES = original_chunk
+    print("✓ Streaming scan test passed")
+
+
+def test_skipped_files_in_report():
+    """Files skipped during discovery appear in FileReport.excluded."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        main = write(temp_dir, "main.py", "def main():\n    pass\n")
+        repo_map = RepoMap(root=temp_dir, output_handler_funcs=dict(HANDLERS))
+        blob = os.path.join(temp_dir, "data.py")
+        _, report = repo_map.get_repo_map(other_files=[main], skipped_files={blob: "Binary file"})
+        assert report.excluded[blob] == "[EXCLUDED] Binary file"
+    print("✓ Skipped files report test passed")
+
+
+if __name__ == "__main__":
+    test_skip_reason()
+    test_find_src_files_records_skipped()
+    test_sniff_verdicts_cached()
+    test_iter_bounded_lines()
+    test_large_files_use_streaming_scan()
+    test_skipped_files_in_report()
+    print("\nAll file guard tests passed!")
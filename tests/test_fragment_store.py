@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Test the per-file fragment store used to assemble maps without reading sources.
+"""
+
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from conftest import HANDLERS, require_python_parser, run_tests
+from repomap_class import RepoMap
+from utils import read_text
+
+
+def write_repo(temp_dir, num_files=12):
+    fnames = []
+    for i in range(num_files):
+        path = os.path.join(temp_dir, f"mod{i}.py")
+        with open(path, "w") as f:
+            f.write(f"class Model{i}:\n    def save_{i}(self):\n        return helper_{(i + 1) % num_files}()\n\n\n"
+                    f"def helper_{i}():\n    return Model{(i + 2) % num_files}()\n")
+        fnames.append(path)
+    return fnames
+
+
+def new_repo_map(temp_dir):
+    return RepoMap(root=temp_dir, output_handler_funcs=dict(HANDLERS),
+                   token_counter_func=lambda text: len(text.split()))
+
+
+def failing_reader(path):
+    raise AssertionError(f"map assembly must not read {path}")
+
+
+def test_fragments_stored_with_tags():
+    """Fragments are built with the tags, cached with them and match render_tree."""
+    require_python_parser()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        fname = write_repo(temp_dir, 1)[0]
+        repo_map = new_repo_map(temp_dir)
+        tags = repo_map.get_tags(fname, "mod0.py")
+        def_lines = sorted({tag.line for tag in tags if tag.kind == "def"})
+        assert def_lines
+
+        fragments = repo_map.TAGS_CACHE.get(fname)["fragments"]
+        assert fragments["num_lines"] == 7
+        assert sorted(fragments["lines"]) == def_lines
+        assert repo_map._render_fragments("mod0.py", def_lines) == repo_map.render_tree(fname, "mod0.py", def_lines)
+        # A line that is not stored falls back to render_tree
+        assert repo_map._render_fragments("mod0.py", [4]) is None
+
+        # Entries written before fragments existed are filled in on the next hit
+        repo_map.TAGS_CACHE[fname] = {"mtime": repo_map.get_mtime(fname), "data": tags}
+        fresh = new_repo_map(temp_dir)
+        assert fresh.get_tags(fname, "mod0.py") == tags
+        assert fresh.TAGS_CACHE.get(fname)["fragments"] == fragments
+        assert fresh.metrics.counters["tags_cache_hits"] == 1
+    print("✓ Fragment store test passed")
+
+
+def test_source_read_once():
+    """A cache miss reads the file once, for both the parse and the fragments."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        fname = write_repo(temp_dir, 1)[0]
+        reads = []
+        repo_map = RepoMap(root=temp_dir, output_handler_funcs=dict(HANDLERS),
+                           file_reader_func=lambda path: reads.append(path) or read_text(path))
+        repo_map.get_tags(fname, "mod0.py")
+        assert reads == [fname]
+        assert repo_map.TAGS_CACHE.get(fname)["fragments"]["num_lines"] == 7
+    print("✓ Source read once test passed")
+
+
+def test_map_assembly_without_reading_sources():
+    """to_tree and the budget fit use only fragments and give the same map as rendering sources."""
+    require_python_parser()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        fnames = write_repo(temp_dir)
+        repo_map = new_repo_map(temp_dir)
+        ranked_tags, _ = repo_map.get_ranked_tags(fnames[:1], fnames[1:])
+        assert ranked_tags
+
+        repo_map.read_text_func_internal = failing_reader
+        for budget in (5, 40, 120, 10**6):
+            with_fragments = repo_map.fit_tags_to_budget(ranked_tags, {"mod0.py"}, budget)
+            assert repo_map.metrics.counters.get("source_renders", 0) == 0
+
+            from_sources = new_repo_map(temp_dir)
+            from_sources.read_text_func_internal = read_text
+            assert from_sources.fit_tags_to_budget(ranked_tags, {"mod0.py"}, budget) == with_fragments
+            assert from_sources.metrics.counters["source_renders"] > 0 or with_fragments is None
+        assert repo_map.metrics.counters["fragment_renders"] > 0
+    print("✓ Fragment map assembly test passed")
+
+
+def test_estimated_fit_bounds():
+    """The bounds bracket the estimated cost of the budget."""
+    require_python_parser()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        fnames = write_repo(temp_dir)
+        repo_map = new_repo_map(temp_dir)
+        ranked_tags, _ = repo_map.get_ranked_tags(fnames[:1], fnames[1:])
+
+        low, high = repo_map._estimated_fit_bounds(ranked_tags, 40)
+        assert 0 < low < high <= len(ranked_tags)
+        assert repo_map._estimated_fit_bounds(ranked_tags, 10**6) == (len(ranked_tags), None)
+
+        repo_map.fragment_cache.clear()
+        assert repo_map._estimated_fit_bounds(ranked_tags, 40) == (0, None)
+    print("✓ Estimated fit bounds test passed")
+
+
+if __name__ == "__main__":
+    run_tests(
+        test_fragments_stored_with_tags,
+        test_source_read_once,
+        test_map_assembly_without_reading_sources,
+        test_estimated_fit_bounds,
+    )
+    print("\nAll fragment store tests passed!")
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Test multi-query identifier search.
+"""
+
+import asyncio
+import os
+import random
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from conftest import python_parser_available
+from identifier_search import QueryAutomaton, match_queries
+from utils import Tag
+
+
+def naive_search(tags, query, include_definitions=True, include_references=True, max_results=50):
+    """The original one-query search: substring filter, then a stable sort."""
+    query_lower = query.lower()
+    matching = [
+        tag for tag in tags
+        if query_lower in tag.name.lower()
+        and ((tag.kind == "def" and include_definitions) or (tag.kind == "ref" and include_references))
+    ]
+    matching.sort(key=lambda tag: (tag.kind != "def", tag.name.lower().find(query_lower)))
+    return matching[:max_results]
+
+
+def test_query_automaton():
+    """Overlapping queries are all found, at their first occurrence."""
+    automaton = QueryAutomaton(["get", "GET_user", "user", "ser", "", "missing"])
+    assert automaton.first_matches("get_user_by_user") == {0: 0, 1: 0, 2: 4, 3: 5, 4: 0}
+    assert automaton.first_matches("xyz") == {4: 0}
+    assert QueryAutomaton(["aab"]).first_matches("aaab") == {0: 1}
+    print("✓ Query automaton test passed")
+
+
+def test_match_queries_agrees_with_naive_search():
+    """Every query of a batch gets the same tags, in the same order, as a single search."""
+    rng = random.Random(7)
+    syllables = ["get", "set", "user", "id", "name", "load", "cache", "Tag", "rank"]
+    tags = [
+        Tag(rel_fname=f"f{i % 13}.py", fname=f"/repo/f{i % 13}.py", line=i,
+            name="_".join(rng.choice(syllables) for _ in range(rng.randint(1, 3))),
+            kind=rng.choice(["def", "ref"]))
+        for i in range(2000)
+    ]
+    queries = ["user", "tag", "get_user", "Name_load", "e", "zzz", ""]
+
+    for include_definitions, include_references in ((True, True), (True, False), (False, True)):
+        batch = match_queries(tags, queries, include_definitions, include_references, max_results=25)
+        for query, result in zip(queries, batch):
+            assert result == naive_search(tags, query, include_definitions, include_references, 25), query
+    print("✓ Batch matching agreement test passed")
+
+
+def test_search_identifiers_batch_tool():
+    """The tool returns matches per query and renders each matching file once."""
+    import repomap_server
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        with open(os.path.join(temp_dir, "users.py"), "w") as f:
+            f.write("def load_user():\n    return 1\n\n\ndef save_user():\n    return load_user()\n")
+        with open(os.path.join(temp_dir, "other.py"), "w") as f:
+            f.write("def unrelated():\n    return 2\n")
+
+        response = asyncio.run(repomap_server.search_identifiers_batch(temp_dir, ["load_user", "save", "missing"]))
+        assert [entry["query"] for entry in response["results"]] == ["load_user", "save", "missing"]
+        assert response["results"][2]["matches"] == []
+        if python_parser_available():
+            load = response["results"][0]["matches"]
+            assert [(m["file"], m["line"], m["kind"]) for m in load] == [("users.py", 1, "def"), ("users.py", 6, "ref")]
+            assert response["results"][1]["matches"][0]["name"] == "save_user"
+            assert list(response["contexts"]) == ["users.py"]
+            assert "def save_user" in response["contexts"]["users.py"]
+
+        assert "error" in asyncio.run(repomap_server.search_identifiers_batch(temp_dir, []))
+        assert "error" in asyncio.run(repomap_server.search_identifiers_batch(os.path.join(temp_dir, "nope"), ["x"]))
+    print("✓ Batch search tool test passed")
+
+
+if __name__ == "__main__":
+    test_query_automaton()
+    test_match_queries_agrees_with_naive_search()
+    test_search_identifiers_batch_tool()
+    print("\nAll identifier search tests passed!")
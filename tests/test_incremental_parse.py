@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Test incremental Tree-sitter reparsing against full parses.
+"""
+
+import os
+import random
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from conftest import HANDLERS, require_python_parser, run_tests
+from repomap_class import RepoMap
+from tree_cache import compute_edit
+
+
+def test_compute_edit():
+    """Edits are the minimal replaced byte range, with row/column points."""
+    old = b"def a():\n    return 1\n"
+    new = b"def a():\n    x = 2\n    return 1\n"
+    edit = compute_edit(old, new)
+    assert edit.start_byte == 13
+    assert edit.old_end_byte == 13
+    assert edit.new_end_byte == 23
+    assert edit.start_point == (1, 4)
+    assert edit.new_end_point == (2, 4)
+    assert new[edit.start_byte:edit.new_end_byte] == b"x = 2\n    "
+    assert compute_edit(old, old) is None
+
+    edit = compute_edit(b"aaaa", b"aa")
+    assert (edit.start_byte, edit.old_end_byte, edit.new_end_byte) == (2, 4, 2)
+    print("✓ Compute edit test passed")
+
+
+def test_incremental_matches_full_parse():
+    """Tags from incremental reparses equal tags from parsing each version from scratch."""
+    require_python_parser()
+
+    rng = random.Random(0)
+    funcs = [f"def f{i}(a):\n    b = g{i}(a)\n    return h{i}(b)\n" for i in range(100)]
+    with tempfile.TemporaryDirectory() as temp_dir:
+        fname = os.path.join(temp_dir, "module.py")
+        incremental = RepoMap(root=temp_dir, output_handler_funcs=dict(HANDLERS))
+        for step in range(50):
+            i = rng.randrange(len(funcs))
+            op = step % 4
+            if op == 0:
+                funcs.insert(i, f"def new{step}(a):\n    return call{step}(a)\n")
+            elif op == 1:
+                del funcs[i]
+            elif op == 2:
+                funcs[i] = funcs[i].replace("(a)", f"_renamed{step}(a)", 1)
+            else:
+                funcs[i] = funcs[i] + f"    extra{step}(b)\n"
+            with open(fname, "w") as f:
+                f.write("\n".join(funcs))
+
+            tags = incremental.get_tags_raw(fname, "module.py")
+            full = RepoMap(root=temp_dir, output_handler_funcs=dict(HANDLERS)).get_tags_raw(fname, "module.py")
+            assert sorted(tags) == sorted(full), f"step {step}: incremental tags differ from a full parse"
+
+        assert incremental.metrics.counters["incremental_parses"] == 49
+    print("✓ Incremental parse test passed")
+
+
+if __name__ == "__main__":
+    run_tests(
+        test_compute_edit,
+        test_incremental_matches_full_parse,
+    )
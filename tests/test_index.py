@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""
+Test the standalone index builder's checkpointing and resume behaviour.
+"""
+
+import os
+import sys
+import tempfile
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from repomap_index import build_index, load_index_state
+from pathlib import Path
+
+
+def test_index_resume():
+    """A second run resumes finished files and only re-parses changed ones"""
+    print("=== Testing Index Resume ===")
+    with tempfile.TemporaryDirectory() as tmp:
+        for i in range(3):
+            with open(os.path.join(tmp, f"mod{i}.py"), "w") as f:
+                f.write(f"def func{i}():\n    return {i}\n")
+
+        progress = build_index(tmp, workers=1)
+        assert progress.finished
+        assert progress.parsed_files == 3 and progress.resumed_files == 0
+        assert len(load_index_state(Path(tmp).resolve())) == 3
+
+        progress = build_index(tmp, workers=1)
+        assert progress.parsed_files == 0 and progress.resumed_files == 3
+
+        changed = os.path.join(tmp, "mod1.py")
+        stat = os.stat(changed)
+        os.utime(changed, (stat.st_atime, stat.st_mtime + 10))
+        progress = build_index(tmp, workers=1)
+        assert progress.parsed_files == 1 and progress.resumed_files == 2
+    print("✓ Index resume test passed")
+
+
+if __name__ == "__main__":
+    test_index_resume()
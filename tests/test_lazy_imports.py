@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Test that heavy dependencies stay off the startup path.
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+LAZY_MODULES = ("networkx", "diskcache", "grep_ast", "tree_sitter", "tiktoken")
+
+
+def loaded_after_import(module):
+    code = f"import json, sys; import {module}; print(json.dumps([m for m in {LAZY_MODULES!r} if m in sys.modules]))"
+    proc = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, timeout=120)
+    assert proc.returncode == 0, proc.stderr
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def test_lazy_imports():
+    """Importing the library and the server does not load parsing, ranking or tokenizer dependencies."""
+    for module in ("utils", "repomap_class", "repomap_server"):
+        loaded = loaded_after_import(module)
+        assert loaded == [], f"{module} eagerly imports {loaded}"
+    print("✓ Lazy import test passed")
+
+
+def test_preload_tokenizer():
+    """The background tokenizer preload makes the encoding available to count_tokens."""
+    from utils import _encodings, preload_tokenizer
+
+    thread = preload_tokenizer("gpt-4")
+    thread.join(timeout=60)
+    assert not thread.is_alive()
+    # Loading may fail without network access; the preload must never raise
+    if "gpt-4" in _encodings:
+        from utils import count_tokens
+        assert count_tokens("def main(): pass") > 0
+    print("✓ Tokenizer preload test passed")
+
+
+if __name__ == "__main__":
+    test_lazy_imports()
+    test_preload_tokenizer()
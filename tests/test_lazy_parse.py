@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Test budget-driven lazy parsing outward from the chat files.
+"""
+
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from conftest import HANDLERS, require_python_parser, run_tests
+from repomap_class import RepoMap
+
+
+def write_repo(temp_dir, num_helpers=10, num_unrelated=40):
+    """main.py uses core.py, which uses the helpers; the unrelated modules are never referenced."""
+    files = {
+        "main.py": "from core import Engine\n\ndef run():\n    engine = Engine()\n    engine.start()\n",
+        "core.py": "class Engine:\n    def start(self):\n"
+                   + "".join(f"        helper_{i}()\n" for i in range(num_helpers)),
+    }
+    for i in range(num_helpers):
+        files[f"helpers/h{i}.py"] = f"def helper_{i}():\n    return {i}\n"
+    for i in range(num_unrelated):
+        files[f"unrelated/u{i}.py"] = f"def unrelated_{i}():\n    return {i}\n"
+    for rel_fname, content in files.items():
+        path = os.path.join(temp_dir, rel_fname)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(content)
+    return [os.path.join(temp_dir, rel_fname) for rel_fname in files]
+
+
+def ranked_files(ranked_tags):
+    return {tag.rel_fname for _, tag in ranked_tags}
+
+
+def test_lazy_parse_follows_references():
+    """Only files reachable from the chat file are parsed and ranked."""
+    require_python_parser()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        fnames = write_repo(temp_dir)
+        repo_map = RepoMap(root=temp_dir, output_handler_funcs=dict(HANDLERS), lazy_parse=True)
+        ranked_tags, report = repo_map.get_ranked_tags(fnames[:1], fnames[1:], max_map_tokens=1024)
+
+        files = ranked_files(ranked_tags)
+        assert "core.py" in files
+        assert all(f"helpers/h{i}.py" in files for i in range(10))
+        assert not any(f.startswith("unrelated") for f in files)
+        assert repo_map.metrics.counters["files_skipped"] == 40
+        assert repo_map.metrics.counters["full_parses"] == 12
+        assert report.total_files_considered == 12
+
+        # A tiny budget stops the expansion early
+        repo_map = RepoMap(root=temp_dir, output_handler_funcs=dict(HANDLERS), lazy_parse=True)
+        ranked_tags, _ = repo_map.get_ranked_tags(fnames[:1], fnames[1:], max_map_tokens=10)
+        assert ranked_files(ranked_tags) < files
+    print("✓ Lazy parse expansion test passed")
+
+
+def test_lazy_parse_seeds():
+    """Mentioned identifiers seed the expansion through the name index; no seeds means no skipping."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        fnames = write_repo(temp_dir)
+        repo_map = RepoMap(root=temp_dir, output_handler_funcs=dict(HANDLERS), lazy_parse=True)
+        candidates = repo_map._lazy_candidates([], fnames, set(), {"unrelated_7"}, 1024)
+        assert os.path.join(temp_dir, "unrelated", "u7.py") in candidates
+        assert not any("helpers" in fname for fname in candidates)
+
+        candidates = repo_map._lazy_candidates([], fnames, {"helpers/h3.py"}, set(), 1024)
+        assert os.path.join(temp_dir, "helpers", "h3.py") in candidates
+
+        assert repo_map._lazy_candidates([], fnames, set(), set(), 1024) == fnames
+
+        # The next request (a new RepoMap, as the server creates) reuses the name index
+        repo_map = RepoMap(root=temp_dir, output_handler_funcs=dict(HANDLERS), lazy_parse=True)
+        repo_map._lazy_candidates([], fnames, set(), {"unrelated_7"}, 1024)
+        assert repo_map.metrics.counters["skeleton_scans"] == 0
+    print("✓ Lazy parse seed test passed")
+
+
+if __name__ == "__main__":
+    run_tests(
+        test_lazy_parse_follows_references,
+        test_lazy_parse_seeds,
+    )
+    print("\nAll lazy parse tests passed!")
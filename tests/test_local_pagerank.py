@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Test approximate personalized PageRank by forward push.
+"""
+
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import networkx as nx
+
+import repomap_class
+from conftest import HANDLERS
+from local_pagerank import csr_successors, graph_successors, push_pagerank
+from repomap_class import RepoMap
+
+
+def make_graph():
+    """Reference graph of two clusters with parallel edges, a dangling file and an unreachable one."""
+    G = nx.MultiDiGraph()
+    edges = [
+        ("app.py", "core.py"), ("app.py", "core.py"), ("app.py", "util.py"),
+        ("core.py", "util.py"), ("util.py", "core.py"), ("core.py", "models.py"),
+        ("cli.py", "app.py"), ("tools/run.py", "tools/lib.py"), ("tools/lib.py", "tools/run.py"),
+    ]
+    for ref_fname, def_fname in edges:
+        G.add_edge(ref_fname, def_fname, name="x")
+    G.add_node("orphan.py")
+    return G
+
+
+def test_push_matches_pagerank():
+    """With a small tolerance push converges to nx.pagerank, parallel edges and dangling nodes included."""
+    G = make_graph()
+    personalization = {"app.py": 100.0}
+    expected = nx.pagerank(G, personalization=personalization, alpha=0.85, tol=1e-12, max_iter=1000)
+    ranks = push_pagerank(graph_successors(G), personalization, tol=1e-12)
+
+    # Files the chat file cannot reach are never visited
+    assert set(ranks) == {"app.py", "core.py", "util.py", "models.py"}
+    for node, rank in expected.items():
+        assert abs(ranks.get(node, 0.0) - rank) < 1e-9, node
+
+    # Weighted DiGraph (as built from the tag store) and CSR arrays agree
+    D = nx.DiGraph()
+    D.add_nodes_from(G)
+    for u, v in G.edges():
+        D.add_edge(u, v, weight=D[u][v]["weight"] + 1 if D.has_edge(u, v) else 1)
+    nodes = list(D)
+    A = nx.to_scipy_sparse_array(D, nodelist=nodes, format="csr")
+    csr_ranks = push_pagerank(csr_successors(A.indptr, A.indices, A.data), {nodes.index("app.py"): 1.0}, tol=1e-12)
+    for other in (push_pagerank(graph_successors(D), personalization, tol=1e-12),
+                  {nodes[i]: rank for i, rank in csr_ranks.items()}):
+        assert other.keys() == ranks.keys()
+        assert all(abs(other[node] - ranks[node]) < 1e-12 for node in ranks)
+    print("✓ Push matches PageRank test passed")
+
+
+def test_push_limits():
+    """Push gives up past max_work and rejects an empty personalization like nx.pagerank."""
+    G = make_graph()
+    assert push_pagerank(graph_successors(G), {"app.py": 1.0}, tol=1e-12, max_work=5) is None
+    coarse = push_pagerank(graph_successors(G), {"app.py": 1.0}, tol=1e-2)
+    fine = push_pagerank(graph_successors(G), {"app.py": 1.0}, tol=1e-8)
+    assert sum(coarse.values()) < sum(fine.values()) <= 1.0
+    try:
+        push_pagerank(graph_successors(G), {"app.py": 0.0})
+        assert False, "expected ZeroDivisionError"
+    except ZeroDivisionError:
+        pass
+    print("✓ Push limits test passed")
+
+
+def test_rank_files_uses_push():
+    """Personalized ranking of large graphs goes through push; unpersonalized ranking does not."""
+    G = make_graph()
+    # Most of a large repository is far from the chat files
+    for i in range(500):
+        G.add_edge(f"vendor/{i}.py", f"vendor/{(i + 1) % 500}.py", name="x")
+    original = repomap_class.PUSH_MIN_NODES
+    repomap_class.PUSH_MIN_NODES = len(G)
+    try:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            repo_map = RepoMap(root=temp_dir, output_handler_funcs=dict(HANDLERS))
+            expected = nx.pagerank(G, personalization={"app.py": 100.0}, alpha=0.85, tol=1e-12, max_iter=1000)
+            ranks = repo_map.rank_files(G, {"app.py": 100.0})
+            assert repo_map.metrics.counters["push_pagerank"] == 1
+            assert repo_map.metrics.counters["push_pagerank_nodes"] == 4
+            assert sorted(ranks, key=ranks.get, reverse=True) == sorted(expected, key=expected.get, reverse=True)[:4]
+            assert all(abs(ranks[node] - expected[node]) < 1e-4 for node in ranks)
+
+            assert len(repo_map.rank_files(G, {})) == len(G)
+            assert repo_map.metrics.counters["push_pagerank"] == 1
+    finally:
+        repomap_class.PUSH_MIN_NODES = original
+    print("✓ rank_files push test passed")
+
+
+if __name__ == "__main__":
+    test_push_matches_pagerank()
+    test_push_limits()
+    test_rank_files_uses_push()
+    print("\nAll local PageRank tests passed!")
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Test versioned maps and delta maps.
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from map_delta import MapVersionStore, diff_blocks, split_blocks, versioned_map
+
+
+def block(rel_fname, rank, *lines):
+    return f"{rel_fname}:\n(Rank value: {rank:.4f})\n\n" + "\n".join(lines)
+
+
+def make_map(*blocks, prefix="Repo map:\n"):
+    return prefix + "\n\n".join(blocks)
+
+
+def test_split_blocks():
+    """Maps split into a prefix and one block per file, in order."""
+    a = block("src/a.py", 0.5, "   1: def a():", "   7: class B:")
+    b = block("b.py", 0.25, "   3: def b():")
+    prefix, blocks = split_blocks(make_map(a, b))
+    assert prefix == "Repo map:\n"
+    assert list(blocks.items()) == [("src/a.py", a), ("b.py", b)]
+
+    prefix, blocks = split_blocks("Directory rollup (...):\n./ (rank 1.0000, 2 files, 3 definitions)")
+    assert prefix.startswith("Directory rollup") and not blocks
+    print("✓ Split blocks test passed")
+
+
+def test_diff_blocks():
+    """Blocks are added, changed or removed by file name."""
+    old = {"a.py": "A", "b.py": "B", "c.py": "C"}
+    new = {"a.py": "A", "b.py": "B2", "d.py": "D"}
+    assert diff_blocks(old, new) == (["d.py"], ["b.py"], ["c.py"])
+    print("✓ Diff blocks test passed")
+
+
+def test_versioned_map():
+    """A known version reduces the map to added and changed blocks plus removed files."""
+    store = MapVersionStore()
+    a, b, c = block("a.py", 0.5, "   1: def a():"), block("b.py", 0.3, "   1: def b():"), block("c.py", 0.2, "   1: def c():")
+    first = versioned_map("/repo", make_map(a, b, c), store=store)
+    assert first["map"] == make_map(a, b, c) and "delta" not in first
+
+    same = versioned_map("/repo", make_map(a, b, c), first["map_version"], store=store)
+    assert same["map_version"] == first["map_version"]
+    assert same["map"].startswith("Repository map unchanged")
+    assert same["delta"]["unchanged"] == 3
+
+    b2, d = block("b.py", 0.4, "   1: def b():"), block("d.py", 0.1, "   2: def d():")
+    second = versioned_map("/repo", make_map(a, b2, d), first["map_version"], store=store)
+    assert second["map_version"] != first["map_version"]
+    assert second["map"] == b2 + "\n\n" + d + "\n\nRemoved from the map: c.py"
+    assert second["delta"] == {
+        "since_version": first["map_version"], "added": ["d.py"], "changed": ["b.py"], "removed": ["c.py"], "unchanged": 1
+    }
+    print("✓ Versioned map test passed")
+
+
+def test_full_map_fallbacks():
+    """Unknown, evicted or foreign versions and maps without file blocks return the full map."""
+    store = MapVersionStore(max_versions=2)
+    text = make_map(block("a.py", 0.5, "   1: def a():"))
+    token = versioned_map("/repo", text, store=store)["map_version"]
+
+    other = versioned_map("/other", text, token, store=store)
+    assert other["map"] == text and "delta_unavailable" in other
+
+    rollup = "Directory rollup (...):\n./ (rank 1.0000, 1 files, 1 definitions): a"
+    result = versioned_map("/repo", rollup, token, store=store)
+    assert result["map"] == rollup and "delta_unavailable" in result
+
+    versioned_map("/repo", make_map(block("b.py", 0.5, "   1: def b():")), store=store)
+    assert store.get("/repo", token) is None
+    assert len(store) == 2
+    print("✓ Full map fallback test passed")
+
+
+if __name__ == "__main__":
+    test_split_blocks()
+    test_diff_blocks()
+    test_versioned_map()
+    test_full_map_fallbacks()
+    print("\nAll map delta tests passed!")
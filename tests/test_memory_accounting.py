@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Test per-phase memory accounting and the request memory ceiling.
+"""
+
+import os
+import sys
+import threading
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from metrics import MemoryLimitExceeded, RequestMetrics, approximate_mapping_size, approximate_size
+
+
+def test_phase_memory():
+    """Nested phases report their own peak; the outer peak covers the inner one."""
+    metrics = RequestMetrics(trace_memory=True)
+    with metrics.tracing():
+        with metrics.phase("outer"):
+            kept = [bytes(1024) for _ in range(1000)]
+            with metrics.phase("inner"):
+                temporary = [bytes(1024) for _ in range(2000)]
+                del temporary
+
+    phases = metrics.as_dict()["phases"]
+    assert phases["inner"]["peak_bytes"] >= 2000 * 1024
+    assert phases["outer"]["peak_bytes"] >= phases["inner"]["peak_bytes"]
+    assert phases["inner"]["allocated_bytes"] < 1000 * 1024
+    assert phases["outer"]["allocated_bytes"] >= 1000 * 1024
+    assert len(kept) == 1000
+    print("✓ Phase memory test passed")
+
+
+def test_memory_limit():
+    """A request over its memory ceiling fails with a clear error naming the phase."""
+    metrics = RequestMetrics(memory_limit_bytes=2**20)
+    try:
+        with metrics.phase("tags"):
+            held = b"x" * (32 * 2**20)
+    except MemoryLimitExceeded as e:
+        assert "phase 'tags'" in str(e)
+    else:
+        raise AssertionError("MemoryLimitExceeded was not raised")
+    del held
+    print("✓ Memory limit test passed")
+
+
+def test_memory_limit_counts_growth():
+    """Memory already resident when a request starts does not count against its ceiling."""
+    held = b"x" * (32 * 2**20)
+    metrics = RequestMetrics(memory_limit_bytes=16 * 2**20)
+    with metrics.phase("tags"):
+        pass
+    assert metrics.memory_growth() < 16 * 2**20
+
+    # While tracing, growth is the traced memory the request allocated
+    metrics = RequestMetrics(trace_memory=True, memory_limit_bytes=2**20)
+    with metrics.tracing():
+        assert metrics.memory_growth() < 2**20
+        try:
+            with metrics.phase("render"):
+                more = [bytes(1024) for _ in range(2048)]
+        except MemoryLimitExceeded as e:
+            assert "phase 'render'" in str(e)
+        else:
+            raise AssertionError("MemoryLimitExceeded was not raised")
+    assert len(held) + len(more) > 0
+    print("✓ Memory limit growth test passed")
+
+
+def test_overlapping_tracing():
+    """Overlapping traced requests neither stop tracing nor reset the peak for each other."""
+    first_in_phase = threading.Event()
+    second_done = threading.Event()
+    errors = []
+    first = RequestMetrics(trace_memory=True)
+    second = RequestMetrics(trace_memory=True)
+
+    def run_first():
+        try:
+            with first.tracing(), first.phase("tags"):
+                temporary = [bytes(1024) for _ in range(2000)]
+                del temporary
+                first_in_phase.set()
+                assert second_done.wait(30)
+                assert tracemalloc.is_tracing()
+        except BaseException as e:
+            errors.append(e)
+            first_in_phase.set()
+
+    def run_second():
+        try:
+            assert first_in_phase.wait(30)
+            with second.tracing(), second.phase("tags"):
+                pass
+        except BaseException as e:
+            errors.append(e)
+        finally:
+            second_done.set()
+
+    assert not tracemalloc.is_tracing()
+    threads = [threading.Thread(target=run_first), threading.Thread(target=run_second)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(60)
+    if errors:
+        raise errors[0]
+    assert first.phases["tags"]["peak_bytes"] >= 2000 * 1024
+    assert not tracemalloc.is_tracing()
+    print("✓ Overlapping tracing test passed")
+
+
+def test_approximate_sizes():
+    """Sampled mapping sizes are in the range of the exact deep size."""
+    mapping = {f"key{i}": ["x" * 100] * 10 for i in range(1000)}
+    exact = approximate_size(mapping)
+    estimate = approximate_mapping_size(mapping)
+    assert 0.5 * exact < estimate < 2 * exact
+    print("✓ Approximate size test passed")
+
+
+if __name__ == "__main__":
+    test_phase_memory()
+    test_memory_limit()
+    test_memory_limit_counts_growth()
+    test_overlapping_tracing()
+    test_approximate_sizes()
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""
+Test the on-demand request profiler.
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from metrics import hot_functions, run_profiled
+
+
+def slow_leaf(n):
+    return sum(i * i for i in range(n))
+
+
+def slow_root(n):
+    return [slow_leaf(n) for _ in range(5)]
+
+
+def test_hot_functions():
+    """The profiled call's result is returned and its callees rank by cumulative time."""
+    result, profiler = run_profiled(slow_root, 20000)
+    assert len(result) == 5
+
+    top = hot_functions(profiler, limit=5)
+    assert len(top) <= 5
+    names = [entry["function"] for entry in top]
+    assert any(name.endswith("(slow_root)") for name in names)
+    cumulative = [entry["cumulative_seconds"] for entry in top]
+    assert cumulative == sorted(cumulative, reverse=True)
+    leaf = next(entry for entry in hot_functions(profiler, limit=100) if entry["function"].endswith("(slow_leaf)"))
+    assert leaf["calls"] == 5
+    print("✓ Hot functions test passed")
+
+
+if __name__ == "__main__":
+    test_hot_functions()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Test top-k selection of ranked definitions.
+"""
+
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from conftest import HANDLERS
+from ranked_tags import RankedTags, top_order
+from repomap_class import RepoMap
+from utils import Tag
+
+
+# rel_fname -> [(line, name, kind)]
+TAGS = {
+    "app.py": [(1, "main", "def"), (2, "run", "def"), (3, "Store", "ref"), (4, "log", "ref")],
+    "store.py": [(1, "Store", "def"), (2, "save", "def"), (3, "load", "def"), (5, "log", "ref")],
+    "util/log.py": [(1, "log", "def"), (2, "debug", "def"), (3, "warn", "def")],
+    "cli.py": [(1, "cli", "def"), (2, "main", "ref")],
+}
+
+
+class ListingRepoMap(RepoMap):
+    """RepoMap with tags from TAGS and a map listing one definition per line, so no parser is needed."""
+
+    def get_tags(self, fname, rel_fname):
+        return [Tag(rel_fname=rel_fname, fname=fname, line=line, name=name, kind=kind)
+                for line, name, kind in TAGS.get(rel_fname, [])]
+
+    def to_tree(self, tags, chat_rel_fnames):
+        return "\n".join(f"{tag.rel_fname} {tag.name}" for _, tag in tags)
+
+
+def write_repo(temp_dir):
+    os.makedirs(os.path.join(temp_dir, "util"))
+    fnames = []
+    for rel_fname in TAGS:
+        path = os.path.join(temp_dir, rel_fname)
+        open(path, "w").close()
+        fnames.append(path)
+    return fnames
+
+
+def test_top_order():
+    """The selection is a prefix of the stable descending sort, ties included."""
+    rng = np.random.default_rng(0)
+    ranks = rng.integers(0, 5, 200).astype(float)
+    full = np.argsort(-ranks, kind="stable")
+    for limit in (0, 1, 7, 40, 199, 200, 500):
+        assert list(top_order(ranks, limit)) == list(full[:limit]), limit
+    assert list(top_order(ranks)) == list(full)
+    print("✓ Top order test passed")
+
+
+def test_ranked_tags_selection():
+    """Only the top candidates are ordered until something past them is read."""
+    ranks = np.array([0.1, 0.5, 0.5, 0.3, 0.9, 0.0])
+    names = ["a", "b", "c", "d", "e", "f"]
+    ranked = RankedTags(ranks, np.arange(6), lambda i: names[i], limit=2)
+    assert len(ranked) == 6 and ranked.num_ordered == 2
+    assert ranked[:2] == [(0.9, "e"), (0.5, "b")]
+    assert ranked.num_ordered == 2
+    assert ranked[2] == (0.5, "c")
+    assert ranked.num_ordered == 6
+    assert [name for _, name in ranked] == ["e", "b", "c", "d", "a", "f"]
+    print("✓ Ranked tags selection test passed")
+
+
+def test_get_ranked_tags_top_k():
+    """With a budget the ranking is a partial selection, read the same as the full ranking."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        fnames = write_repo(temp_dir)
+        repo_map = ListingRepoMap(root=temp_dir, output_handler_funcs=dict(HANDLERS))
+        args = ([fnames[0]], fnames[1:], {"util/log.py"}, {"load"})
+        full, _ = repo_map.get_ranked_tags(*args)
+        ranked, report = repo_map.get_ranked_tags(*args, max_map_tokens=6)
+        assert report.definition_matches == 9
+        assert ranked.num_ordered == repo_map.top_tags_limit(6) == 2 < len(ranked)
+        assert list(ranked) == list(full)
+
+        # Boosts: x20 in chat files, x5 in mentioned files, x10 for mentioned identifiers
+        ranks = {tag.name: rank for rank, tag in full}
+        assert ranks["main"] == ranks["run"]
+        assert abs(ranks["load"] / ranks["save"] - 10.0) < 1e-9
+        assert repo_map.top_tags_limit(None) is None
+    print("✓ get_ranked_tags top-k test passed")
+
+
+def test_fit_past_candidates():
+    """The budget fit gives the same map whether or not all candidates fit."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        fnames = write_repo(temp_dir)
+        for budget in (3, 4, 12, 100):
+            repo_map = ListingRepoMap(root=temp_dir, output_handler_funcs=dict(HANDLERS),
+                                      token_counter_func=lambda text: len(text.split()))
+            full, _ = repo_map.get_ranked_tags([fnames[0]], fnames[1:])
+            expected = repo_map.fit_tags_to_budget(list(full), {"app.py"}, budget)
+            ranked, _ = repo_map.get_ranked_tags([fnames[0]], fnames[1:], max_map_tokens=4)
+            assert ranked.num_ordered == 2
+            assert repo_map.fit_tags_to_budget(ranked, {"app.py"}, budget) == expected, budget
+            exhausted = repo_map.metrics.counters["top_tags_exhausted"]
+            assert exhausted == (budget >= 4), budget
+            assert ranked.num_ordered == (len(ranked) if exhausted else 2)
+    print("✓ Fit past candidates test passed")
+
+
+def test_map_cache_per_mode():
+    """A map cached by one ranking mode is recomputed, not reused, by another."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        fnames = write_repo(temp_dir)
+
+        def map_cache_hits(**kwargs):
+            repo_map = ListingRepoMap(root=temp_dir, output_handler_funcs=dict(HANDLERS),
+                                      token_counter_func=lambda text: len(text.split()), **kwargs)
+            map_content, _ = repo_map.get_repo_map([fnames[0]], fnames[1:])
+            assert map_content
+            return repo_map.metrics.counters["map_cache_hits"]
+
+        assert map_cache_hits() == 0
+        assert map_cache_hits() == 1
+        for mode in ("skeleton_index", "lazy_parse", "sharded", "rollup"):
+            assert map_cache_hits(**{mode: True}) == 0, mode
+            assert map_cache_hits(**{mode: True}) == 1, mode
+        assert map_cache_hits(map_tokens=512) == 0
+        assert map_cache_hits() == 0
+    print("✓ Map cache per mode test passed")
+
+
+if __name__ == "__main__":
+    test_top_order()
+    test_ranked_tags_selection()
+    test_get_ranked_tags_top_k()
+    test_fit_past_candidates()
+    test_map_cache_per_mode()
+    print("\nAll ranked tags tests passed!")
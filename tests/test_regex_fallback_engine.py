@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Test the precompiled whole-buffer regex fallback engine.
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import regex_fallback
+from scm import get_scm_fname
+
+
+PYTHON_SAMPLE = '''import os
+from pathlib import Path
+
+class Loader(Base):
+    """Imports everything from everywhere."""
+
+    def load(self, path):
+        if (path):
+            return read(path)
+        helper(path)
+
+async def fetch():
+    pass
+'''
+
+
+def test_python_tags():
+    """Definitions, imports and calls are found with 1-based lines."""
+    tags = regex_fallback.extract_tags(PYTHON_SAMPLE, "python")
+    assert (1, "os", "ref") in tags
+    assert (2, "pathlib", "ref") in tags
+    assert (4, "Loader", "def") in tags
+    assert (7, "load", "def") in tags
+    assert (9, "read", "ref") not in tags, "'return read(...)' is not a statement-level call"
+    assert (10, "helper", "ref") in tags
+    assert (12, "fetch", "def") in tags
+    # Prose in a docstring is not an import, and control flow is not a call
+    names = {name for _, name, _ in tags}
+    assert "everywhere" not in names
+    assert "if" not in names
+    # At most one tag per line
+    lines = [line for line, _, _ in tags]
+    assert len(lines) == len(set(lines))
+    print("✓ Python regex fallback test passed")
+
+
+def test_other_languages():
+    """Languages without a hand-written table before are covered too."""
+    go = regex_fallback.extract_tags("package main\n\nfunc Serve(addr string) error {\n}\n\ntype Server struct {\n", "go")
+    assert (3, "Serve", "def") in go
+    assert (6, "Server", "def") in go
+
+    rust = regex_fallback.extract_tags("pub fn render(x: u32) -> u32 {\n    x\n}\nstruct Map;\n", "rust")
+    assert (1, "render", "def") in rust
+    assert (4, "Map", "def") in rust
+
+    c = regex_fallback.extract_tags("#define MAX 10\nstatic int count_items(const char *s) {\n    return 0;\n}\n", "c")
+    assert (1, "MAX", "def") in c
+    assert (2, "count_items", "def") in c
+    print("✓ Other languages regex fallback test passed")
+
+
+# Language -> (one-line sample, the definition its table must find on line 1)
+DEFINITION_SAMPLES = {
+    "python": ("def serve(request):", "serve"),
+    "javascript": ("export function serve(request) {", "serve"),
+    "typescript": ("export interface Server {", "Server"),
+    "tsx": ("export interface Server {", "Server"),
+    "java": ("public class Server {", "Server"),
+    "c_sharp": ("public sealed class Server {", "Server"),
+    "csharp": ("public sealed class Server {", "Server"),
+    "ruby": ("def self.serve(request)", "serve"),
+    "go": ("func (s *Server) Serve(addr string) error {", "Serve"),
+    "rust": ("pub async fn serve(addr: &str) {", "serve"),
+    "c": ("static int serve(const char *addr) {", "serve"),
+    "cpp": ("class Server {", "Server"),
+    "arduino": ("class Server {", "Server"),
+    "cuda": ("class Server {", "Server"),
+    "d": ("struct Server {", "Server"),
+    "dart": ("abstract class Server {", "Server"),
+    "kotlin": ("suspend fun serve(addr: String) {", "serve"),
+    "scala": ("def serve(addr: String): Unit = {", "serve"),
+    "swift": ("public func serve(addr: String) {", "serve"),
+    "php": ("public static function serve($addr) {", "serve"),
+    "lua": ("local function serve(addr)", "serve"),
+    "elixir": ("def serve(conn) do", "serve"),
+    "elm": ("type alias Server =", "Server"),
+    "gleam": ("pub fn serve(addr) {", "serve"),
+    "ocaml": ("let rec serve addr = addr", "serve"),
+    "ocaml_interface": ("val serve : string -> unit", "serve"),
+    "r": ("serve <- function(addr) addr", "serve"),
+    "racket": ("(define (serve addr) addr)", "serve"),
+    "commonlisp": ("(defun serve (addr) addr)", "serve"),
+    "elisp": ("(defun serve (addr) addr)", "serve"),
+    "solidity": ("contract Server {", "Server"),
+    "hcl": ('resource "aws_instance" "server" {', "server"),
+    "ql": ("class Server extends Base {", "Server"),
+    "pony": ("actor Server", "Server"),
+    "properties": ("server.port=8080", "server.port"),
+    "udev": ('ACTION=="add", LABEL="server"', "server"),
+    "chatito": ("%[server]", "server"),
+}
+
+
+def test_every_tree_sitter_language_has_a_table():
+    """Every language with a Tree-sitter query also has fallback patterns."""
+    queries = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "queries")
+    for directory in os.listdir(queries):
+        for fname in os.listdir(os.path.join(queries, directory)):
+            if fname.endswith("-tags.scm"):
+                assert regex_fallback.supports(fname[:-len("-tags.scm")]), fname
+    for lang in ("python", "javascript", "typescript", "java", "go", "rust", "c", "cpp", "ruby", "php"):
+        assert get_scm_fname(lang), lang
+    assert regex_fallback.extract_tags("anything", "no-such-language") == []
+    print("✓ Language coverage test passed")
+
+
+def test_every_table_finds_definitions():
+    """Every language table compiles and finds the definition in a sample of that language."""
+    assert set(DEFINITION_SAMPLES) == set(regex_fallback.PATTERNS)
+    for lang, (sample, name) in DEFINITION_SAMPLES.items():
+        tags = regex_fallback.extract_tags(sample + "\n", lang)
+        assert (1, name, "def") in tags, (lang, tags)
+    print("✓ Language table test passed")
+
+
+def test_patterns_compiled_once():
+    """A language table is compiled into one cached regex."""
+    regex_fallback.extract_tags("def a():\n", "python")
+    first = regex_fallback._compile("python")
+    regex_fallback.extract_tags("def b():\n", "python")
+    assert regex_fallback._compile("python") is first
+    print("✓ Pattern cache test passed")
+
+
+if __name__ == "__main__":
+    test_python_tags()
+    test_other_languages()
+    test_every_tree_sitter_language_has_a_table()
+    test_every_table_finds_definitions()
+    test_patterns_compiled_once()
+    print("\nAll regex fallback engine tests passed!")
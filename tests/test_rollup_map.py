@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Test the directory rollup map mode.
+"""
+
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from conftest import HANDLERS
+from repomap_class import ROLLUP_SYMBOLS_PER_DIRECTORY, RepoMap
+from utils import Tag
+
+
+def tag(rel_fname, name, line=1):
+    return Tag(rel_fname=rel_fname, fname=os.path.join("/repo", rel_fname), line=line, name=name, kind="def")
+
+
+def ranked_tags():
+    """api/ holds the best ranked file; lib/deep/ only shows up through lib/."""
+    return [
+        (0.5, tag(os.path.join("api", "routes.py"), "route")),
+        (0.4, tag(os.path.join("api", "routes.py"), "handler", 5)),
+        (0.3, tag(os.path.join("lib", "deep", "core.py"), "Core")),
+        (0.2, tag(os.path.join("lib", "util.py"), "helper")),
+        (0.1, tag("setup.py", "setup")),
+    ]
+
+
+def failing_reader(path):
+    raise AssertionError(f"rollup must not read {path}")
+
+
+def test_rollup_directories():
+    """Directories sum the best rank of each file below them and sort parents first."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        repo_map = RepoMap(root=temp_dir, output_handler_funcs=dict(HANDLERS))
+        directories = repo_map.rollup_directories(ranked_tags())
+        by_path = {entry["path"]: entry for entry in directories}
+
+        assert [entry["path"] for entry in directories] == [
+            "", "api", "lib", os.path.join("lib", "deep")
+        ]
+        assert abs(by_path[""]["rank"] - 1.1) < 1e-9
+        assert abs(by_path["api"]["rank"] - 0.5) < 1e-9
+        assert abs(by_path["lib"]["rank"] - 0.5) < 1e-9
+        assert len(by_path["lib"]["files"]) == 2
+        assert by_path["api"]["definitions"] == 2
+        assert [name for _, name in by_path["api"]["symbols"]] == ["route", "handler"]
+    print("✓ Rollup aggregation test passed")
+
+
+def test_to_rollup():
+    """Hidden directories contribute their symbols to the closest shown parent; no file is read."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        repo_map = RepoMap(root=temp_dir, output_handler_funcs=dict(HANDLERS), file_reader_func=failing_reader)
+        directories = repo_map.rollup_directories(ranked_tags())
+
+        lines = repo_map.to_rollup(directories, 3).splitlines()
+        assert lines[0].startswith("Directory rollup")
+        assert lines[1].startswith("./ (rank 1.1000, 4 files, 5 definitions): setup")
+        assert lines[2].startswith("  api/ (rank 0.5000, 1 files, 2 definitions): route, handler")
+        assert lines[3].startswith("  lib/ (rank 0.5000, 2 files, 2 definitions): Core, helper")
+        assert len(lines) == 4
+
+        lines = repo_map.to_rollup(directories, 4).splitlines()
+        assert lines[3].endswith(": helper")
+        assert lines[4].startswith("    " + os.path.join("lib", "deep") + "/")
+        assert repo_map.to_rollup(directories, 0) == ""
+    print("✓ Rollup rendering test passed")
+
+
+def test_fit_rollup_to_budget():
+    """The rollup keeps as many directories as fit the budget and caps symbols per directory."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        repo_map = RepoMap(root=temp_dir, output_handler_funcs=dict(HANDLERS),
+                           token_counter_func=lambda text: len(text.splitlines()), rollup=True)
+        tags = [(1.0 / (i + 1), tag(os.path.join(f"pkg{i % 10}", f"m{i}.py"), f"sym{i}")) for i in range(100)]
+
+        output = repo_map.fit_rollup_to_budget(tags, 6)
+        lines = output.splitlines()
+        assert len(lines) == 6
+        assert lines[2].startswith("  pkg0/")
+        assert all(len(line.split(": ", 1)[1].split(", ")) <= ROLLUP_SYMBOLS_PER_DIRECTORY for line in lines[1:])
+        assert repo_map.fit_rollup_to_budget(tags, 1) is None
+    print("✓ Rollup budget test passed")
+
+
+if __name__ == "__main__":
+    test_rollup_directories()
+    test_to_rollup()
+    test_fit_rollup_to_budget()
+    print("\nAll rollup map tests passed!")
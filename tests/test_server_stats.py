@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Test process-wide server statistics and their Prometheus rendering.
+"""
+
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from metrics import ServerStats
+
+
+def test_track_requests():
+    """Latency, errors and aggregated cache counters are recorded per tool."""
+    stats = ServerStats()
+
+    @stats.track("repo_map")
+    async def fake_repo_map(project_root, fail=False):
+        if fail:
+            return {"error": "boom"}
+        return {"map": "", "report": {"metrics": {"counters": {"tags_cache_hits": 3, "tags_cache_misses": 1}}}}
+
+    async def run():
+        await fake_repo_map(os.getcwd())
+        await fake_repo_map(os.getcwd(), fail=True)
+
+    asyncio.run(run())
+    snapshot = stats.snapshot()
+
+    assert snapshot["requests"]["repo_map"]["count"] == 2
+    assert snapshot["requests"]["repo_map"]["errors"] == 1
+    assert sum(snapshot["requests"]["repo_map"]["latency_histogram"].values()) == 2
+    assert snapshot["in_flight"] == 0
+    assert snapshot["max_in_flight"] == 1
+    assert snapshot["caches"]["tags_cache"]["hit_rate"] == 0.75
+    assert snapshot["projects_seen"] == 1
+
+    # Batches count the metrics of every repository they mapped
+    @stats.track("batch_repo_map")
+    async def fake_batch_repo_map(repositories):
+        counters = {"tags_cache_hits": 1, "tags_cache_misses": 1}
+        return {"results": [{"map": "", "report": {"metrics": {"counters": counters}}} for _ in repositories]
+                + [{"error": "missing"}]}
+
+    asyncio.run(fake_batch_repo_map([{}, {}]))
+    caches = stats.snapshot()["caches"]["tags_cache"]
+    assert (caches["hits"], caches["misses"]) == (5, 3)
+    print("✓ Request tracking test passed")
+
+
+def test_prometheus_format():
+    """The exposition output has cumulative buckets and labelled gauges."""
+    stats = ServerStats()
+    stats.record("repo_map", 0.2)
+    stats.record("repo_map", 3.0, error=True)
+    text = stats.to_prometheus({"warm_projects": 1, "tags_cache_entries": {"/repo": 42}})
+
+    assert 'repomap_requests_total{tool="repo_map",status="ok"} 1' in text
+    assert 'repomap_requests_total{tool="repo_map",status="error"} 1' in text
+    assert 'repomap_request_duration_seconds_bucket{tool="repo_map",le="0.25"} 1' in text
+    assert 'repomap_request_duration_seconds_bucket{tool="repo_map",le="+Inf"} 2' in text
+    assert "repomap_warm_projects 1" in text
+    assert 'repomap_tags_cache_entries{project="/repo"} 42' in text
+
+    # Label values escape backslashes, quotes and newlines
+    text = stats.to_prometheus({"tags_cache_entries": {'C:\\repos\\"odd"\nname': 7}})
+    assert 'repomap_tags_cache_entries{project="C:\\\\repos\\\\\\"odd\\"\\nname"} 7' in text
+    assert not any(line.startswith("name") for line in text.splitlines())
+    print("✓ Prometheus format test passed")
+
+
+if __name__ == "__main__":
+    test_track_requests()
+    test_prometheus_format()
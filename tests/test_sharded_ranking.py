@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Test hierarchical per-package (sharded) ranking.
+"""
+
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from conftest import HANDLERS
+from repomap_class import RepoMap
+from sharding import ROOT_SHARD, ShardRankCache, ShardResolver, rank_sharded
+
+
+def test_shard_resolver():
+    """Files belong to the nearest package directory, else their top-level directory."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        os.makedirs(os.path.join(temp_dir, "packages", "api", "src"))
+        os.makedirs(os.path.join(temp_dir, "tools", "scripts"))
+        open(os.path.join(temp_dir, "packages", "api", "package.json"), "w").close()
+
+        resolver = ShardResolver(temp_dir)
+        assert resolver.shard_of("setup.py") == ROOT_SHARD
+        assert resolver.shard_of(os.path.join("packages", "api", "src", "index.js")) == os.path.join("packages", "api")
+        assert resolver.shard_of(os.path.join("packages", "api", "main.js")) == os.path.join("packages", "api")
+        assert resolver.shard_of(os.path.join("packages", "readme.js")) == "packages"
+        assert resolver.shard_of(os.path.join("tools", "scripts", "run.py")) == "tools"
+    print("✓ Shard resolver test passed")
+
+
+def make_graph():
+    """Two packages: a/ uses b/core.py across packages, b/ uses its own helpers."""
+    rel_fnames = ["a/app.py", "a/util.py", "b/core.py", "b/helper.py", "b/extra.py"]
+    defines = {"Core": {"b/core.py"}, "help_me": {"b/helper.py"}, "util": {"a/util.py"}, "extra": {"b/extra.py"}}
+    references = {"Core": {"a/app.py"}, "util": {"a/app.py"}, "help_me": {"b/core.py", "b/extra.py"}}
+    return rel_fnames, defines, references
+
+
+def test_rank_sharded():
+    """Ranks combine shard and in-shard ranks; unchanged shards come from the cache."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        repo_map = RepoMap(root=temp_dir, output_handler_funcs=dict(HANDLERS))
+        resolver = ShardResolver(temp_dir)
+        cache = ShardRankCache()
+        rel_fnames, defines, references = make_graph()
+
+        ranks, counters = rank_sharded(
+            rel_fnames, defines, references, {"a/app.py": 100.0},
+            shard_of=resolver.shard_of, rank_graph=repo_map.rank_files, cache=cache,
+        )
+        assert counters == {"shards": 2, "shard_rank_cache_hits": 0, "shard_rank_cache_misses": 2}
+        assert abs(sum(ranks.values()) - 1.0) < 1e-6
+        # b/core.py is what the other package depends on
+        assert ranks["b/core.py"] > ranks["b/extra.py"]
+        assert ranks["b/helper.py"] > ranks["b/extra.py"]
+
+        # A change inside b/ only re-ranks b/
+        references["extra"] = {"b/helper.py"}
+        _, counters = rank_sharded(
+            rel_fnames, defines, references, {"a/app.py": 100.0},
+            shard_of=resolver.shard_of, rank_graph=repo_map.rank_files, cache=cache,
+        )
+        assert counters == {"shards": 2, "shard_rank_cache_hits": 1, "shard_rank_cache_misses": 1}
+    print("✓ Sharded ranking test passed")
+
+
+def test_sharded_repo_map():
+    """RepoMap(sharded=True) ranks through shards and reports shard counters."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        rel_fnames, defines, references = make_graph()
+        fnames = []
+        for rel_fname in rel_fnames:
+            path = os.path.join(temp_dir, rel_fname)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w") as f:
+                f.write(f"def {os.path.splitext(os.path.basename(rel_fname))[0]}_fn():\n    pass\n")
+            fnames.append(path)
+
+        repo_map = RepoMap(root=temp_dir, output_handler_funcs=dict(HANDLERS), sharded=True)
+        ranked_tags, report = repo_map.get_ranked_tags(fnames[:1], fnames[1:])
+        assert report.total_files_considered == len(fnames)
+        assert repo_map.metrics.counters["shards"] == 2
+    print("✓ Sharded repo map test passed")
+
+
+if __name__ == "__main__":
+    test_shard_resolver()
+    test_rank_sharded()
+    test_sharded_repo_map()
+    print("\nAll sharded ranking tests passed!")
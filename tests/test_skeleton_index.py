@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Test skeleton indexing: a regex pass for the graph, Tree-sitter only near the budget.
+"""
+
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from conftest import HANDLERS, python_parser_available
+import repomap_class
+from repomap_class import RepoMap
+
+
+def write_repo(temp_dir, num_helpers=30):
+    """A chat file using core.py, which in turn uses a long tail of helper modules."""
+    files = {
+        "main.py": "from core import Engine\n\ndef run():\n    engine = Engine()\n    engine.start()\n",
+        "core.py": "class Engine:\n    def __init__(self):\n        pass\n\n    def start(self):\n"
+                   + "".join(f"        helper_{i}()\n" for i in range(num_helpers)),
+    }
+    for i in range(num_helpers):
+        files[f"helpers/h{i}.py"] = f"def helper_{i}():\n    return {i}\n"
+    for rel_fname, content in files.items():
+        path = os.path.join(temp_dir, rel_fname)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(content)
+    return [os.path.join(temp_dir, rel_fname) for rel_fname in files]
+
+
+def test_get_skeleton():
+    """Skeletons hold regex definitions and every identifier, without a Tree-sitter parse."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        write_repo(temp_dir, num_helpers=1)
+        repo_map = RepoMap(root=temp_dir, output_handler_funcs=dict(HANDLERS), skeleton_index=True)
+        fname = os.path.join(temp_dir, "core.py")
+        definitions, names = repo_map.get_skeleton(fname, "core.py")
+        assert [(tag.name, tag.line) for tag in definitions] == [("Engine", 1), ("__init__", 2), ("start", 5)]
+        assert {"Engine", "helper_0", "self"} <= names
+        assert repo_map.metrics.counters["full_parses"] == 0
+
+        # Unchanged files are not scanned twice, also by later RepoMap instances
+        repo_map.get_skeleton(fname, "core.py")
+        assert repo_map.metrics.counters["skeleton_scans"] == 1
+        fresh = RepoMap(root=temp_dir, output_handler_funcs=dict(HANDLERS), skeleton_index=True)
+        assert fresh.get_skeleton(fname, "core.py") == (definitions, names)
+        assert fresh.metrics.counters["skeleton_scans"] == 0
+        # A skeleton is not mistaken for the file's tags
+        fresh.get_tags(fname, "core.py")
+        assert fresh.metrics.counters["tags_cache_misses"] == 1
+
+        # A changed file is scanned again
+        os.utime(fname, (1, 1))
+        fresh.get_skeleton(fname, "core.py")
+        assert fresh.metrics.counters["skeleton_scans"] == 1
+
+        # Scanned skeletons reach the tags cache in one batch
+        assert "skeleton" not in fresh.TAGS_CACHE.get(fname, {})
+        fresh.save_skeletons()
+        assert fresh.TAGS_CACHE.get(fname)["skeleton"] == (definitions, names)
+        repomap_class._SKELETON_CACHE.clear()
+        restarted = RepoMap(root=temp_dir, output_handler_funcs=dict(HANDLERS), skeleton_index=True)
+        assert restarted.get_skeleton(fname, "core.py") == (definitions, names)
+        assert restarted.metrics.counters["skeleton_scans"] == 0
+    print("✓ Skeleton extraction test passed")
+
+
+def test_skeleton_ranking():
+    """The graph comes from skeletons and only the best ranked files are fully parsed."""
+    original_factor = repomap_class.SKELETON_FULL_PARSE_FACTOR
+    repomap_class.SKELETON_FULL_PARSE_FACTOR = 1
+    try:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            fnames = write_repo(temp_dir)
+            repo_map = RepoMap(root=temp_dir, output_handler_funcs=dict(HANDLERS), skeleton_index=True)
+            ranked_tags, report = repo_map.get_ranked_tags(fnames[:1], fnames[1:], max_map_tokens=40)
+
+            counters = repo_map.metrics.counters
+            assert counters["skeleton_scans"] == len(fnames)
+            assert 0 < counters["files_parsed"] < len(fnames)
+            assert counters["skeleton_only_files"] == len(fnames) - counters["files_parsed"]
+            assert report.total_files_considered == len(fnames)
+            assert report.reference_matches > 0
+
+            # core.py is referenced by the chat file, so it outranks every helper
+            ranks = {}
+            for rank, tag in ranked_tags:
+                ranks[tag.rel_fname] = max(rank, ranks.get(tag.rel_fname, 0.0))
+            helper_ranks = [rank for rel_fname, rank in ranks.items() if rel_fname.startswith("helpers")]
+            assert helper_ranks, "skeleton definitions of unparsed files are still ranked"
+            if python_parser_available():
+                assert ranks["core.py"] > max(helper_ranks)
+    finally:
+        repomap_class.SKELETON_FULL_PARSE_FACTOR = original_factor
+    print("✓ Skeleton ranking test passed")
+
+
+if __name__ == "__main__":
+    test_get_skeleton()
+    test_skeleton_ranking()
+    print("\nAll skeleton index tests passed!")
@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+"""
+Test the binary snapshot of tags, graph and ranks.
+"""
+
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+import repomap_class
+import repomap_server
+from conftest import HANDLERS
+from repomap_class import RepoMap
+from ranked_tags import RankedTags
+from repomap_index import build_index
+from snapshot import (SNAPSHOT_FNAME, SNAPSHOTS, SnapshotError, SnapshotRegistry,
+                      build_snapshot, load_snapshot, write_snapshot)
+from utils import Tag
+
+
+# rel_fname -> [(line, name, kind)]
+TAGS = {
+    "app.py": [(1, "main", "def"), (2, "Store", "ref"), (3, "log", "ref")],
+    "store.py": [(1, "Store", "def"), (4, "save", "def"), (5, "log", "ref"), (6, "Store", "ref")],
+    "util/log.py": [(1, "log", "def")],
+    "naïve.py": [(2, "unused", "def")],
+}
+
+
+class FixedTagsRepoMap(RepoMap):
+    """RepoMap whose tags come from TAGS instead of a parser."""
+
+    def get_tags(self, fname, rel_fname):
+        return [Tag(rel_fname=rel_fname, fname=fname, line=line, name=name, kind=kind)
+                for line, name, kind in TAGS.get(rel_fname, [])]
+
+
+def write_repo(temp_dir):
+    fnames = []
+    for rel_fname in TAGS:
+        path = os.path.join(temp_dir, rel_fname)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write("pass\n")
+        fnames.append(path)
+    return fnames
+
+
+def test_snapshot_round_trip():
+    """Written snapshots load back identically, mapped or read."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        fnames = write_repo(temp_dir)
+        repo_map = FixedTagsRepoMap(root=temp_dir, output_handler_funcs=dict(HANDLERS))
+        snapshot = build_snapshot(repo_map, fnames)
+        path = os.path.join(temp_dir, "repo.snap")
+        write_snapshot(snapshot, path)
+
+        for use_mmap in (True, False):
+            loaded = load_snapshot(path, use_mmap=use_mmap)
+            assert loaded.root == snapshot.root
+            assert sorted(loaded.arrays) == sorted(snapshot.arrays)
+            for name, array in snapshot.arrays.items():
+                assert loaded.arrays[name].dtype == array.dtype
+                assert np.array_equal(loaded.arrays[name], array), name
+            assert loaded.file_names() == sorted(TAGS)
+            loaded.close()
+
+        loaded = load_snapshot(path)
+        assert not loaded.arrays["ranks"].flags.writeable
+        loaded.close()
+    print("✓ Snapshot round trip test passed")
+
+
+def test_snapshot_contents():
+    """File and symbol tables, occurrences, CSR graph and ranks match the tags."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        fnames = write_repo(temp_dir)
+        repo_map = FixedTagsRepoMap(root=temp_dir, output_handler_funcs=dict(HANDLERS))
+        snapshot = build_snapshot(repo_map, fnames)
+
+        assert snapshot.num_files == 4
+        assert snapshot.num_symbols == len({name for tags in TAGS.values() for _, name, _ in tags})
+        for rel_fname, tags in TAGS.items():
+            index = snapshot.file_index(rel_fname)
+            assert snapshot.file_name(index) == rel_fname
+            assert [(t.line, t.name, t.kind) for t in snapshot.file_tags(index)] == tags
+            assert snapshot.file_tags(index)[0].fname == os.path.join(str(repo_map.root), rel_fname)
+        assert snapshot.file_index("missing.py") is None
+
+        # app -> store (Store), app -> log (log), store -> log (log)
+        indptr, indices = snapshot.arrays["graph_indptr"], snapshot.arrays["graph_indices"]
+        edges = {
+            (snapshot.file_name(src), snapshot.file_name(int(dst)))
+            for src in range(snapshot.num_files) for dst in indices[indptr[src]:indptr[src + 1]]
+        }
+        assert edges == {("app.py", "store.py"), ("app.py", "util/log.py"), ("store.py", "util/log.py")}
+
+        G = repo_map.build_reference_graph(
+            sorted(TAGS),
+            {"main": {"app.py"}, "Store": {"store.py"}, "save": {"store.py"}, "log": {"util/log.py"}, "unused": {"naïve.py"}},
+            {"Store": {"app.py", "store.py"}, "log": {"app.py", "store.py"}},
+        )
+        expected = repo_map.rank_files(G, None)
+        for rel_fname, rank in snapshot.ranks_by_file().items():
+            assert abs(rank - expected[rel_fname]) < 1e-9
+    print("✓ Snapshot contents test passed")
+
+
+def test_invalid_snapshots():
+    """Other files, truncated files and unknown versions are rejected."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        fnames = write_repo(temp_dir)
+        path = os.path.join(temp_dir, "repo.snap")
+        write_snapshot(build_snapshot(FixedTagsRepoMap(root=temp_dir, output_handler_funcs=dict(HANDLERS)), fnames), path)
+        with open(path, "rb") as f:
+            data = f.read()
+
+        # Header edits keep its length, so the arrays stay where they were
+        assert b'"dtype": "|u1"' in data and b'"offset": 0' in data
+        for name, content in (("empty", b""), ("text", b"not a snapshot at all"),
+                              ("truncated", data[:len(data) - 8]),
+                              ("version", data.replace(b'"version": 1', b'"version": 9')),
+                              ("no_layout", data.replace(b'"arrays"', b'"arrayz"')),
+                              ("dtype", data.replace(b'"dtype": "|u1"', b'"dtype": "|X1"')),
+                              ("offset", data.replace(b'"offset": 0', b'"offset":-1')),
+                              ("missing_array", data.replace(b'"ranks"', b'"ranky"'))):
+            bad = os.path.join(temp_dir, name)
+            with open(bad, "wb") as f:
+                f.write(content)
+            try:
+                load_snapshot(bad)
+            except SnapshotError:
+                pass
+            else:
+                raise AssertionError(f"{name} snapshot was accepted")
+
+        # Arrays that disagree in length
+        snapshot = build_snapshot(FixedTagsRepoMap(root=temp_dir, output_handler_funcs=dict(HANDLERS)), fnames)
+        snapshot.arrays["ranks"] = snapshot.arrays["ranks"][:-1]
+        write_snapshot(snapshot, path)
+        try:
+            load_snapshot(path)
+        except SnapshotError as e:
+            assert "ranks" in str(e)
+        else:
+            raise AssertionError("snapshot with a short ranks array was accepted")
+
+        # Arrays whose values index outside the tables they point into
+        def corrupt_file(name, edit):
+            snapshot = build_snapshot(FixedTagsRepoMap(root=temp_dir, output_handler_funcs=dict(HANDLERS)), fnames)
+            array = snapshot.arrays[name].copy()
+            edit(array, snapshot)
+            snapshot.arrays[name] = array
+            write_snapshot(snapshot, path)
+            return path
+
+        for name, edit in (
+            ("occ_file", lambda a, s: a.__setitem__(0, s.num_files)),
+            ("occ_symbol", lambda a, s: a.__setitem__(-1, -1)),
+            ("occ_kind", lambda a, s: a.__setitem__(0, 7)),
+            ("graph_indices", lambda a, s: a.__setitem__(0, s.num_files)),
+            ("file_offsets", lambda a, s: a.__setitem__(1, a[2] + 1)),
+            ("symbol_offsets", lambda a, s: a.__setitem__(-1, a[-1] - 1)),
+            ("file_occ_offsets", lambda a, s: a.__setitem__(0, 1)),
+            ("graph_indptr", lambda a, s: a.__setitem__(-1, a[-1] + 1)),
+        ):
+            for use_mmap in (True, False):
+                try:
+                    load_snapshot(corrupt_file(name, edit), use_mmap=use_mmap)
+                except SnapshotError as e:
+                    assert name in str(e), (name, e)
+                else:
+                    raise AssertionError(f"snapshot with a corrupted {name} array was accepted")
+
+        # The registry ignores a malformed snapshot instead of failing requests
+        with open(os.path.join(temp_dir, SNAPSHOT_FNAME), "wb") as f:
+            f.write(data.replace(b'"dtype": "|u1"', b'"dtype": "|X1"'))
+        assert SnapshotRegistry().get(temp_dir) is None
+    print("✓ Invalid snapshot test passed")
+
+
+def test_build_index_writes_snapshot():
+    """build_index(snapshot_path=...) leaves a loadable snapshot of the indexed files."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        write_repo(temp_dir)
+        path = os.path.join(temp_dir, "index.snap")
+        build_index(temp_dir, workers=1, snapshot_path=path)
+        snapshot = load_snapshot(path)
+        assert snapshot.file_names() == sorted(TAGS)
+        assert len(snapshot.arrays["file_mtimes"]) == 4
+        snapshot.close()
+    print("✓ Index snapshot test passed")
+
+
+def ranking(repo_map, chat_fnames, other_fnames, **kwargs):
+    ranked_tags, report = repo_map.get_ranked_tags(chat_fnames, other_fnames, **kwargs)
+    return sorted((round(rank, 12), tag) for rank, tag in ranked_tags), report
+
+
+def test_ranked_tags_from_snapshot():
+    """Ranking from the snapshot matches ranking from the tags, also after files change."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        fnames = write_repo(temp_dir)
+        snapshot = build_snapshot(FixedTagsRepoMap(root=temp_dir, output_handler_funcs=dict(HANDLERS)), fnames)
+        chat, others = [fnames[0]], fnames[1:] + [os.path.join(temp_dir, "gone.py")]
+        kwargs = {"mentioned_fnames": {"util/log.py"}, "mentioned_idents": {"save"}}
+
+        original = TAGS["naïve.py"]
+        try:
+            for label in ("unchanged", "changed"):
+                plain = FixedTagsRepoMap(root=temp_dir, output_handler_funcs=dict(HANDLERS))
+                mapped = FixedTagsRepoMap(root=temp_dir, output_handler_funcs=dict(HANDLERS), snapshot=snapshot)
+                expected, expected_report = ranking(plain, chat, others, **kwargs)
+                actual, report = ranking(mapped, chat, others, **kwargs)
+                assert actual == expected, label
+                assert (report.definition_matches, report.reference_matches, report.total_files_considered) == (
+                    expected_report.definition_matches, expected_report.reference_matches, expected_report.total_files_considered)
+                assert list(report.excluded) == [others[-1]]
+
+                # Whole repository without chat files: the stored graph and ranks are used
+                assert ranking(mapped, [], fnames)[0] == ranking(plain, [], fnames)[0], label
+
+                # Change a file after the snapshot was built: it is ranked from its new tags
+                TAGS["naïve.py"] = [(2, "unused", "def"), (3, "Store", "ref"), (4, "brand_new", "def")]
+                os.utime(fnames[3], (1, 1))
+            assert mapped.metrics.counters["snapshot_files"] == 3
+        finally:
+            TAGS["naïve.py"] = original
+    print("✓ Ranked tags from snapshot test passed")
+
+
+def test_ranked_tags_from_snapshot_by_push():
+    """Personalized snapshot rankings of large graphs come from forward push."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        fnames = write_repo(temp_dir)
+        snapshot = build_snapshot(FixedTagsRepoMap(root=temp_dir, output_handler_funcs=dict(HANDLERS)), fnames)
+        plain = FixedTagsRepoMap(root=temp_dir, output_handler_funcs=dict(HANDLERS))
+        mapped = FixedTagsRepoMap(root=temp_dir, output_handler_funcs=dict(HANDLERS), snapshot=snapshot)
+        expected, _ = plain.get_ranked_tags([fnames[0]], fnames[1:])
+
+        original = repomap_class.PUSH_CSR_MIN_NODES, repomap_class.PUSH_CSR_EDGE_COST
+        # Push on any graph, and never give up on this tiny one
+        repomap_class.PUSH_CSR_MIN_NODES, repomap_class.PUSH_CSR_EDGE_COST = 1, 1e-6
+        try:
+            actual, _ = mapped.get_ranked_tags([fnames[0]], fnames[1:])
+        finally:
+            repomap_class.PUSH_CSR_MIN_NODES, repomap_class.PUSH_CSR_EDGE_COST = original
+        assert mapped.metrics.counters["push_pagerank"] == 1
+        assert [tag for _, tag in actual] == [tag for _, tag in expected]
+        assert all(abs(rank - expected_rank) < 1e-4 for (rank, _), (expected_rank, _) in zip(actual, expected))
+    print("✓ Ranked tags from snapshot by push test passed")
+
+
+def test_ranked_tags_materialized_lazily():
+    """Only the accessed prefix of a snapshot ranking becomes Tag objects."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        fnames = write_repo(temp_dir)
+        snapshot = build_snapshot(FixedTagsRepoMap(root=temp_dir, output_handler_funcs=dict(HANDLERS)), fnames)
+        mapped = FixedTagsRepoMap(root=temp_dir, output_handler_funcs=dict(HANDLERS), snapshot=snapshot)
+        ranked_tags, _ = mapped.get_ranked_tags([], fnames)
+        assert isinstance(ranked_tags, RankedTags) and len(ranked_tags) == 5
+        top = ranked_tags[:2]
+        assert len(ranked_tags._items) == 2
+        assert ranked_tags[1] == top[1] and ranked_tags[-1] == list(ranked_tags)[4]
+        assert [rank for rank, _ in ranked_tags] == sorted((rank for rank, _ in ranked_tags), reverse=True)
+    print("✓ Lazy ranked tags test passed")
+
+
+def test_symbol_search():
+    """Symbol matching ignores case and selects occurrences within the given files."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        fnames = write_repo(temp_dir)
+        snapshot = build_snapshot(FixedTagsRepoMap(root=temp_dir, output_handler_funcs=dict(HANDLERS)), fnames)
+        names = lambda mask: {snapshot.symbol_name(i) for i in range(snapshot.num_symbols) if mask[i]}
+        assert names(snapshot.matching_symbols(["STOR", "lo"])) == {"Store", "log"}
+        assert names(snapshot.matching_symbols(["nothing"])) == set()
+        assert names(snapshot.matching_symbols(["x", ""])) == set(snapshot.symbol_names())
+
+        app, store = snapshot.file_index("app.py"), snapshot.file_index("store.py")
+        tags = snapshot.matching_tags([app, store], snapshot.matching_symbols(["store"]))
+        assert [(t.rel_fname, t.line, t.kind) for t in tags[app]] == [("app.py", 2, "ref")]
+        assert [(t.line, t.kind) for t in tags[store]] == [(1, "def"), (6, "ref")]
+    print("✓ Symbol search test passed")
+
+
+def test_snapshot_registry():
+    """The registry maps a project's snapshot once and reopens it when it is replaced."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        root = os.path.realpath(temp_dir)
+        fnames = write_repo(root)
+        registry = SnapshotRegistry()
+        assert registry.get(root) is None
+
+        path = os.path.join(root, SNAPSHOT_FNAME)
+        write_snapshot(build_snapshot(FixedTagsRepoMap(root=root, output_handler_funcs=dict(HANDLERS)), fnames), path)
+        first = registry.get(root)
+        assert first is not None and registry.get(root) is first
+
+        write_snapshot(build_snapshot(FixedTagsRepoMap(root=root, output_handler_funcs=dict(HANDLERS)), fnames[:2]), path)
+        assert registry.get(root).num_files == 2
+
+        # Snapshots of another root are ignored
+        other = os.path.join(root, "util")
+        registry.register(other, path)
+        assert registry.get(other) is None
+    print("✓ Snapshot registry test passed")
+
+
+def test_server_search_from_snapshot():
+    """search_identifiers_batch gives the same results with and without the project's snapshot."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        root = os.path.realpath(temp_dir)
+        fnames = write_repo(root)
+        repo_map = FixedTagsRepoMap(root=root, output_handler_funcs=dict(HANDLERS))
+        # Fill the tags cache the server reads files that are not in the snapshot from
+        for fname in fnames:
+            rel_fname = repo_map.get_rel_fname(fname)
+            repo_map.TAGS_CACHE[fname] = {"mtime": repo_map.get_mtime(fname), "data": repo_map.get_tags(fname, rel_fname), "fragments": None}
+
+        queries = ["store", "LOG", "missing"]
+        before = repomap_server._search_identifiers_batch(root, queries, 10, 1, True, True)
+        write_snapshot(build_snapshot(repo_map, fnames), os.path.join(root, SNAPSHOT_FNAME))
+        after = repomap_server._search_identifiers_batch(root, queries, 10, 1, True, True)
+        SNAPSHOTS.clear()
+
+        assert after["results"] == before["results"]
+        assert [len(result["matches"]) for result in after["results"]] == [3, 3, 0]
+    print("✓ Server search from snapshot test passed")
+
+
+if __name__ == "__main__":
+    test_snapshot_round_trip()
+    test_snapshot_contents()
+    test_invalid_snapshots()
+    test_build_index_writes_snapshot()
+    test_ranked_tags_from_snapshot()
+    test_ranked_tags_from_snapshot_by_push()
+    test_ranked_tags_materialized_lazily()
+    test_symbol_search()
+    test_snapshot_registry()
+    test_server_search_from_snapshot()
+    print("\nAll snapshot tests passed!")
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Test the SQLite-backed relational tag store.
+"""
+
+import os
+import sys
+import tempfile
+
+# Add the repository root to Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from repomap_class import RepoMap
+from tag_store import TagStore
+from utils import Tag
+
+
+def _tags(rel_fname, defs, refs):
+    fname = f"/repo/{rel_fname}"
+    tags = [Tag(rel_fname, fname, i + 1, name, "def") for i, name in enumerate(defs)]
+    tags += [Tag(rel_fname, fname, 100 + i, name, "ref") for i, name in enumerate(refs)]
+    return fname, rel_fname, 1.0, tags
+
+
+def test_tag_store_aggregation():
+    """Edge weights count distinct shared identifiers per file pair"""
+    print("=== Testing Tag Store Aggregation ===")
+    with tempfile.TemporaryDirectory() as tmp:
+        store = TagStore(os.path.join(tmp, "tags.sqlite"))
+        entries = [
+            _tags("a.py", ["main"], ["helper", "helper", "Config"]),
+            _tags("b.py", ["helper", "Config"], ["main"]),
+            _tags("c.py", ["unused"], ["helper"]),
+        ]
+        assert store.update_files(iter(entries)) == 3
+        assert store.get_mtimes() == {"/repo/a.py": 1.0, "/repo/b.py": 1.0, "/repo/c.py": 1.0}
+
+        with store.selection(["/repo/a.py", "/repo/b.py", "/repo/c.py"]):
+            assert store.count_occurrences() == (4, 5)
+            edges = sorted(store.edge_weights())
+            assert edges == [("a.py", "b.py", 2), ("b.py", "a.py", 1), ("c.py", "b.py", 1)]
+            defs = list(store.iter_definitions({"b.py"}))
+            assert [tag.name for tag in defs] == ["helper", "Config"]
+
+        # Narrowing the selection drops edges to unselected files
+        with store.selection(["/repo/a.py", "/repo/c.py"]):
+            assert list(store.edge_weights()) == []
+
+        # Replacing a file's tags removes its old occurrences
+        store.update_files([_tags("b.py", ["helper"], [])])
+        assert [tag.name for tag in store.get_file_tags("/repo/b.py")] == ["helper"]
+        store.close()
+    print("✓ Tag store aggregation test passed")
+
+
+def test_tag_store_skipped_by_other_modes():
+    """Modes that pick the files to parse or rank them per package do not use the store"""
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in ("skeleton_index", "lazy_parse", "sharded"):
+            warnings = []
+            handlers = {'info': lambda msg: None, 'warning': warnings.append, 'error': lambda msg: None}
+            repo_map = RepoMap(root=tmp, output_handler_funcs=handlers, use_tag_store=True, **{mode: True})
+            assert repo_map.tag_store is None, mode
+            assert warnings and "Tag store is not used" in warnings[0], mode
+        repo_map = RepoMap(root=tmp, output_handler_funcs={'info': print, 'warning': print, 'error': print},
+                           use_tag_store=True)
+        store = repo_map.tag_store
+        assert store is not None
+        repo_map.drop_tag_store()
+        store.close()
+    print("✓ Tag store mode test passed")
+
+
+def test_tag_store_shared_per_project():
+    """RepoMaps of one project share its store's connection until a failing store is dropped"""
+    handlers = {'info': lambda msg: None, 'warning': lambda msg: None, 'error': lambda msg: None}
+    with tempfile.TemporaryDirectory() as tmp:
+        first = RepoMap(root=tmp, output_handler_funcs=handlers, use_tag_store=True)
+        second = RepoMap(root=tmp, output_handler_funcs=handlers, use_tag_store=True)
+        assert first.tag_store is not None and second.tag_store is first.tag_store
+        with tempfile.TemporaryDirectory() as other:
+            assert RepoMap(root=other, output_handler_funcs=handlers, use_tag_store=True).tag_store is not first.tag_store
+
+        store = first.tag_store
+        first.drop_tag_store()
+        assert first.tag_store is None and second.tag_store is store
+        reopened = RepoMap(root=tmp, output_handler_funcs=handlers, use_tag_store=True)
+        assert reopened.tag_store is not store
+        store.close()
+        reopened.drop_tag_store()
+    print("✓ Tag store sharing test passed")
+
+
+if __name__ == "__main__":
+    test_tag_store_aggregation()
+    test_tag_store_skipped_by_other_modes()
+    test_tag_store_shared_per_project()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Test background warm-up and its progress reported by indexing_status.
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import repomap_server
+
+NUM_FILES = 3
+
+
+def write_repo(temp_dir):
+    for i in range(NUM_FILES):
+        with open(os.path.join(temp_dir, f"mod{i}.py"), "w") as f:
+            f.write(f"def func_{i}():\n    return func_{(i + 1) % NUM_FILES}()\n")
+
+
+def poll_status(project_root, until, timeout=30.0):
+    """Poll indexing_status until until(entry) holds; returns the entry."""
+    deadline = time.time() + timeout
+    while True:
+        projects = asyncio.run(repomap_server.indexing_status(project_root))["projects"]
+        assert len(projects) == 1, projects
+        if until(projects[0]):
+            return projects[0]
+        assert time.time() < deadline, f"warm-up stuck: {projects[0]}"
+        time.sleep(0.02)
+
+
+def test_warmup_progress():
+    """indexing_status shows the warm-up indexing with progress, then ready."""
+    gate = threading.Event()
+    original = repomap_server.build_index
+
+    def gated_build_index(*args, progress_callback=None, **kwargs):
+        def on_progress(progress):
+            progress_callback(progress)
+            # Hold indexing after the first report until the test has seen it
+            gate.wait(30)
+        return original(*args, progress_callback=on_progress, **kwargs)
+
+    repomap_server.build_index = gated_build_index
+    try:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            write_repo(temp_dir)
+            status = repomap_server.start_background_warmup(temp_dir, workers=1)
+            assert repomap_server.start_background_warmup(temp_dir, workers=1) is status
+
+            indexing = poll_status(temp_dir, lambda entry: entry["progress"] is not None)
+            assert indexing["state"] == "indexing"
+            assert indexing["progress"]["total_files"] == NUM_FILES
+            assert not indexing["progress"]["finished"]
+            gate.set()
+
+            ready = poll_status(temp_dir, lambda entry: entry["state"] in ("ready", "failed"))
+            assert ready["state"] == "ready", ready
+            assert ready["error"] is None
+            assert ready["progress"]["done_files"] == NUM_FILES
+            assert ready["progress"]["finished"]
+    finally:
+        gate.set()
+        repomap_server.build_index = original
+    print("✓ Warm-up progress test passed")
+
+
+def test_warmup_missing_root():
+    """A warm-up of a missing project root fails and reports why."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        missing = os.path.join(temp_dir, "missing")
+        repomap_server.start_background_warmup(missing, workers=1)
+        failed = poll_status(missing, lambda entry: entry["state"] in ("ready", "failed"))
+        assert failed["state"] == "failed", failed
+        assert "not found" in failed["error"]
+        assert not os.path.exists(missing)
+    print("✓ Warm-up missing root test passed")
+
+
+if __name__ == "__main__":
+    test_warmup_progress()
+    test_warmup_missing_root()
+    print("\nAll warm-up status tests passed!")
@@ -0,0 +1,155 @@
+"""
+Incremental Tree-sitter parsing support for RepoMap.
+
+Keeps the last syntax tree and tags of recently parsed files, so that a
+changed file can be reparsed from its previous tree and only the region
+that changed has to be queried again.
+"""
+
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Number of files whose last tree is kept
+MAX_KEPT_TREES = 64
+
+
+@dataclass
+class ParsedFile:
+    lang: str
+    source: bytes       # Exact bytes the tree was parsed from
+    tree: Any           # tree_sitter.Tree
+    tags: List[Any]     # Tags produced by the Tree-sitter query (before any regex fallback)
+
+
+class TreeCache:
+    """LRU cache of the last parsed tree per file, shareable between RepoMap instances.
+
+    take() removes the entry, so a tree is never edited by two threads at
+    once; the caller put()s the new tree back once it is done.
+    """
+
+    def __init__(self, max_files: int = MAX_KEPT_TREES):
+        self.max_files = max_files
+        self._entries: "OrderedDict[str, ParsedFile]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, fname: str) -> Optional[ParsedFile]:
+        with self._lock:
+            return self._entries.pop(fname, None)
+
+    def put(self, fname: str, parsed: ParsedFile):
+        with self._lock:
+            self._entries[fname] = parsed
+            self._entries.move_to_end(fname)
+            while len(self._entries) > self.max_files:
+                self._entries.popitem(last=False)
+
+    def discard(self, fname: str):
+        with self._lock:
+            self._entries.pop(fname, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def source_bytes(self) -> int:
+        with self._lock:
+            return sum(len(parsed.source) for parsed in self._entries.values())
+
+
+@dataclass
+class SourceEdit:
+    start_byte: int
+    old_end_byte: int
+    new_end_byte: int
+    start_point: Tuple[int, int]
+    old_end_point: Tuple[int, int]
+    new_end_point: Tuple[int, int]
+
+    def as_kwargs(self) -> Dict[str, Any]:
+        """Arguments for tree_sitter.Tree.edit."""
+        return dict(self.__dict__)
+
+
+def byte_to_point(source: bytes, byte: int) -> Tuple[int, int]:
+    """(row, column) of a byte offset, as Tree-sitter counts them."""
+    row = source.count(b"\n", 0, byte)
+    return row, byte - (source.rfind(b"\n", 0, byte) + 1)
+
+
+def _common_prefix_length(a: memoryview, b: memoryview, limit: int) -> int:
+    # Binary search over slice comparisons keeps the scanning in C
+    lo, hi = 0, limit
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[:mid] == b[:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def _common_suffix_length(a: memoryview, b: memoryview, limit: int) -> int:
+    lo, hi = 0, limit
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[len(a) - mid:] == b[len(b) - mid:]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def compute_edit(old: bytes, new: bytes) -> Optional[SourceEdit]:
+    """Describe the change from old to new as a single replaced byte range, or None if equal."""
+    if old == new:
+        return None
+    old_view, new_view = memoryview(old), memoryview(new)
+    limit = min(len(old), len(new))
+    prefix = _common_prefix_length(old_view, new_view, limit)
+    suffix = _common_suffix_length(old_view, new_view, limit - prefix)
+    start_byte = prefix
+    old_end_byte = len(old) - suffix
+    new_end_byte = len(new) - suffix
+    return SourceEdit(
+        start_byte=start_byte,
+        old_end_byte=old_end_byte,
+        new_end_byte=new_end_byte,
+        start_point=byte_to_point(new, start_byte),
+        old_end_point=byte_to_point(old, old_end_byte),
+        new_end_point=byte_to_point(new, new_end_byte),
+    )
+
+
+def requery_span(tree: Any, source: bytes, edit: SourceEdit, changed_ranges: Iterable[Any]) -> Tuple[int, int]:
+    """Byte range of the new tree whose tags must be recomputed.
+
+    Covers the edited text and every syntactically changed range, widened to
+    whole lines and whole top-level nodes so that no query match is cut in
+    half and tags can be replaced line by line.
+    """
+    start, end = edit.start_byte, edit.new_end_byte
+    for changed in changed_ranges:
+        start = min(start, changed.start_byte)
+        end = max(end, changed.end_byte)
+    children = tree.root_node.children
+    while True:
+        widened_start = source.rfind(b"\n", 0, start) + 1
+        widened_end = source.find(b"\n", end)
+        if widened_end == -1:
+            widened_end = len(source)
+        for child in children:
+            if child.end_byte < widened_start:
+                continue
+            if child.start_byte > widened_end:
+                break
+            widened_start = min(widened_start, child.start_byte)
+            widened_end = max(widened_end, child.end_byte)
+        if (widened_start, widened_end) == (start, end):
+            return start, end
+        start, end = widened_start, widened_end
@@ -2,34 +2,62 @@
 Utility functions for RepoMap.
 """
 
+import logging
 import os
-import sys
+import threading
 from pathlib import Path
-from typing import Optional, List
+from typing import Any, Dict, Optional, List
 from collections import namedtuple
 
-try:
-    import tiktoken
-except ImportError:
-    print("Error: tiktoken is required. Install with: pip install tiktoken")
-    sys.exit(1)
-
 # Tag namedtuple for storing parsed code definitions and references
 Tag = namedtuple("Tag", "rel_fname fname line name kind".split())
 
+# tiktoken encodings by model name, loaded on first use (importing tiktoken and
+# reading its BPE ranks is slow, so it is kept off the startup path)
+_encodings: Dict[str, Any] = {}
+_encodings_lock = threading.Lock()
+
+
+def get_encoding(model_name: str = "gpt-4"):
+    """Load the tiktoken encoding for a model once and reuse it."""
+    encoding = _encodings.get(model_name)
+    if encoding is not None:
+        return encoding
+    with _encodings_lock:
+        encoding = _encodings.get(model_name)
+        if encoding is None:
+            try:
+                import tiktoken
+            except ImportError:
+                raise ImportError("tiktoken is required. Install with: pip install tiktoken") from None
+            try:
+                encoding = tiktoken.encoding_for_model(model_name)
+            except KeyError:
+                # Fallback for unknown models
+                encoding = tiktoken.get_encoding("cl100k_base")
+            _encodings[model_name] = encoding
+    return encoding
+
+
+def preload_tokenizer(model_name: str = "gpt-4") -> threading.Thread:
+    """Load the tokenizer in a background thread so the first request does not pay for it."""
+    def load():
+        try:
+            get_encoding(model_name)
+        except Exception as e:
+            logging.getLogger().warning(f"Could not preload tokenizer for {model_name}: {e}")
+
+    thread = threading.Thread(target=load, name="tokenizer-preload", daemon=True)
+    thread.start()
+    return thread
+
 
 def count_tokens(text: str, model_name: str = "gpt-4") -> int:
     """Count tokens in text using tiktoken."""
     if not text:
         return 0
     
-    try:
-        encoding = tiktoken.encoding_for_model(model_name)
-    except KeyError:
-        # Fallback for unknown models
-        encoding = tiktoken.get_encoding("cl100k_base")
-    
-    return len(encoding.encode(text))
+    return len(get_encoding(model_name).encode(text))
 
 
 def read_text(filename: str, encoding: str = "utf-8", silent: bool = False) -> Optional[str]:
@@ -56,3 +84,43 @@ def read_text(filename: str, encoding: str = "utf-8", silent: bool = False) -> O
         if not silent:
             print(f"An unexpected error occurred while reading {filename}: {e}")
         return None
+
+
+def read_bytes(filename: str, silent: bool = False) -> Optional[bytes]:
+    """Read the raw bytes of a file with error handling."""
+    try:
+        return Path(filename).read_bytes()
+    except FileNotFoundError:
+        if not silent:
+            print(f"Error: {filename} not found.")
+        return None
+    except IsADirectoryError:
+        if not silent:
+            print(f"Error: {filename} is a directory.")
+        return None
+    except OSError as e:
+        if not silent:
+            print(f"Error reading {filename}: {e}")
+        return None
+
+
+def iter_bounded_lines(filename: str, max_line_length: int, max_chars: int, encoding: str = "utf-8"):
+    """Yield the lines of a file without ever holding more than one bounded line in memory.
+
+    Lines longer than max_line_length are replaced by an empty line, so line
+    numbers stay correct; reading stops after max_chars characters.
+    """
+    chars_read = 0
+    with open(filename, "r", encoding=encoding, errors="ignore") as f:
+        while chars_read < max_chars:
+            line = f.readline(max_line_length + 1)
+            if not line:
+                return
+            chars_read += len(line)
+            if len(line) > max_line_length and not line.endswith("\n"):
+                # Skip the rest of the overlong line
+                while line and not line.endswith("\n") and chars_read < max_chars:
+                    line = f.readline(max_line_length + 1)
+                    chars_read += len(line)
+                line = "\n"
+            yield line